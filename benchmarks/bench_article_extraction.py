@@ -0,0 +1,94 @@
+"""
+Benchmark of the BBC article extraction: BeautifulSoup on the whole page
+(previous implementation) against the streaming extract_article_paragraphs.
+Reports time, peak traced memory and how much of the page was read.
+
+Pass saved BBC pages (i.e. `curl -o page.html https://www.bbc.com/news/articles/...`)
+or let the script generate a synthetic page with the usual BBC layout.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_article_extraction [page.html ...] [--number 20]
+"""
+import time
+import argparse
+import tracemalloc
+from pathlib import Path
+from typing import Iterator
+
+from utils.pipelines.article import extract_article_paragraphs
+
+CHUNK_SIZE = 16 * 1024
+
+
+def synthetic_page() -> bytes:
+    navigation = "".join(f'<li><a href="/news/{i}">Section {i}</a></li>' for i in range(300))
+    paragraphs = "".join(
+        f"<p>Paragraph {i} of the article, with <b>some</b> inline <a href='#'>markup</a> and a few sentences of text.</p>"
+        for i in range(40)
+    )
+    footer = "".join(f'<div class="footer-item"><a href="/{i}">Footer link {i}</a></div>' for i in range(500))
+    state = '{"data": "' + "x" * 400_000 + '"}'
+    return (
+        "<!DOCTYPE html><html><head><title>BBC</title>"
+        f"<script>window.__INITIAL_DATA__ = {state}</script></head><body>"
+        f"<header><nav><ul>{navigation}</ul></nav></header>"
+        f"<main><article><h1>Headline</h1>{paragraphs}</article>"
+        f"<aside>{navigation}</aside></main><footer>{footer}</footer>"
+        f"<script>{state}</script></body></html>"
+    ).encode("utf-8")
+
+
+def chunks(page: bytes, read: list) -> Iterator[bytes]:
+    # Like a streamed HTTP response, counting how many bytes were consumed
+    for start in range(0, len(page), CHUNK_SIZE):
+        chunk = page[start:start + CHUNK_SIZE]
+        read[0] += len(chunk)
+        yield chunk
+
+
+def extract_beautifulsoup(page: bytes, read: list) -> int:
+    from bs4 import BeautifulSoup
+
+    content = b"".join(chunks(page, read))
+    article = BeautifulSoup(content, "html.parser").find("article")
+    return len([paragraph.text for paragraph in article.find_all("p")])
+
+
+def extract_streaming(page: bytes, read: list) -> int:
+    return len(extract_article_paragraphs(chunks(page, read)))
+
+
+def measure(function, page: bytes, number: int):
+    read = [0]
+    tracemalloc.start()
+    count = function(page, read)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    for _ in range(number):
+        function(page, [0])
+    elapsed = (time.perf_counter() - start) / number
+    return count, elapsed, peak, read[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("pages", nargs="*", type=Path, help="saved BBC article pages")
+    parser.add_argument("--number", type=int, default=20, help="extractions per measure")
+    args = parser.parse_args()
+
+    pages = [(path.name, path.read_bytes()) for path in args.pages] or [("synthetic", synthetic_page())]
+    print(f"{'page':>20} {'extractor':>14} {'paragraphs':>11} {'ms':>8} {'peak KB':>9} {'read KB':>9}")
+    for name, page in pages:
+        for extractor, function in (("beautifulsoup", extract_beautifulsoup), ("streaming", extract_streaming)):
+            try:
+                count, elapsed, peak, read = measure(function, page, args.number)
+            except ImportError:
+                print(f"{name[:20]:>20} {extractor:>14} {'(bs4 not installed)':>11}")
+                continue
+            print(f"{name[:20]:>20} {extractor:>14} {count:>11} {elapsed * 1e3:>8.2f} {peak / 1024:>9.0f} {read / 1024:>9.0f}")
+
+
+if __name__ == "__main__":
+    main()
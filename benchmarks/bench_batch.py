@@ -0,0 +1,72 @@
+"""
+Benchmark of the batch processing of the several URLs of a message
+("summarize these five videos", "summarize these BBC articles").
+
+The message holds --urls YouTube videos (transcripts seeded in the transcript
+cache) or BBC articles, processed by the pipeline against the local fake
+services (benchmarks/fake_services.py), whose Ollama runs --slots requests at
+the same time. Compared: one item at a time (BATCH_CONCURRENCY and
+BATCH_LLM_CONCURRENCY at 1, what processing the URLs one after the other costs)
+and the batch with the given concurrency. Reported: the total latency, the time
+to the first result when streaming and the outputs received.
+
+Usage (from the repository root, inside the pipelines server environment):
+    python -m benchmarks.bench_batch [--targets youtube bbc] [--urls 5] [--llm-concurrency 2] [--stream]
+"""
+import io
+import os
+import time
+import argparse
+import tempfile
+import contextlib
+
+TARGETS = ["youtube", "bbc"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--targets", nargs="+", choices=TARGETS, default=TARGETS)
+    parser.add_argument("--urls", type=int, default=5, help="URLs in the message")
+    parser.add_argument("--concurrency", type=int, default=4, help="BATCH_CONCURRENCY")
+    parser.add_argument("--llm-concurrency", type=int, default=2, help="BATCH_LLM_CONCURRENCY")
+    parser.add_argument("--slots", type=int, default=4, help="requests the fake Ollama runs at the same time")
+    parser.add_argument("--stream", action="store_true", help="streamed answers")
+    args = parser.parse_args()
+
+    os.environ["PIPELINES_CACHE_DIR"] = tempfile.mkdtemp(prefix="bench-batch-")
+    os.environ["LLM_CACHE_MAX_BYTES"] = "0"
+    from benchmarks.fake_services import ARTICLE_IDS, VIDEO_IDS, FakeServices, fixture_transcript, install
+    from benchmarks.load_test import consume
+    from utils.pipelines.store import get_store
+    from pipelines.bbc_news_daily_feeds import Pipeline as BBCPipeline
+    from pipelines.download_youtube_transcripts import Pipeline as YouTubePipeline
+
+    store = get_store("youtube_transcripts", ttl=0, max_bytes=1 << 30)
+    for video_id in VIDEO_IDS:
+        store.set_text(f"{video_id}:en", fixture_transcript(video_id, 5))
+    messages = {
+        "youtube": "summarize these videos: " + ", ".join(f"https://www.youtube.com/watch?v={VIDEO_IDS[index % len(VIDEO_IDS)]}" for index in range(args.urls)),
+        "bbc": "summarize these articles: " + ", ".join(f"https://www.bbc.com/news/articles/{ARTICLE_IDS[index % len(ARTICLE_IDS)]}" for index in range(args.urls)),
+    }
+
+    print(f"{'target':>8} {'mode':>12} {'total s':>8} {'first s':>8} {'outputs':>8} {'chats':>6}")
+    with FakeServices(slots=args.slots) as services:
+        install(services)
+        for target in args.targets:
+            for mode, concurrency, llm_concurrency in (("one by one", 1, 1), ("batch", args.concurrency, args.llm_concurrency)):
+                with contextlib.redirect_stdout(io.StringIO()):
+                    pipeline = YouTubePipeline() if target == "youtube" else BBCPipeline()
+                    pipeline.valves.OLLAMA_HOST = "http://ollama.local:11434"
+                    pipeline.valves.OLLAMA_MODEL_NAME = "fake"
+                    pipeline.valves.BATCH_CONCURRENCY = concurrency
+                    pipeline.valves.BATCH_LLM_CONCURRENCY = llm_concurrency
+                    pipeline.set_llm()
+                    chats = services.stats["chat"]
+                    started = time.perf_counter()
+                    output, first = consume(pipeline.pipe(messages[target], target, [], {"stream": args.stream, "messages": []}), started)
+                    total = time.perf_counter() - started
+                print(f"{target:>8} {mode:>12} {total:>8.2f} {first:>8.2f} {output.count('## '):>8} {services.stats['chat'] - chats:>6}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""
+Benchmark of the map-reduce summarization of long YouTube transcripts
+(Fabric.apply_pattern_chunked) against the single call of Fabric.apply_pattern.
+
+The Ollama server is simulated in process: prefill cost grows with the prompt
+(with a quadratic attention term), decode cost with the generated tokens,
+only --slots requests run at the same time (OLLAMA_NUM_PARALLEL), and prompts
+longer than num_ctx are truncated keeping the end, as Ollama does.
+
+Quality is measured as the coverage of facts planted every minute of the
+synthetic transcript: the fake model "summarizes" by listing the facts it can
+see, so the coverage drops when the prompt gets truncated. Against a real
+model (--ollama-host) the coverage counts the facts quoted in the summary.
+
+Usage (from the repository root, inside the pipelines server environment):
+    python -m benchmarks.bench_chunked_summarization [--minutes 60 180 300] [--chunk-tokens 20000] [--parallelism 1 2 4]
+"""
+import io
+import os
+import re
+import json
+import time
+import random
+import argparse
+import contextlib
+import tempfile
+import threading
+
+import httpx
+
+FACT = re.compile(r"FACT-\d{4}")
+WORDS = (
+    "the of and to in that is was for it with as on be at by this are but from or have an they which one you "
+    "were all there about people because really something important actually thinking government question "
+    "different everything probably understand research company problem experience technology"
+).split()
+
+
+def synthetic_transcript(minutes: int, words_per_minute: int = 150, seed: int = 0) -> str:
+    # One caption of ~8 words per line and a fact to remember every minute
+    rng = random.Random(seed)
+    lines = []
+    for minute in range(minutes):
+        words = [rng.choice(WORDS) for _ in range(words_per_minute)]
+        words[rng.randrange(words_per_minute)] = f"FACT-{minute:04d}"
+        lines.extend(" ".join(words[i:i + 8]) for i in range(0, words_per_minute, 8))
+    return "\n".join(lines)
+
+
+class FakeOllama:
+    def __init__(self, prefill_tps: float, decode_tps: float, slots: int) -> None:
+        self.prefill_tps = prefill_tps
+        self.decode_tps = decode_tps
+        self.slots = threading.Semaphore(slots)
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.truncated_tokens = 0
+        self.lock = threading.Lock()
+
+
+    def handle(self, request: httpx.Request) -> httpx.Response:
+        if request.url.host == "raw.githubusercontent.com":
+            if request.url.path.endswith("/system.md"):
+                return httpx.Response(200, text="You summarize transcripts, list the key facts.")
+            return httpx.Response(404)
+
+        payload = json.loads(request.content)
+        prompt = "\n".join(message["content"] for message in payload["messages"])
+        num_ctx = payload.get("options", {}).get("num_ctx", 2048)
+        tokens = len(prompt) // 4
+        visible = prompt[-num_ctx * 4:]
+        facts = sorted(set(FACT.findall(visible)))
+        content = "\n".join(f"- {fact}" for fact in facts) or "Nothing relevant."
+
+        with self.slots:
+            prefill = min(tokens, num_ctx)
+            time.sleep(prefill / self.prefill_tps * (1 + prefill / 32768) + len(content) / 4 / self.decode_tps)
+        with self.lock:
+            self.calls += 1
+            self.prompt_tokens += tokens
+            self.truncated_tokens += max(tokens - num_ctx, 0)
+
+        return httpx.Response(200, json={
+            "model": payload.get("model"),
+            "created_at": "2024-01-01T00:00:00Z",
+            "message": {"role": "assistant", "content": content},
+            "done": True,
+            "prompt_eval_count": min(tokens, num_ctx),
+            "eval_count": len(content) // 4,
+        })
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--minutes", type=int, nargs="+", default=[60, 180, 300], help="transcript lengths")
+    parser.add_argument("--chunk-tokens", type=int, default=20000)
+    parser.add_argument("--overlap-tokens", type=int, default=200)
+    parser.add_argument("--parallelism", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--context-window", type=int, default=30000, help="num_ctx of the model")
+    parser.add_argument("--prefill-tps", type=float, default=20000, help="fake prefill speed, tokens/s")
+    parser.add_argument("--decode-tps", type=float, default=400, help="fake decode speed, tokens/s")
+    parser.add_argument("--slots", type=int, default=2, help="fake OLLAMA_NUM_PARALLEL")
+    parser.add_argument("--ollama-host", help="run against a real Ollama instead of the fake")
+    parser.add_argument("--model", default="llama3.1")
+    args = parser.parse_args()
+
+    os.environ.setdefault("PIPELINES_CACHE_DIR", tempfile.mkdtemp(prefix="bench-chunked-"))
+    from llama_index.llms.ollama import Ollama
+    from utils.pipelines.http_client import HttpClient, set_http_client
+    from utils.pipelines.text import estimate_tokens
+    from pipelines.download_youtube_transcripts import Fabric
+
+    fake = None
+    if args.ollama_host:
+        client, host = HttpClient(), args.ollama_host
+    else:
+        fake = FakeOllama(args.prefill_tps, args.decode_tps, args.slots)
+        client, host = HttpClient(transport=httpx.MockTransport(fake.handle)), "http://ollama.local"
+    set_http_client(client)
+    llm = Ollama(
+        model=args.model,
+        base_url=host,
+        request_timeout=3600.0,
+        context_window=args.context_window,
+        temperature=0.0,
+        **client.ollama_clients(host, 3600.0)
+    )
+
+    print(f"{'minutes':>7} {'tokens':>7} {'mode':>14} {'calls':>6} {'truncated':>10} {'seconds':>8} {'coverage':>9}")
+    for minutes in args.minutes:
+        transcript = synthetic_transcript(minutes)
+        facts = set(FACT.findall(transcript))
+        runs = [("single pass", None)] + [(f"chunked x{parallelism}", parallelism) for parallelism in args.parallelism]
+        for mode, parallelism in runs:
+            fabric = Fabric(llm)
+            fabric.set_user_message("summarize")
+            with contextlib.redirect_stdout(io.StringIO()):
+                fabric.find_pattern()
+            if fake:
+                fake.calls = fake.prompt_tokens = fake.truncated_tokens = 0
+
+            start = time.perf_counter()
+            if parallelism is None:
+                summary = fabric.apply_pattern(transcript.replace("\n", " "))
+            else:
+                summary = fabric.apply_pattern_chunked(transcript, args.chunk_tokens, args.overlap_tokens, parallelism)
+            elapsed = time.perf_counter() - start
+
+            coverage = len(facts & set(FACT.findall(str(summary)))) / len(facts)
+            calls = fake.calls if fake else "-"
+            truncated = fake.truncated_tokens if fake else "-"
+            print(f"{minutes:>7} {estimate_tokens(transcript):>7} {mode:>14} {calls:>6} {truncated:>10} {elapsed:>8.2f} {coverage:>9.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""
+Benchmark of the transcript compression applied before the Fabric pattern.
+
+The transcripts look like the YouTube auto-generated captions of a talk of
+--minutes minutes covering --topics topics: rolling captions repeating the end
+of the previous one, hesitations, [Music] annotations, stutters and a recap
+repeating sentences already said. Compared: no compression
+(COMPRESS_TRANSCRIPT off, the previous behaviour), the compression alone and
+the compression with a TRANSCRIPT_TARGET_TOKENS budget of each --budgets.
+
+Reported for each mode:
+    tokens       estimated tokens of the transcript sent to the pattern
+    compress ms  time of the compression
+    coverage     the share of the topics (keyword sets) still present in the
+                 transcript and of the distinct keywords kept, a proxy of what
+                 the summary can still cover
+    prompt/s     prompt tokens received and pipe latency of the YouTube pipeline
+                 against the local fake Ollama (benchmarks/fake_services.py),
+                 whose prefill time grows with the prompt
+Usage (from the repository root, inside the pipelines server environment):
+    python -m benchmarks.bench_compress [--minutes 30] [--topics 12] [--budgets 3000 1500]
+"""
+import io
+import os
+import time
+import random
+import argparse
+import tempfile
+import contextlib
+from typing import List, Set, Tuple
+
+FUNCTION_WORDS = "the of and to in that is was for it with as on be at by this are but from or have we you they".split()
+FILLERS = ["um", "uh", "erm", "[Music]", "hmm", "uh,"]
+
+
+def talk(minutes: int, topics: int, seed: int = 7) -> Tuple[List[str], List[Set[str]]]:
+    """
+    The sentences of a talk (150 words per minute), and the keywords of each of its topics
+    """
+    rng = random.Random(seed)
+    keywords = [{f"topic{topic}term{index}" for index in range(8)} for topic in range(topics)]
+    sentences, words = [], 0
+    per_topic = 150 * minutes // topics
+    for topic in range(topics):
+        said = 0
+        while said < per_topic:
+            length = rng.randint(10, 18)
+            sentence = [rng.choice(sorted(keywords[topic])) if rng.random() < 0.3 else rng.choice(FUNCTION_WORDS) for _ in range(length)]
+            sentences.append(" ".join(sentence))
+            said += length
+            words += length
+    # The recap says again a sentence of every topic
+    recap = [sentences[rng.randrange(topic * len(sentences) // topics, (topic + 1) * len(sentences) // topics)] for topic in range(topics)]
+    return sentences + recap, keywords
+
+
+def auto_captions(sentences: List[str], seed: int = 7) -> str:
+    """
+    Rolling captions without punctuation: each line repeats the last words of the previous one, with fillers and stutters
+    """
+    rng = random.Random(seed)
+    words = []
+    for sentence in sentences:
+        for word in sentence.split():
+            if rng.random() < 0.04:
+                words.append(rng.choice(FILLERS))
+            if rng.random() < 0.02:
+                words.append(word)
+            words.append(word)
+    lines, position = [], 0
+    while position < len(words):
+        new = rng.randint(5, 8)
+        start = max(0, position - rng.randint(3, 5)) if lines else 0
+        lines.append(" ".join(words[start:position + new]))
+        position += new
+    return "\n".join(lines)
+
+
+def coverage(text: str, keywords: List[Set[str]]) -> Tuple[float, float]:
+    present = set(text.split())
+    topics = sum(1 for topic in keywords if topic & present) / len(keywords)
+    everything = set().union(*keywords)
+    return topics, len(everything & present) / len(everything)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--minutes", type=int, default=30, help="length of the talk")
+    parser.add_argument("--topics", type=int, default=12)
+    parser.add_argument("--budgets", type=int, nargs="*", default=[3000, 1500], help="TRANSCRIPT_TARGET_TOKENS to compare")
+    parser.add_argument("--prefill-tps", type=float, default=4000, help="prompt tokens per second of the fake Ollama")
+    args = parser.parse_args()
+
+    os.environ["PIPELINES_CACHE_DIR"] = tempfile.mkdtemp(prefix="bench-compress-")
+    os.environ["LLM_CACHE_MAX_BYTES"] = "0"
+    from benchmarks.fake_services import VIDEO_IDS, FakeServices, install
+    from utils.pipelines.compress import compress_transcript
+    from utils.pipelines.store import get_store
+    from utils.pipelines.text import estimate_tokens
+    from pipelines.download_youtube_transcripts import Pipeline
+
+    sentences, keywords = talk(args.minutes, args.topics)
+    transcript = auto_captions(sentences)
+    store = get_store("youtube_transcripts", ttl=0, max_bytes=1 << 30)
+    modes = [("off", False, 0), ("compress", True, 0)] + [(f"budget {budget}", True, budget) for budget in args.budgets]
+
+    print(f"{'mode':>12} {'tokens':>7} {'compress ms':>12} {'topics':>7} {'keywords':>9} {'prompt':>7} {'pipe s':>7}")
+    with FakeServices(prefill_tps=args.prefill_tps) as services:
+        install(services)
+        for index, (mode, compress, budget) in enumerate(modes):
+            started = time.perf_counter()
+            text = compress_transcript(transcript, max_tokens=budget) if compress else transcript
+            elapsed = (time.perf_counter() - started) * 1000
+            topics, words = coverage(text, keywords)
+
+            # A new video per mode, so the pipe isn't answered from the singleflight or any cache
+            video_id = VIDEO_IDS[index]
+            store.set_text(f"{video_id}:en", transcript)
+            with contextlib.redirect_stdout(io.StringIO()):
+                pipeline = Pipeline()
+                pipeline.valves.OLLAMA_HOST = "http://ollama.local:11434"
+                pipeline.valves.OLLAMA_MODEL_NAME = "fake"
+                pipeline.valves.COMPRESS_TRANSCRIPT = compress
+                pipeline.valves.TRANSCRIPT_TARGET_TOKENS = budget
+                pipeline.set_llm()
+                prompt_tokens = services.stats["prompt_tokens"]
+                started = time.perf_counter()
+                pipeline.pipe(f"summarize https://www.youtube.com/watch?v={video_id}", "youtube", [], {"stream": False, "messages": []})
+                latency = time.perf_counter() - started
+            prompt_tokens = services.stats["prompt_tokens"] - prompt_tokens
+            print(f"{mode:>12} {estimate_tokens(text):>7} {elapsed:>12.1f} {topics:>7.0%} {words:>9.0%} {prompt_tokens:>7} {latency:>7.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Benchmark of the llm_monitor filter against a local stand-in of Langfuse
+(benchmarks/fake_services.py), answering each ingestion request after
+--collector-delay seconds.
+
+Every chat runs the inlet and, except for --aborted of them, the outlet,
+with a history of --history messages. The filter (and the Langfuse SDK,
+which sends the events from its background thread) is measured under several
+sampling rates and payload policies. Reported: inlet+outlet latency,
+generations still pending (bounded by --max-pending), events and bytes
+received by the collector, the CPU time of the process (serialization in the
+SDK thread included) and the output tokens counted by the filter (the same
+whatever the sampling).
+
+Usage (from the repository root, inside the pipelines server environment):
+    python -m benchmarks.bench_llm_monitor [--chats 2000] [--history 40] [--aborted 0.3] [--collector-delay 0.05]
+"""
+import io
+import os
+import time
+import asyncio
+import argparse
+import tempfile
+import contextlib
+from typing import List
+
+from benchmarks.load_test import percentile
+
+CONFIGURATIONS = [
+    # name, sample_rate, payload_policy
+    ("full", 1.0, "full"),
+    ("truncate", 1.0, "truncate"),
+    ("last_n", 1.0, "last_n"),
+    ("hash", 1.0, "hash"),
+    ("5% full", 0.05, "full"),
+]
+
+
+def body(index: int, messages: List[dict]) -> dict:
+    return {"chat_id": f"chat-{index}", "model": "fake", "messages": messages}
+
+
+async def run(pipeline, chats: int, history: int, aborted: float) -> List[float]:
+    latencies = []
+    user = {"email": "user@example.com", "name": "User", "id": "1"}
+    turns = [
+        {"role": "user" if index % 2 == 0 else "assistant", "content": f"message {index} " + "the news of the day " * 200}
+        for index in range(history)
+    ]
+    question = turns + [{"role": "user", "content": "summarize the news of the day " * 20}]
+    answer = question + [{"role": "assistant", "content": "the news " * 200, "info": {"prompt_eval_count": 120, "eval_count": 400}}]
+    every = round(1 / aborted) if aborted else 0
+    for index in range(chats):
+        started = time.perf_counter()
+        await pipeline.inlet(body(index, question), user)
+        if not every or index % every:
+            await pipeline.outlet(body(index, answer), user)
+        latencies.append(time.perf_counter() - started)
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chats", type=int, default=2000)
+    parser.add_argument("--history", type=int, default=40, help="messages in the history of each chat")
+    parser.add_argument("--aborted", type=float, default=0.3, help="share of the chats without outlet")
+    parser.add_argument("--collector-delay", type=float, default=0.05, help="seconds the collector takes per request")
+    parser.add_argument("--max-pending", type=int, default=500, help="max_pending_generations valve")
+    args = parser.parse_args()
+
+    os.environ["PIPELINES_CACHE_DIR"] = tempfile.mkdtemp(prefix="bench-llm-monitor-")
+    from benchmarks.fake_services import FakeServices, install
+    from filters.llm_monitor import Pipeline
+
+    print(f"{'config':>9} {'chats':>6} {'p50 ms':>8} {'p99 ms':>8} {'pending':>8} {'events':>7} {'sent MB':>8} {'cpu s':>6} {'out tokens':>11}")
+    for name, sample_rate, payload_policy in CONFIGURATIONS:
+        with FakeServices(collector_delay=args.collector_delay) as services:
+            install(services)
+            pipeline = Pipeline()
+            pipeline.valves.host = services.url
+            pipeline.valves.max_pending_generations = args.max_pending
+            pipeline.valves.sample_rate = sample_rate
+            pipeline.valves.payload_policy = payload_policy
+            with contextlib.redirect_stdout(io.StringIO()):
+                asyncio.run(pipeline.on_valves_updated())
+                cpu = time.process_time()
+                latencies = asyncio.run(run(pipeline, args.chats, args.history, args.aborted))
+                pending = len(pipeline.chat_generations)
+                asyncio.run(pipeline.on_shutdown())
+                cpu = time.process_time() - cpu
+            latencies = [latency * 1e3 for latency in latencies]
+            print(
+                f"{name:>9} {args.chats:>6} {percentile(latencies, 50):>8.2f} {percentile(latencies, 99):>8.2f} {pending:>8} "
+                f"{services.stats['ingestion_events']:>7} {services.stats['ingestion_bytes'] / 1024 / 1024:>8.1f} "
+                f"{cpu:>6.1f} {pipeline.usage['fake']['output']:>11}"
+            )
+
+
+if __name__ == "__main__":
+    main()
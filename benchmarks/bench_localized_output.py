@@ -0,0 +1,133 @@
+"""
+Benchmark of the localized answers: the language instruction in the pattern
+system message (one generation, INLINE_TRANSLATION) against the English answer
+translated by a second call, per language.
+
+Ollama is simulated in process with a prefill and a decode speed; the fake
+answer of a pattern is --answer-tokens long and a translation is as long as
+its input, so the numbers show the cost of re-reading and re-generating the
+whole answer. The LLM response cache is disabled to time the model calls.
+
+Usage (from the repository root, inside the pipelines server environment):
+    python -m benchmarks.bench_localized_output [--answer-tokens 600] [--input-tokens 4000] [--number 3]
+"""
+import io
+import os
+import json
+import time
+import asyncio
+import argparse
+import contextlib
+import threading
+
+import httpx
+
+
+class FakeOllama:
+    def __init__(self, prefill_tps: float, decode_tps: float, answer_tokens: int) -> None:
+        self.prefill_tps = prefill_tps
+        self.decode_tps = decode_tps
+        self.answer_tokens = answer_tokens
+        self.reset()
+        self.lock = threading.Lock()
+
+
+    def reset(self) -> None:
+        self.calls = self.prompt_tokens = self.eval_tokens = 0
+
+
+    def __answer(self, request: httpx.Request) -> tuple:
+        payload = json.loads(request.content)
+        messages = payload["messages"]
+        prompt_tokens = sum(len(message["content"]) for message in messages) // 4
+        if messages[0]["content"].startswith("Translate"):
+            eval_tokens = len(messages[-1]["content"]) // 4
+        else:
+            eval_tokens = self.answer_tokens
+        with self.lock:
+            self.calls += 1
+            self.prompt_tokens += prompt_tokens
+            self.eval_tokens += eval_tokens
+        delay = prompt_tokens / self.prefill_tps + eval_tokens / self.decode_tps
+        content = "word " * eval_tokens
+        body = {
+            "model": payload.get("model"),
+            "created_at": "2024-01-01T00:00:00Z",
+            "message": {"role": "assistant", "content": content},
+            "done": True,
+            "prompt_eval_count": prompt_tokens,
+            "eval_count": eval_tokens,
+        }
+        return delay, body
+
+
+    def handle(self, request: httpx.Request) -> httpx.Response:
+        if request.url.host == "raw.githubusercontent.com":
+            return self.pattern(request)
+        delay, body = self.__answer(request)
+        time.sleep(delay)
+        return httpx.Response(200, json=body)
+
+
+    async def ahandle(self, request: httpx.Request) -> httpx.Response:
+        if request.url.host == "raw.githubusercontent.com":
+            return self.pattern(request)
+        delay, body = self.__answer(request)
+        await asyncio.sleep(delay)
+        return httpx.Response(200, json=body)
+
+
+    def pattern(self, request: httpx.Request) -> httpx.Response:
+        if request.url.path.endswith("/system.md"):
+            return httpx.Response(200, text="You summarize the input in a few paragraphs.")
+        return httpx.Response(404)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--answer-tokens", type=int, default=600, help="tokens of the pattern answer")
+    parser.add_argument("--input-tokens", type=int, default=4000, help="tokens of the content the pattern is applied to")
+    parser.add_argument("--prefill-tps", type=float, default=4000, help="fake prefill speed, tokens/s")
+    parser.add_argument("--decode-tps", type=float, default=1000, help="fake decode speed, tokens/s")
+    parser.add_argument("--number", type=int, default=3, help="requests per measure")
+    args = parser.parse_args()
+
+    os.environ["LLM_CACHE_MAX_BYTES"] = "0"
+    from llama_index.llms.ollama import Ollama
+    from utils.pipelines.http_client import HttpClient, set_http_client
+    from pipelines.download_youtube_transcripts import Fabric as PipelineFabric
+    from filters.fabric_integration import Fabric as FilterFabric
+
+    fake = FakeOllama(args.prefill_tps, args.decode_tps, args.answer_tokens)
+    client = HttpClient(transport=httpx.MockTransport(fake.handle), async_transport=httpx.MockTransport(fake.ahandle))
+    set_http_client(client)
+    llm = Ollama(model="fake", base_url="http://ollama.local", context_window=30000, **client.ollama_clients("http://ollama.local", 600.0))
+    content = "content " * (args.input_tokens * 4 // 8)
+
+    def run_pipeline(fabric) -> None:
+        fabric.apply_pattern(content)
+
+    def run_filter(fabric) -> None:
+        asyncio.run(fabric.aapply_pattern(f"summarize {content}"))
+
+    print(f"{'fabric':>10} {'language':>9} {'mode':>10} {'calls':>6} {'prompt tk':>10} {'output tk':>10} {'seconds':>8}")
+    for name, fabric_class, run in (("pipeline", PipelineFabric, run_pipeline), ("filter", FilterFabric, run_filter)):
+        for language, keyword in (("en", "english"), ("it", "italian")):
+            for mode, inline in (("translate", False), ("inline", True)):
+                fake.reset()
+                start = time.perf_counter()
+                for _ in range(args.number):
+                    fabric = fabric_class(llm, inline_translation=inline)
+                    fabric.set_user_message(f"summarize in {keyword} {language}")
+                    with contextlib.redirect_stdout(io.StringIO()):
+                        fabric.find_pattern()
+                        run(fabric)
+                elapsed = (time.perf_counter() - start) / args.number
+                print(
+                    f"{name:>10} {language:>9} {mode:>10} {fake.calls / args.number:>6.1f} "
+                    f"{fake.prompt_tokens // args.number:>10} {fake.eval_tokens // args.number:>10} {elapsed:>8.2f}"
+                )
+
+
+if __name__ == "__main__":
+    main()
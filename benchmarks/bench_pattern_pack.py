@@ -0,0 +1,100 @@
+"""
+Benchmark of the offline Fabric pattern pack against the pattern cache.
+
+A synthetic catalog of --patterns patterns (markdown with the usual # * ` > characters
+the sanitizer removes) is written as a Fabric checkout, packed, and the pattern
+files are then read:
+    sanitize      the previous per character allowlist match against sanitize_pattern
+    pack          open time, first lookup (decoded from the mapping) and next ones
+    cache         the pattern cache, fresh entries (memory) and first read after a restart (JSON file)
+    download      the pattern cache with an empty cache, from the local fake GitHub (--pattern-delay)
+
+Usage (from the repository root):
+    python -m benchmarks.bench_pattern_pack [--patterns 230] [--pattern-delay 0.1]
+"""
+import os
+import re
+import time
+import random
+import argparse
+import tempfile
+from pathlib import Path
+
+SECTION = "# {title}\n\n- You are an expert at `{word}` and *{word}*, see <https://example.com/{word}>.\n> {word} {word}\n\n"
+WORDS = "identity purpose steps output instructions input extract summarize analyze wisdom ideas quotes".split()
+
+
+def write_catalog(root: Path, patterns: int) -> list:
+    rng = random.Random(0)
+    names = [f"{rng.choice(WORDS)}_{rng.choice(WORDS)}_{index}" for index in range(patterns)]
+    for name in names:
+        folder = root / "patterns" / name
+        folder.mkdir(parents=True)
+        body = "".join(SECTION.format(title=rng.choice(WORDS).upper(), word=rng.choice(WORDS)) for _ in range(40))
+        (folder / "system.md").write_text(body, encoding="utf-8")
+        if rng.random() < 0.2:
+            (folder / "user.md").write_text("CONTENT:\n", encoding="utf-8")
+    return names
+
+
+def measure(call, number: int) -> float:
+    started = time.perf_counter()
+    for _ in range(number):
+        call()
+    return (time.perf_counter() - started) / number * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--patterns", type=int, default=230)
+    parser.add_argument("--pattern-delay", type=float, default=0.1, help="fake GitHub round trip time")
+    args = parser.parse_args()
+
+    os.environ["PIPELINES_CACHE_DIR"] = tempfile.mkdtemp(prefix="bench-pattern-pack-")
+    from benchmarks.fake_services import FakeServices, install
+    from utils.pipelines.pattern_cache import PatternCache
+    from utils.pipelines.pattern_pack import PatternPack, build_pack, iter_directory, sanitize_pattern
+
+    root = Path(tempfile.mkdtemp(prefix="fabric-"))
+    names = write_catalog(root, args.patterns)
+    url = "https://raw.githubusercontent.com/danielmiessler/fabric/main/patterns/{}/system.md"
+    content = (root / "patterns" / names[0] / "system.md").read_text(encoding="utf-8")
+
+    allowlist = re.compile(r"^[a-zA-Z0-9\s.,;:!?\-]+$")
+    legacy = measure(lambda: "".join(char for char in content if allowlist.match(char)), 200)
+    print(f"sanitize {len(content)} chars: per character {legacy:.0f}us, sanitize_pattern {measure(lambda: sanitize_pattern(content), 200):.1f}us")
+
+    output = root / "patterns.pack"
+    started = time.perf_counter()
+    meta = build_pack(iter_directory(root), output)
+    print(f"build: {meta['patterns']} patterns in {time.perf_counter() - started:.2f}s, {output.stat().st_size / 1024:.0f}KB")
+
+    started = time.perf_counter()
+    pack = PatternPack(output)
+    opened = (time.perf_counter() - started) * 1e6
+    started = time.perf_counter()
+    for name in names:
+        pack.get(name)
+    first = (time.perf_counter() - started) / len(names) * 1e6
+    warm = measure(lambda: pack.lookup_url(url.format(names[7])), 10000)
+    print(f"pack: open {opened:.0f}us, first lookup {first:.1f}us, next lookups {warm:.2f}us")
+
+    with FakeServices(pattern_delay=args.pattern_delay) as services:
+        install(services)
+        cache_dir = Path(tempfile.mkdtemp(prefix="pattern-cache-"))
+        cache = PatternCache(cache_dir, ttl=3600)
+        started = time.perf_counter()
+        for name in names[:20]:
+            cache.get(url.format(name), sanitize_pattern)
+        download = (time.perf_counter() - started) / 20 * 1e6
+        fresh = measure(lambda: cache.get(url.format(names[7]), sanitize_pattern), 10000)
+        restarted = PatternCache(cache_dir, ttl=3600)
+        started = time.perf_counter()
+        for name in names[:20]:
+            restarted.get(url.format(name), sanitize_pattern)
+        from_disk = (time.perf_counter() - started) / 20 * 1e6
+    print(f"cache: download {download / 1e3:.0f}ms, after a restart {from_disk:.0f}us, fresh {fresh:.2f}us")
+
+
+if __name__ == "__main__":
+    main()
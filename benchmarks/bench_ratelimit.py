@@ -0,0 +1,113 @@
+"""
+Benchmark of the transcript rate limiter shared by the worker processes.
+
+--processes worker processes (like the pipelines server workers) with --threads
+concurrent requests each ask the YouTube pipeline for --requests new videos
+(no pattern, so only the transcript download is measured). The transcripts come
+from the local fake YouTube (benchmarks/fake_services.py), which serves
+--api-rate per second with bursts of --api-burst and answers 429 to everything
+for --api-penalty seconds after refusing one, like the unofficial API does to
+the clients that insist. The YoutubeTranscriptReader of the children is
+pointed at it, raising an HTTP error on the 429s like the real one.
+
+Compared: no limiter (TRANSCRIPT_RATE_LIMIT=0, the previous behaviour) and the
+shared limiter at --limit per minute. Reported: transcripts downloaded, errors,
+429s answered by the API, elapsed time and downloads per second.
+
+Usage (from the repository root, inside the pipelines server environment):
+    python -m benchmarks.bench_ratelimit [--processes 4] [--threads 4] [--requests 20] [--api-rate 5] [--limit 600]
+"""
+import io
+import os
+import sys
+import json
+import time
+import types
+import argparse
+import tempfile
+import contextlib
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+
+def child(args) -> None:
+    from benchmarks.fake_services import install
+    from utils.pipelines.http_client import get_http_client
+    import pipelines.download_youtube_transcripts as youtube
+    from llama_index.core.schema import Document
+
+    install(types.SimpleNamespace(url=args.server))
+
+    class FakeTranscriptReader:
+        def load_data(self, ytlinks, languages=None, **kwargs):
+            video_id = ytlinks[0].rsplit("v=", 1)[-1]
+            response = get_http_client().client.get(f"https://www.youtube.com/api/timedtext?v={video_id}")
+            response.raise_for_status()
+            return [Document(text=response.text, id_=video_id)]
+
+    youtube.YoutubeTranscriptReader = FakeTranscriptReader
+    with contextlib.redirect_stdout(io.StringIO()):
+        pipeline = youtube.Pipeline()
+        pipeline.valves.TRANSCRIPT_RATE_LIMIT = args.limit if args.mode == "limiter" else 0
+        pipeline.valves.TRANSCRIPT_RATE_BURST = args.api_burst
+        pipeline.valves.TRANSCRIPT_RATE_LIMIT_WAIT = args.wait
+
+        def one(index: int) -> str:
+            # 11 characters, like a YouTube video id, new for every request so none is cached
+            video_id = f"p{args.index:02d}{args.mode[0]}{index:07d}"
+            return pipeline.pipe(f"https://www.youtube.com/watch?v={video_id}", "youtube", [], {"stream": False})
+
+        started = time.time()
+        with ThreadPoolExecutor(max_workers=args.threads) as executor:
+            results = list(executor.map(one, range(args.requests)))
+    errors = [result for result in results if result.startswith("Error")]
+    print(json.dumps({"ok": len(results) - len(errors), "errors": len(errors), "sample": errors[:1], "started": started, "ended": time.time()}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--threads", type=int, default=4, help="concurrent requests per process")
+    parser.add_argument("--requests", type=int, default=20, help="videos asked by each process")
+    parser.add_argument("--api-rate", type=float, default=5, help="transcripts per second the fake API serves")
+    parser.add_argument("--api-burst", type=int, default=5)
+    parser.add_argument("--api-penalty", type=float, default=2, help="seconds of 429s after a refused request")
+    parser.add_argument("--limit", type=float, default=600, help="TRANSCRIPT_RATE_LIMIT, per minute (above the API rate, the backoff finds it)")
+    parser.add_argument("--wait", type=float, default=60, help="TRANSCRIPT_RATE_LIMIT_WAIT")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--mode", choices=["none", "limiter"], help=argparse.SUPPRESS)
+    parser.add_argument("--index", type=int, default=0, help=argparse.SUPPRESS)
+    parser.add_argument("--server", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        return child(args)
+
+    from benchmarks.fake_services import FakeServices
+
+    print(f"{'limiter':>8} {'ok':>5} {'errors':>7} {'429s':>6} {'elapsed s':>10} {'ok/s':>6}")
+    for mode in ("none", "limiter"):
+        environment = dict(os.environ, PIPELINES_CACHE_DIR=tempfile.mkdtemp(prefix="bench-ratelimit-"))
+        with FakeServices(transcript_rate=args.api_rate, transcript_burst=args.api_burst, transcript_penalty=args.api_penalty) as services:
+            command = [
+                sys.executable, "-m", "benchmarks.bench_ratelimit", "--child", "--mode", mode, "--server", services.url,
+                "--threads", str(args.threads), "--requests", str(args.requests), "--api-burst", str(args.api_burst),
+                "--limit", str(args.limit), "--wait", str(args.wait),
+            ]
+            children = [
+                subprocess.Popen(command + ["--index", str(index)], stdout=subprocess.PIPE, text=True, env=environment)
+                for index in range(args.processes)
+            ]
+            outputs = [json.loads(process.communicate()[0].strip().splitlines()[-1]) for process in children]
+            # From the first request to the last answer, the start of the processes left aside
+            elapsed = max(output["ended"] for output in outputs) - min(output["started"] for output in outputs)
+            rejected = services.stats["transcripts_429"]
+        ok = sum(output["ok"] for output in outputs)
+        errors = sum(output["errors"] for output in outputs)
+        print(f"{'on' if mode == 'limiter' else 'off':>8} {ok:>5} {errors:>7} {rejected:>6} {elapsed:>10.1f} {ok / elapsed:>6.2f}")
+        sample = next((output["sample"][0] for output in outputs if output["sample"]), None)
+        if sample:
+            print(f"         first error: {sample[:100]}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Micro-benchmark of the Fabric keyword routing: the legacy per keyword
+re.search loop against the single pass PatternRouter.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_router [--sizes 6 100 500] [--number 2000]
+"""
+import re
+import random
+import argparse
+import timeit
+
+from utils.pipelines.router import PatternRouter
+
+LANGUAGES = {"en": "English", "it": "Italian"}
+PATTERNS = {
+    'extract wisdom': "extract_wisdom",
+    'summarize': "summarize",
+    "analyze_presentation": "analyze_presentation",
+    'estrai saggezza': "extract_wisdom",
+    'riassumi': "summarize",
+    "analizza": "analyze_presentation"
+}
+MESSAGES = [
+    "it estrai saggezza https://www.youtube.com/watch?v=dQw4w9WgXcQ",
+    "extract wisdom https://youtu.be/dQw4w9WgXcQ",
+    "en summarize https://www.bbc.com/news/articles/c7497lm99kro",
+    "give me the daily digest, please keep it short and readable for the whole team",
+]
+
+
+def legacy_find_pattern(message: str, languages: dict, patterns: dict):
+    # Copy of the routing loop used by Fabric.find_pattern before PatternRouter
+    language = pattern = None
+    for lang, text in languages.items():
+        reg = fr'\b{re.escape(lang.lower())}\b'
+        langfound = re.search(reg, message.lower())
+        language = text if langfound else "English"
+    for target, fn in patterns.items():
+        reg = fr'\b{re.escape(target.lower())}\b'
+        found = re.search(reg, message.lower())
+        pattern = fn if found else pattern
+    return language, pattern
+
+
+def synthetic_patterns(size: int) -> dict:
+    rnd = random.Random(size)
+    words = ["create", "extract", "analyze", "summarize", "write", "improve", "explain", "rate", "find", "label"]
+    nouns = ["wisdom", "ideas", "claims", "paper", "prose", "threat", "report", "logs", "code", "essay", "story"]
+    patterns = dict(PATTERNS)
+    while len(patterns) < size:
+        name = f"{rnd.choice(words)}_{rnd.choice(nouns)}_{len(patterns)}"
+        patterns[name.replace("_", " ")] = name
+    return patterns
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[len(PATTERNS), 100, 500])
+    parser.add_argument("--number", type=int, default=2000, help="routed messages per measure")
+    args = parser.parse_args()
+
+    print(f"{'patterns':>10} {'legacy us/msg':>15} {'router us/msg':>15} {'build ms':>10} {'speedup':>9}")
+    for size in args.sizes:
+        patterns = synthetic_patterns(size)
+        build = timeit.timeit(lambda: PatternRouter(LANGUAGES, patterns), number=3) / 3
+        router = PatternRouter(LANGUAGES, patterns)
+
+        for message in MESSAGES:
+            # Messages hold one keyword at most, so both strategies must agree
+            _, pattern = router.route(message)
+            _, legacy_pattern = legacy_find_pattern(message, LANGUAGES, patterns)
+            assert pattern == legacy_pattern, (message, pattern, legacy_pattern)
+
+        def run_legacy():
+            for message in MESSAGES:
+                legacy_find_pattern(message, LANGUAGES, patterns)
+
+        def run_router():
+            for message in MESSAGES:
+                router.route(message)
+
+        rounds = max(1, args.number // len(MESSAGES))
+        legacy = min(timeit.repeat(run_legacy, number=rounds, repeat=3)) / (rounds * len(MESSAGES))
+        routed = min(timeit.repeat(run_router, number=rounds, repeat=3)) / (rounds * len(MESSAGES))
+        print(f"{size:>10} {legacy * 1e6:>15.2f} {routed * 1e6:>15.2f} {build * 1e3:>10.2f} {legacy / routed:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
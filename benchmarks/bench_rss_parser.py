@@ -0,0 +1,88 @@
+"""
+Benchmark of the BBC feed parsing: ElementTree.fromstring on the buffered
+body (previous implementation) against the streaming iter_rss_items, on
+synthetic feeds of increasing size. Reports time and peak traced memory.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_rss_parser [--items 50 1000 20000] [--max-items 100]
+"""
+import time
+import argparse
+import tracemalloc
+import xml.etree.ElementTree as ElementTree
+from typing import Iterator
+
+from utils.pipelines.rss import iter_rss_items
+
+CHUNK_SIZE = 16 * 1024
+ITEM = """<item>
+<title><![CDATA[Story number {i} about something happening somewhere]]></title>
+<description><![CDATA[A fairly long description of story {i}, as BBC feeds usually carry one or two sentences of summary.]]></description>
+<link>https://www.bbc.com/news/articles/c{i:010d}</link>
+<guid isPermaLink="false">https://www.bbc.com/news/articles/c{i:010d}#0</guid>
+<pubDate>Mon, 01 Jan 2024 {h:02d}:{m:02d}:00 GMT</pubDate>
+<media:thumbnail width="240" height="135" url="https://ichef.bbci.co.uk/ace/standard/240/{i}.jpg"/>
+</item>
+"""
+HEADER = '<?xml version="1.0" encoding="UTF-8"?><rss xmlns:media="http://search.yahoo.com/mrss/" version="2.0"><channel><title>BBC News</title>\n'
+FOOTER = "</channel></rss>"
+
+
+def feed_chunks(items: int) -> Iterator[bytes]:
+    # Generated lazily, like the chunks of a streamed HTTP response
+    buffer = HEADER
+    for i in range(items):
+        buffer += ITEM.format(i=i, h=i // 60 % 24, m=i % 60)
+        if len(buffer) >= CHUNK_SIZE:
+            yield buffer.encode("utf-8")
+            buffer = ""
+    yield (buffer + FOOTER).encode("utf-8")
+
+
+def parse_elementtree(items: int, max_items: int) -> int:
+    content = b"".join(feed_chunks(items))
+    root = ElementTree.fromstring(content)
+    output = []
+    for item in root.iter("item"):
+        output.append({
+            "title": item.find("title").text,
+            "description": item.find("description").text,
+            "link": item.find("link").text,
+            "published": item.find("pubDate").text,
+        })
+    return len(output)
+
+
+def parse_streaming(items: int, max_items: int) -> int:
+    return len(list(iter_rss_items(feed_chunks(items), max_items=max_items)))
+
+
+def measure(function, items: int, max_items: int):
+    tracemalloc.start()
+    start = time.perf_counter()
+    count = function(items, max_items)
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return count, elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, nargs="+", default=[50, 1000, 20000])
+    parser.add_argument("--max-items", type=int, default=100, help="items kept by the streaming parser")
+    args = parser.parse_args()
+
+    print(f"{'items':>7} {'parser':>22} {'kept':>6} {'ms':>9} {'peak KB':>10}")
+    for items in args.items:
+        for name, function, max_items in (
+            ("elementtree", parse_elementtree, None),
+            ("streaming", parse_streaming, None),
+            (f"streaming (max {args.max_items})", parse_streaming, args.max_items),
+        ):
+            count, elapsed, peak = measure(function, items, max_items)
+            print(f"{items:>7} {name:>22} {count:>6} {elapsed * 1e3:>9.1f} {peak / 1024:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Benchmark of the coalescing of identical requests in flight (single-flight).
+
+--concurrency users send the same request at the same moment (the daily digest
+with a commentary, a shared BBC article, a shared YouTube video) to a pipeline
+backed by the local fake services (benchmarks/fake_services.py), with the
+coalescing and without it (every request computes its own answer, the previous
+behaviour). Reported: the chat requests the fake Ollama received, the latency
+of the slowest user and the time to the first chunk of streamed answers.
+
+The LLM response cache is disabled, so the duplicates can only be saved by the coalescing.
+
+Usage (from the repository root, inside the pipelines server environment):
+    python -m benchmarks.bench_singleflight [--targets digest article youtube] [--concurrency 16] [--stream]
+"""
+import io
+import os
+import time
+import argparse
+import tempfile
+import threading
+import contextlib
+from concurrent.futures import ThreadPoolExecutor
+
+TARGETS = ["digest", "article", "youtube"]
+
+
+class NoCoalescing:
+    def run(self, key, compute, stream=False):
+        result = compute()
+        return result if stream or isinstance(result, str) else "".join(result)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--targets", nargs="+", choices=TARGETS, default=TARGETS)
+    parser.add_argument("--concurrency", type=int, default=16, help="users sending the same request")
+    parser.add_argument("--stream", action="store_true", help="streamed answers")
+    parser.add_argument("--video-minutes", type=int, default=10)
+    args = parser.parse_args()
+
+    os.environ["PIPELINES_CACHE_DIR"] = tempfile.mkdtemp(prefix="bench-singleflight-")
+    os.environ["LLM_CACHE_MAX_BYTES"] = "0"
+    from benchmarks.fake_services import ARTICLE_IDS, VIDEO_IDS, FakeServices, fixture_transcript, install
+    from benchmarks.load_test import consume
+    from utils.pipelines.store import get_store
+    from pipelines.bbc_news_daily_feeds import Pipeline as BBCPipeline
+    from pipelines.download_youtube_transcripts import Pipeline as YouTubePipeline
+
+    messages = {
+        "digest": "give me the daily digest of world and business news with your commentary",
+        "article": f"summarize https://www.bbc.com/news/articles/{ARTICLE_IDS[0]}",
+        "youtube": f"summarize https://www.youtube.com/watch?v={VIDEO_IDS[0]}",
+    }
+    store = get_store("youtube_transcripts", ttl=0, max_bytes=1 << 30)
+    store.set_text(f"{VIDEO_IDS[0]}:en", fixture_transcript(VIDEO_IDS[0], args.video_minutes))
+
+    print(f"{'target':>8} {'coalescing':>10} {'chats':>6} {'slowest s':>10} {'first chunk s':>14} {'shared':>7}")
+    with FakeServices() as services:
+        install(services)
+        for target in args.targets:
+            for coalescing in (False, True):
+                with contextlib.redirect_stdout(io.StringIO()):
+                    pipeline = YouTubePipeline() if target == "youtube" else BBCPipeline()
+                    pipeline.valves.OLLAMA_HOST = "http://ollama.local:11434"
+                    pipeline.valves.OLLAMA_MODEL_NAME = "fake"
+                    pipeline.set_llm()
+                if not coalescing:
+                    pipeline.singleflight = NoCoalescing()
+                body = {"stream": args.stream, "messages": []}
+                barrier = threading.Barrier(args.concurrency)
+
+                def one(index: int) -> tuple:
+                    barrier.wait()
+                    started = time.perf_counter()
+                    output, first = consume(pipeline.pipe(messages[target], target, [], body), started)
+                    return time.perf_counter() - started, first, output
+
+                chats = services.stats["chat"]
+                with contextlib.redirect_stdout(io.StringIO()), ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+                    results = list(executor.map(one, range(args.concurrency)))
+                chats = services.stats["chat"] - chats
+                outputs = {output for _, _, output in results}
+                followers = pipeline.singleflight.stats["followers"] if coalescing else 0
+                print(
+                    f"{target:>8} {'on' if coalescing else 'off':>10} {chats:>6} {max(result[0] for result in results):>10.2f} "
+                    f"{max(result[1] or 0 for result in results):>14.2f} {followers:>7}"
+                    + ("" if len(outputs) == 1 or not coalescing else "  (answers differ!)")
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Benchmark of the startup warm-up: latency of the first request after on_startup
+against the steady state, with and without the WARM_UP valve.
+
+Each run is a fresh process (empty pattern cache, nothing imported) against the
+local fake services (benchmarks/fake_services.py), whose Ollama takes
+--load-seconds to load the model on its first request and whose GitHub answers
+the pattern files after --pattern-delay seconds. With the warm-up the first
+request is sent once the pipeline reports it is ready.
+
+Usage (from the repository root, inside the pipelines server environment):
+    python -m benchmarks.bench_warmup [--targets youtube inlet] [--load-seconds 3] [--pattern-delay 0.3]
+"""
+import io
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+import statistics
+import contextlib
+import subprocess
+
+TARGETS = ["youtube", "inlet"]
+
+
+def child(args) -> None:
+    os.environ["PIPELINES_CACHE_DIR"] = tempfile.mkdtemp(prefix="bench-warmup-")
+    os.environ["LLM_CACHE_MAX_BYTES"] = "0"
+    from benchmarks.fake_services import FakeServices, VIDEO_IDS, fixture_text, fixture_transcript, install
+    from utils.pipelines.store import get_store
+
+    loop = asyncio.new_event_loop()
+    with FakeServices(load_seconds=args.load_seconds, pattern_delay=args.pattern_delay) as services, contextlib.redirect_stdout(io.StringIO()):
+        install(services)
+        if args.child == "youtube":
+            from pipelines.download_youtube_transcripts import Pipeline
+            store = get_store("youtube_transcripts", ttl=0, max_bytes=1 << 30)
+            for video_id in VIDEO_IDS:
+                store.set_text(f"{video_id}:en", fixture_transcript(video_id, 5))
+
+            def request(index: int):
+                message = f"summarize https://www.youtube.com/watch?v={VIDEO_IDS[index]}"
+                return pipeline.pipe(message, "youtube", [], {"stream": False, "messages": []})
+        else:
+            from filters.fabric_integration import Pipeline
+
+            def request(index: int):
+                body = {"messages": [{"role": "user", "content": f"summarize {fixture_text(400, index)}"}]}
+                return loop.run_until_complete(pipeline.inlet(body))
+
+        pipeline = Pipeline()
+        pipeline.valves.OLLAMA_HOST = "http://ollama.local:11434"
+        pipeline.valves.OLLAMA_MODEL_NAME = "fake"
+        pipeline.valves.WARM_UP = args.mode == "warm"
+        started = time.perf_counter()
+        loop.run_until_complete(pipeline.on_startup())
+        loop.run_until_complete(pipeline.warmup.wait())
+        ready = time.perf_counter() - started
+
+        latencies = []
+        for index in range(1 + args.requests):
+            started = time.perf_counter()
+            request(index)
+            latencies.append(time.perf_counter() - started)
+        stats = dict(services.stats)
+    print(json.dumps({"ready": ready, "first": latencies[0], "steady": statistics.median(latencies[1:]), "stats": stats}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--targets", nargs="+", choices=TARGETS, default=TARGETS)
+    parser.add_argument("--load-seconds", type=float, default=3.0, help="fake Ollama model load time")
+    parser.add_argument("--pattern-delay", type=float, default=0.3, help="fake GitHub round trip time")
+    parser.add_argument("--requests", type=int, default=3, help="requests after the first one, for the steady state")
+    parser.add_argument("--child", choices=TARGETS, help=argparse.SUPPRESS)
+    parser.add_argument("--mode", choices=["cold", "warm"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        return child(args)
+
+    print(f"{'target':>8} {'warm-up':>8} {'ready s':>8} {'first s':>8} {'steady s':>9} {'model loads':>12}")
+    for target in args.targets:
+        for mode in ("cold", "warm"):
+            command = [
+                sys.executable, "-m", "benchmarks.bench_warmup", "--child", target, "--mode", mode,
+                "--load-seconds", str(args.load_seconds), "--pattern-delay", str(args.pattern_delay),
+                "--requests", str(args.requests),
+            ]
+            output = subprocess.run(command, capture_output=True, text=True, check=True).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            print(
+                f"{target:>8} {'on' if mode == 'warm' else 'off':>8} {result['ready']:>8.2f} {result['first']:>8.2f} "
+                f"{result['steady']:>9.2f} {result['stats']['model_loads']:>12}"
+            )
+
+
+if __name__ == "__main__":
+    main()
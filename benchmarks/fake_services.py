@@ -0,0 +1,407 @@
+"""
+Local stand-ins of the services the pipelines talk to, for the benchmarks.
+
+FakeServices is a threaded HTTP/1.1 server answering:
+    POST /api/chat                                   Ollama, with model load, prefill and decode delays, streamed or not
+    GET  /news/rss.xml, /news/<category>/rss.xml     BBC feeds (with ETag, so conditional GETs get a 304)
+    GET  /news/articles/<id>                         BBC article pages
+    GET  /danielmiessler/fabric/main/patterns/...    Fabric pattern files
+    GET  /api/timedtext?v=<video id>                 YouTube transcripts, rate limited like the unofficial API
+    GET  /api/public/projects                        Langfuse credentials check
+    POST /api/public/ingestion                       Langfuse collector, counts the events it receives
+
+RewriteTransport sends every request of the shared HTTP client to that server
+whatever the original host (feeds.bbci.co.uk, www.bbc.com, raw.githubusercontent.com,
+the Ollama host...), keeping the path, so the pipelines run unchanged: install()
+puts it behind utils.pipelines.http_client.get_http_client().
+
+Usage:
+    with FakeServices(prefill_tps=4000, decode_tps=200) as services:
+        install(services)
+        ...
+"""
+import sys
+import json
+import time
+import random
+import hashlib
+import threading
+from typing import List, Optional
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import httpx
+
+from utils.pipelines.http_client import HttpClient, set_http_client
+
+FEED_CATEGORIES = [
+    "world", "uk", "business", "politics", "health", "education", "science_and_environment", "technology",
+    "entertainment_and_arts", "world/europe", "world/asia", "world/africa", "world/us_and_canada",
+]
+ARTICLE_IDS = [f"c{index:010d}o" for index in range(64)]
+VIDEO_IDS = [f"vid{index:08d}" for index in range(64)]
+WORDS = (
+    "the of and to in that is was for it with as on be at by this are but from or have an they which one you "
+    "were all there about people because really something important actually government question different "
+    "everything probably understand research company problem experience technology minister economy"
+).split()
+
+
+def fixture_text(words: int, seed: int) -> str:
+    rng = random.Random(seed)
+    return " ".join(rng.choice(WORDS) for _ in range(words))
+
+
+def fixture_feed(category: str, items: int = 40) -> bytes:
+    seed = int(hashlib.sha256(category.encode("utf-8")).hexdigest()[:8], 16)
+    entries = []
+    for index in range(items):
+        article_id = ARTICLE_IDS[(seed + index) % len(ARTICLE_IDS)]
+        entries.append(
+            f"<item><title>{category} story {index}</title>"
+            f"<description>{fixture_text(30, seed + index)}</description>"
+            f"<link>https://www.bbc.com/news/articles/{article_id}</link>"
+            f"<guid isPermaLink=\"false\">{category}-{index}</guid>"
+            f"<pubDate>Mon, 0{1 + index % 9} Jan 2024 10:{index % 60:02d}:00 GMT</pubDate></item>"
+        )
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?><rss version="2.0"><channel>'
+        f"<title>BBC News - {category}</title>{''.join(entries)}</channel></rss>"
+    ).encode("utf-8")
+
+
+def fixture_article(article_id: str, paragraphs: int = 30) -> bytes:
+    seed = int(hashlib.sha256(article_id.encode("utf-8")).hexdigest()[:8], 16)
+    navigation = "".join(f'<li><a href="/news/{i}">Section {i}</a></li>' for i in range(200))
+    body = "".join(f"<p>{fixture_text(60, seed + i)}.</p>" for i in range(paragraphs))
+    state = '{"data": "' + "x" * 200_000 + '"}'
+    return (
+        "<!DOCTYPE html><html><head><title>BBC</title>"
+        f"<script>window.__INITIAL_DATA__ = {state}</script></head><body>"
+        f"<header><nav><ul>{navigation}</ul></nav></header>"
+        f"<main><article><h1>{article_id}</h1>{body}</article></main>"
+        f"<footer>{navigation}</footer></body></html>"
+    ).encode("utf-8")
+
+
+def fixture_pattern(name: str, file: str) -> Optional[str]:
+    if file == "system.md":
+        return (
+            f"# IDENTITY and PURPOSE\nYou apply the {name} pattern to the input.\n\n"
+            "# STEPS\n- Read the input\n- Write the output\n\n# OUTPUT INSTRUCTIONS\n- Use bullet points\n"
+        )
+    return None
+
+
+def fixture_transcript(video_id: str, minutes: int = 20) -> str:
+    # One caption of ~8 words per line, 150 words per minute
+    seed = int(hashlib.sha256(video_id.encode("utf-8")).hexdigest()[:8], 16)
+    words = fixture_text(150 * minutes, seed).split()
+    return "\n".join(" ".join(words[i:i + 8]) for i in range(0, len(words), 8))
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address) -> None:
+        # Clients stop reading on purpose (i.e. a BBC page once its <article> is closed)
+        if not isinstance(sys.exc_info()[1], (ConnectionResetError, BrokenPipeError)):
+            super().handle_error(request, client_address)
+
+
+class FakeServices:
+    def __init__(
+        self,
+        prefill_tps: float = 4000,
+        decode_tps: float = 200,
+        answer_tokens: int = 150,
+        slots: int = 4,
+        feed_items: int = 40,
+        collector_delay: float = 0.0,
+        load_seconds: float = 0.0,
+        pattern_delay: float = 0.0,
+        transcript_rate: float = 0.0,
+        transcript_burst: int = 5,
+        transcript_penalty: float = 0.0,
+    ) -> None:
+        """
+        Args:
+            prefill_tps (float): prompt tokens evaluated per second by the fake Ollama
+            decode_tps (float): tokens generated per second, per request
+            answer_tokens (int): length of the answers
+            slots (int): requests Ollama runs at the same time (OLLAMA_NUM_PARALLEL), the others wait
+            feed_items (int): items of each fixture feed
+            collector_delay (float): seconds the fake Langfuse takes to answer an ingestion batch
+            load_seconds (float): seconds the first request of a model (or of a new context size) waits for it to load
+            pattern_delay (float): round trip time of the fake GitHub serving the Fabric patterns
+            transcript_rate (float): transcripts served per second (token bucket), the others get a 429; 0 for no limit
+            transcript_burst (int): transcripts served at once after an idle period
+            transcript_penalty (float): seconds every transcript request gets a 429 after one was refused
+        """
+        self.prefill_tps = prefill_tps
+        self.decode_tps = decode_tps
+        self.answer_tokens = answer_tokens
+        self.slots = threading.Semaphore(slots)
+        self.feed_items = feed_items
+        self.collector_delay = collector_delay
+        self.load_seconds = load_seconds
+        self.pattern_delay = pattern_delay
+        self.transcript_rate = transcript_rate
+        self.transcript_burst = transcript_burst
+        self.transcript_penalty = transcript_penalty
+        self.transcript_bucket = {"tokens": float(transcript_burst), "updated_at": time.monotonic(), "penalized_until": 0.0}
+        self.loaded = set()
+        self.loading = threading.Lock()
+        self.stats = {
+            "chat": 0, "feeds": 0, "not_modified": 0, "articles": 0, "patterns": 0, "not_found": 0,
+            "ingestion_batches": 0, "ingestion_events": 0, "ingestion_bytes": 0, "model_loads": 0,
+            "transcripts": 0, "transcripts_429": 0, "prompt_tokens": 0,
+        }
+        self.lock = threading.Lock()
+        self.server: Optional[ThreadingHTTPServer] = None
+
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server.server_address[1]}"
+
+
+    def count(self, key: str, value: int = 1) -> None:
+        with self.lock:
+            self.stats[key] += value
+
+
+    def start(self) -> "FakeServices":
+        services = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                services.handle_get(self)
+
+            def do_POST(self):
+                services.handle_post(self)
+
+        self.server = _Server(("127.0.0.1", 0), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+
+    def stop(self) -> None:
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+
+
+    def __enter__(self) -> "FakeServices":
+        return self.start()
+
+
+    def __exit__(self, *args) -> None:
+        self.stop()
+
+
+    def send(self, handler: BaseHTTPRequestHandler, status: int, body: bytes = b"", content_type: str = "text/plain", headers: Optional[dict] = None) -> None:
+        handler.send_response(status)
+        handler.send_header("Content-Type", content_type)
+        handler.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            handler.send_header(name, value)
+        handler.end_headers()
+        handler.wfile.write(body)
+
+
+    def handle_get(self, handler: BaseHTTPRequestHandler) -> None:
+        path = handler.path.split("?")[0]
+        if path.endswith("/rss.xml") and path.startswith("/news"):
+            category = path[len("/news/"):-len("/rss.xml")] or "top_stories"
+            body = fixture_feed(category, self.feed_items)
+            etag = '"' + hashlib.sha256(body).hexdigest()[:16] + '"'
+            if handler.headers.get("If-None-Match") == etag:
+                self.count("not_modified")
+                return self.send(handler, 304, headers={"ETag": etag})
+            self.count("feeds")
+            return self.send(handler, 200, body, "application/rss+xml", {"ETag": etag, "Cache-Control": "max-age=60"})
+
+        if path.startswith("/news/articles/"):
+            self.count("articles")
+            return self.send(handler, 200, fixture_article(path.rsplit("/", 1)[-1]), "text/html; charset=utf-8")
+
+        if "/fabric/main/patterns/" in path:
+            time.sleep(self.pattern_delay)
+            name, file = path.split("/patterns/", 1)[1].split("/", 1)
+            content = fixture_pattern(name, file)
+            if content is not None:
+                self.count("patterns")
+                return self.send(handler, 200, content.encode("utf-8"), headers={"ETag": f'"{name}-{file}"'})
+
+        if path == "/api/timedtext":
+            video_id = handler.path.partition("v=")[2].split("&")[0]
+            if not self.take_transcript_token():
+                self.count("transcripts_429")
+                return self.send(handler, 429, b"Too Many Requests")
+            self.count("transcripts")
+            return self.send(handler, 200, fixture_transcript(video_id, 5).encode("utf-8"))
+
+        if path == "/api/public/projects":
+            return self.send(handler, 200, b'{"data": [{"id": "fake"}]}', "application/json")
+
+        self.count("not_found")
+        self.send(handler, 404, b"404: Not Found")
+
+
+    def take_transcript_token(self) -> bool:
+        # Token bucket, and a penalty window once a request was refused, like the API that blocks the clients insisting
+        if not self.transcript_rate:
+            return True
+        with self.lock:
+            bucket, now = self.transcript_bucket, time.monotonic()
+            bucket["tokens"] = min(self.transcript_burst, bucket["tokens"] + (now - bucket["updated_at"]) * self.transcript_rate)
+            bucket["updated_at"] = now
+            if now < bucket["penalized_until"]:
+                return False
+            if bucket["tokens"] < 1:
+                bucket["penalized_until"] = now + self.transcript_penalty
+                return False
+            bucket["tokens"] -= 1
+            return True
+
+
+    def handle_post(self, handler: BaseHTTPRequestHandler) -> None:
+        length = int(handler.headers.get("Content-Length", 0))
+        payload = handler.rfile.read(length)
+        request = json.loads(payload or b"{}")
+        if handler.path.split("?")[0] == "/api/public/ingestion":
+            with self.lock:
+                self.stats["ingestion_bytes"] += len(payload)
+            return self.ingest(handler, request)
+        if handler.path.split("?")[0] != "/api/chat":
+            self.count("not_found")
+            return self.send(handler, 404, b"404: Not Found")
+
+        self.count("chat")
+        prompt_tokens = sum(len(message.get("content") or "") for message in request.get("messages", [])) // 4
+        self.count("prompt_tokens", prompt_tokens)
+        tokens = self.answer(request)
+        self.load(request)
+        with self.slots:
+            start = time.perf_counter()
+            time.sleep(prompt_tokens / self.prefill_tps)
+            prefill = time.perf_counter() - start
+            if request.get("stream", True):
+                self.stream_answer(handler, request, tokens, prompt_tokens, prefill)
+            else:
+                time.sleep(len(tokens) / self.decode_tps)
+                body = self.chunk(request, "".join(tokens), True, prompt_tokens, len(tokens), prefill, time.perf_counter() - start - prefill)
+                self.send(handler, 200, body, "application/json")
+
+
+    def ingest(self, handler: BaseHTTPRequestHandler, request: dict) -> None:
+        batch = request.get("batch", [])
+        time.sleep(self.collector_delay)
+        with self.lock:
+            self.stats["ingestion_batches"] += 1
+            self.stats["ingestion_events"] += len(batch)
+        successes = [{"id": event.get("id"), "status": 201} for event in batch]
+        self.send(handler, 207, json.dumps({"successes": successes, "errors": []}).encode("utf-8"), "application/json")
+
+
+    def load(self, request: dict) -> None:
+        # Like Ollama, the model is (re)loaded when it isn't resident with the requested context size
+        model = (request.get("model"), (request.get("options") or {}).get("num_ctx"))
+        with self.loading:
+            if model not in self.loaded:
+                self.count("model_loads")
+                time.sleep(self.load_seconds)
+                self.loaded = {model}
+
+
+    def answer(self, request: dict) -> List[str]:
+        seed = int(hashlib.sha256(json.dumps(request.get("messages", [])).encode("utf-8")).hexdigest()[:8], 16)
+        tokens = (request.get("options") or {}).get("num_predict") or self.answer_tokens
+        return [f"{word} " for word in fixture_text(min(tokens, self.answer_tokens), seed).split()]
+
+
+    def chunk(self, request: dict, content: str, done: bool, prompt_tokens: int = 0, eval_tokens: int = 0, prefill: float = 0, decode: float = 0) -> bytes:
+        chunk = {
+            "model": request.get("model", "fake"),
+            "created_at": "2024-01-01T00:00:00Z",
+            "message": {"role": "assistant", "content": content},
+            "done": done,
+        }
+        if done:
+            chunk.update({
+                "done_reason": "stop",
+                "prompt_eval_count": prompt_tokens,
+                "prompt_eval_duration": int(prefill * 1e9),
+                "eval_count": eval_tokens,
+                "eval_duration": int(decode * 1e9),
+                "total_duration": int((prefill + decode) * 1e9),
+            })
+        return json.dumps(chunk).encode("utf-8") + b"\n"
+
+
+    def stream_answer(self, handler: BaseHTTPRequestHandler, request: dict, tokens: List[str], prompt_tokens: int, prefill: float) -> None:
+        handler.send_response(200)
+        handler.send_header("Content-Type", "application/x-ndjson")
+        handler.send_header("Transfer-Encoding", "chunked")
+        handler.end_headers()
+
+        def write(data: bytes) -> None:
+            handler.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+            handler.wfile.flush()
+
+        start = time.perf_counter()
+        for token in tokens:
+            time.sleep(1 / self.decode_tps)
+            write(self.chunk(request, token, False))
+        write(self.chunk(request, "", True, prompt_tokens, len(tokens), prefill, time.perf_counter() - start))
+        handler.wfile.write(b"0\r\n\r\n")
+
+
+def _rewrite(request: httpx.Request, base: httpx.URL) -> httpx.Request:
+    headers = httpx.Headers(request.headers)
+    headers["Host"] = base.netloc.decode("ascii")
+    headers["X-Forwarded-Host"] = request.url.host
+    url = request.url.copy_with(scheme=base.scheme, host=base.host, port=base.port)
+    return httpx.Request(request.method, url, headers=headers, stream=request.stream, extensions=request.extensions)
+
+
+class RewriteTransport(httpx.BaseTransport):
+    def __init__(self, base_url: str, limits: Optional[httpx.Limits] = None) -> None:
+        self.base = httpx.URL(base_url)
+        self.transport = httpx.HTTPTransport(limits=limits or httpx.Limits(max_connections=100, max_keepalive_connections=100))
+
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        return self.transport.handle_request(_rewrite(request, self.base))
+
+
+    def close(self) -> None:
+        self.transport.close()
+
+
+class AsyncRewriteTransport(httpx.AsyncBaseTransport):
+    def __init__(self, base_url: str, limits: Optional[httpx.Limits] = None) -> None:
+        self.base = httpx.URL(base_url)
+        self.transport = httpx.AsyncHTTPTransport(limits=limits or httpx.Limits(max_connections=100, max_keepalive_connections=100))
+
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        return await self.transport.handle_async_request(_rewrite(request, self.base))
+
+
+    async def aclose(self) -> None:
+        await self.transport.aclose()
+
+
+def install(services: FakeServices) -> HttpClient:
+    """
+    Route all the traffic of the shared HTTP client to the fake services
+    """
+    client = HttpClient(transport=RewriteTransport(services.url), async_transport=AsyncRewriteTransport(services.url))
+    set_http_client(client)
+    return client
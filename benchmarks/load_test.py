@@ -0,0 +1,294 @@
+"""
+Load test of the pipelines against the local fake services (benchmarks/fake_services.py):
+nothing leaves the machine, the fake Ollama simulates prefill and decode times.
+
+Targets:
+    bbc_digest      bbc_news_daily_feeds pipe, multi-category digest (feeds only, no LLM call)
+    bbc_article     bbc_news_daily_feeds pipe, article summarized with a Fabric pattern
+    youtube         download_youtube_transcripts pipe, transcripts seeded in the transcript cache
+    inlet           fabric_integration inlet (async)
+    inlet_blocking  fabric_integration inlet with the blocking Fabric.apply_pattern, the previous behaviour
+
+Each target runs at each concurrency level and reports throughput, p50/p95/p99
+latency, time to the first chunk of streamed answers and the peak RSS of the
+process. Save a run with --save and check a later one with --compare: the exit
+status is 1 when throughput drops or p95 grows by more than --tolerance.
+
+The LLM response cache is disabled unless --llm-cache is passed, so the model
+path is measured.
+
+Usage (from the repository root, inside the pipelines server environment):
+    python -m benchmarks.load_test [--targets bbc_digest youtube inlet] [--concurrency 1 4 16] [--stream]
+        [--save baseline.json] [--compare baseline.json --tolerance 0.2]
+"""
+import io
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+import threading
+import contextlib
+import statistics
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional
+
+TARGETS = ["bbc_digest", "bbc_article", "youtube", "inlet", "inlet_blocking"]
+
+
+class RSSSampler:
+    """
+    Peak resident memory of the process while a target runs, sampled from /proc (ru_maxrss elsewhere)
+    """
+    def __init__(self, interval: float = 0.02) -> None:
+        self.interval = interval
+        self.peak = 0
+        self.running = False
+        self.thread: Optional[threading.Thread] = None
+
+
+    @staticmethod
+    def rss() -> int:
+        try:
+            with open("/proc/self/statm") as statm:
+                return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except (OSError, ValueError):
+            import resource
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+    def __enter__(self) -> "RSSSampler":
+        self.peak = self.rss()
+        self.running = True
+        self.thread = threading.Thread(target=self.__sample, daemon=True)
+        self.thread.start()
+        return self
+
+
+    def __exit__(self, *args) -> None:
+        self.running = False
+        self.thread.join()
+
+
+    def __sample(self) -> None:
+        while self.running:
+            self.peak = max(self.peak, self.rss())
+            time.sleep(self.interval)
+
+
+def consume(result, started: float) -> tuple:
+    # Read the whole answer like the pipelines server does, noting when the first chunk arrived
+    if isinstance(result, (str, dict)) or result is None:
+        return str(result), time.perf_counter() - started
+    first, parts = None, []
+    for part in result:
+        if first is None:
+            first = time.perf_counter() - started
+        parts.append(part)
+    return "".join(parts), first
+
+
+def percentile(values: List[float], percent: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, round(percent / 100 * len(values) + 0.5) - 1))
+    return values[index]
+
+
+def run_threads(call: Callable[[int], object], concurrency: int, count: int) -> tuple:
+    def one(index: int) -> tuple:
+        started = time.perf_counter()
+        output, first = consume(call(index), started)
+        return time.perf_counter() - started, first, output
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        return list(executor.map(one, range(count)))
+
+
+# One event loop for the whole run, like the pipelines server: the pooled async connections are bound to it
+LOOP = asyncio.new_event_loop()
+
+
+def run_async(call: Callable[[int], object], concurrency: int, count: int) -> list:
+    async def main() -> list:
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def one(index: int) -> tuple:
+            async with semaphore:
+                started = time.perf_counter()
+                output = await call(index)
+                elapsed = time.perf_counter() - started
+                return elapsed, elapsed, str(output)
+
+        return await asyncio.gather(*(one(index) for index in range(count)))
+    return LOOP.run_until_complete(main())
+
+
+def build_targets(args) -> dict:
+    from benchmarks.fake_services import ARTICLE_IDS, VIDEO_IDS, fixture_transcript, fixture_text
+    from utils.pipelines.store import get_store
+    from pipelines.bbc_news_daily_feeds import Pipeline as BBCPipeline
+    from pipelines.download_youtube_transcripts import Pipeline as YouTubePipeline
+
+    def pipeline(cls):
+        instance = cls()
+        instance.valves.OLLAMA_HOST = "http://ollama.local:11434"
+        instance.valves.OLLAMA_MODEL_NAME = "fake"
+        instance.set_llm()
+        return instance
+
+    bbc, youtube = pipeline(BBCPipeline), pipeline(YouTubePipeline)
+    body = {"stream": args.stream, "messages": []}
+
+    store = get_store("youtube_transcripts", ttl=0, max_bytes=1 << 30)
+    for video_id in VIDEO_IDS:
+        store.set_text(f"{video_id}:en", fixture_transcript(video_id, args.video_minutes))
+
+    def bbc_digest(index: int):
+        message = "give me the daily digest of world, business and technology news"
+        return bbc.pipe(message, "bbc", [], body)
+
+    def bbc_article(index: int):
+        message = f"summarize https://www.bbc.com/news/articles/{ARTICLE_IDS[index % len(ARTICLE_IDS)]}"
+        return bbc.pipe(message, "bbc", [], body)
+
+    def youtube_summary(index: int):
+        message = f"summarize https://www.youtube.com/watch?v={VIDEO_IDS[index % len(VIDEO_IDS)]}"
+        return youtube.pipe(message, "youtube", [], body)
+
+    targets = {
+        "bbc_digest": (run_threads, bbc_digest),
+        "bbc_article": (run_threads, bbc_article),
+        "youtube": (run_threads, youtube_summary),
+    }
+    if not {"inlet", "inlet_blocking"} & set(args.targets):
+        return targets
+
+    # Only for the filter targets: the filter imports the schemas module of the pipelines server
+    from filters.fabric_integration import Pipeline as FilterPipeline, Fabric as FilterFabric
+
+    inlet = pipeline(FilterPipeline)
+
+    def inlet_body(index: int) -> dict:
+        return {"messages": [{"role": "user", "content": f"summarize {fixture_text(400, index)}"}]}
+
+    async def inlet_async(index: int):
+        result = await inlet.inlet(inlet_body(index))
+        return result["messages"][-1]["content"]
+
+    async def inlet_blocking(index: int):
+        fabric = FilterFabric(inlet.llm, inline_translation=inlet.valves.INLINE_TRANSLATION)
+        fabric.set_user_message(inlet_body(index)["messages"][-1]["content"])
+        fabric.find_pattern()
+        return fabric.apply_pattern()
+
+    return {
+        **targets,
+        "inlet": (run_async, inlet_async),
+        "inlet_blocking": (run_async, inlet_blocking),
+    }
+
+
+def compare(results: List[dict], baseline_path: str, tolerance: float) -> List[str]:
+    with open(baseline_path) as baseline_file:
+        baseline = {(result["target"], result["concurrency"]): result for result in json.load(baseline_file)}
+    regressions = []
+    for result in results:
+        previous = baseline.get((result["target"], result["concurrency"]))
+        if previous is None:
+            continue
+        name = f"{result['target']} x{result['concurrency']}"
+        if result["throughput"] < previous["throughput"] * (1 - tolerance):
+            regressions.append(f"{name}: throughput {previous['throughput']:.2f} -> {result['throughput']:.2f} req/s")
+        if result["p95_ms"] > previous["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {previous['p95_ms']:.0f} -> {result['p95_ms']:.0f} ms")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--targets", nargs="+", choices=TARGETS, default=TARGETS)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--requests", type=int, default=4, help="requests per concurrent client")
+    parser.add_argument("--stream", action="store_true", help="ask the pipelines for streamed answers")
+    parser.add_argument("--prefill-tps", type=float, default=8000, help="fake Ollama prompt tokens per second")
+    parser.add_argument("--decode-tps", type=float, default=400, help="fake Ollama generated tokens per second")
+    parser.add_argument("--answer-tokens", type=int, default=100, help="tokens of the fake answers")
+    parser.add_argument("--slots", type=int, default=4, help="fake OLLAMA_NUM_PARALLEL")
+    parser.add_argument("--video-minutes", type=int, default=20, help="length of the fixture transcripts")
+    parser.add_argument("--llm-cache", action="store_true", help="keep the LLM response cache enabled")
+    parser.add_argument("--metrics", action="store_true", help="enable the pipelines metrics and print them at the end")
+    parser.add_argument("--verbose", action="store_true", help="print the errors")
+    parser.add_argument("--save", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="baseline JSON file to check the results against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative regression")
+    args = parser.parse_args()
+
+    os.environ["PIPELINES_CACHE_DIR"] = tempfile.mkdtemp(prefix="load-test-")
+    if args.metrics:
+        os.environ["PIPELINES_METRICS"] = "1"
+    if not args.llm_cache:
+        os.environ["LLM_CACHE_MAX_BYTES"] = "0"
+    from benchmarks.fake_services import FakeServices, install
+
+    results = []
+    with FakeServices(args.prefill_tps, args.decode_tps, args.answer_tokens, args.slots) as services:
+        client = install(services)
+        with contextlib.redirect_stdout(io.StringIO()):
+            targets = build_targets(args)
+
+        print(f"{'target':>15} {'conc':>5} {'reqs':>5} {'errors':>6} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'ttfc ms':>8} {'peak MB':>8}")
+        for target in args.targets:
+            runner, call = targets[target]
+            for concurrency in args.concurrency:
+                count = concurrency * args.requests
+                with RSSSampler() as sampler, contextlib.redirect_stdout(io.StringIO()):
+                    started = time.perf_counter()
+                    runs = runner(call, concurrency, count)
+                    elapsed = time.perf_counter() - started
+
+                latencies = [run[0] * 1e3 for run in runs]
+                firsts = [run[1] * 1e3 for run in runs if run[1] is not None]
+                result = {
+                    "target": target,
+                    "concurrency": concurrency,
+                    "requests": count,
+                    "errors": sum(1 for run in runs if run[2].startswith("Error")),
+                    "throughput": count / elapsed,
+                    "p50_ms": percentile(latencies, 50),
+                    "p95_ms": percentile(latencies, 95),
+                    "p99_ms": percentile(latencies, 99),
+                    "first_chunk_p50_ms": statistics.median(firsts) if firsts else 0.0,
+                    "peak_rss_mb": sampler.peak / 1024 / 1024,
+                }
+                results.append(result)
+                if args.verbose:
+                    for run in runs:
+                        if run[2].startswith("Error"):
+                            print(f"{target}: {run[2][:200]}", file=sys.stderr)
+                print(
+                    f"{target:>15} {concurrency:>5} {count:>5} {result['errors']:>6} {result['throughput']:>8.2f} "
+                    f"{result['p50_ms']:>8.0f} {result['p95_ms']:>8.0f} {result['p99_ms']:>8.0f} "
+                    f"{result['first_chunk_p50_ms']:>8.0f} {result['peak_rss_mb']:>8.1f}"
+                )
+        print(f"fake services: {services.stats}")
+        print(f"HTTP connections: {client.stats()}")
+        if args.metrics:
+            from utils.pipelines.metrics import render
+            print(render())
+
+    if args.save:
+        with open(args.save, "w") as save_file:
+            json.dump(results, save_file, indent=2)
+    if args.compare:
+        regressions = compare(results, args.compare, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -9,7 +9,9 @@ license: MIT
 import os
 import re
 import json
-import requests
+import time
+import httpx
+import asyncio
 from enum import Enum
 from pathlib import Path
 from bs4 import BeautifulSoup
@@ -23,6 +25,13 @@ from llama_index.core.schema import Document
 from llama_index.core.llms import ChatMessage, ChatResponse
 
 from utils.pipelines.main import get_last_user_message, get_last_assistant_message
+from utils.pipelines.http_client import aclose_http_client, get_http_client
+from utils.pipelines.llm_cache import get_llm_cache
+from utils.pipelines.metrics import span, inc, observe_llm
+from utils.pipelines.pattern_cache import get_pattern_cache
+from utils.pipelines.pattern_pack import get_pattern_pack, is_pattern_name, sanitize_pattern
+from utils.pipelines.router import PatternRouter
+from utils.pipelines.warmup import WarmUp, keep_alive
 
 BASE_DIR = Path(__file__).parent
 
@@ -40,6 +49,18 @@ class Pipeline:
             default=os.getenv("OLLAMA_MODEL_NAME", "llama3.1"),
             description="The OLLAMA model name"
         )
+        INLINE_TRANSLATION: bool = Field(
+            default=True,
+            description="Ask the model to answer directly in the requested language instead of translating the English answer with a second call"
+        )
+        WARM_UP: bool = Field(
+            default=True,
+            description="Prefetch the Fabric patterns and load the Ollama model at startup, so the first request is as fast as the next ones"
+        )
+        ALL_PATTERNS: bool = Field(
+            default=False,
+            description="Rewrite the messages asking for any pattern (analyze, translate, the pattern pack...), not only summarize. This filter runs on every pipeline"
+        )
 
 
     def __init__(self):
@@ -48,6 +69,7 @@ class Pipeline:
         self.DEBUG = os.getenv("DEBUG", False)
         self.name = "Fabric Patterns integration filter"
         self.llm: Ollama = None
+        self.warmup = WarmUp(self.name)
         self.valves = self.Valves(
             **{
                 "pipelines": ["*"],  # Connect to all pipelines
@@ -60,16 +82,33 @@ class Pipeline:
     async def on_startup(self):
         print(f"on_startup:{__name__}")
         self.set_llm()
+        self.start_warm_up()
         
 
     async def on_valves_updated(self):
         print(f"on_valves_updated:{__name__}")
         self.set_llm()
+        self.start_warm_up()
 
 
     async def on_shutdown(self):
         print(f"on_shutdown:{__name__}")
+        self.warmup.cancel()
         self.llm = None
+        await aclose_http_client()
+
+
+    def start_warm_up(self):
+        """
+        Prefetch the patterns and load the model in background, self.warmup.ready tells when it's done
+        """
+        if not self.valves.WARM_UP or self.llm is None:
+            return
+        fabric = Fabric(self.llm)
+        self.warmup.start({
+            "patterns": fabric.aprefetch_patterns,
+            "model": lambda: keep_alive(self.llm),
+        })
 
 
     def set_llm(self):
@@ -81,7 +120,8 @@ class Pipeline:
             temperature=0.5,
             top_p=1,
             frequency_penalty=0.1,
-            presence_penalty=0.1
+            presence_penalty=0.1,
+            **get_http_client().ollama_clients(self.valves.OLLAMA_HOST, 180.0)
         )
         return self.llm
 
@@ -91,17 +131,21 @@ class Pipeline:
         if self.DEBUG: print(f"Body: {body}")
         if self.DEBUG: print(f"OLLAMA_HOST: {self.valves.OLLAMA_HOST}")
         if self.DEBUG: print(f"OLLAMA_MODEL_NAME: {self.valves.OLLAMA_MODEL_NAME}")
+        if self.DEBUG: print(f"HTTP connections: {get_http_client().stats()}")
 
         messages = body["messages"]
         user_message = get_last_user_message(messages)
         print(f"User message: {user_message}")		
 
-        self.fabric = Fabric(self.llm)
-        self.fabric.set_user_message(user_message)
-        self.fabric.find_pattern()
+        # Local instance, concurrent inlets must not share the Fabric state
+        fabric = Fabric(self.llm, inline_translation=self.valves.INLINE_TRANSLATION)
+        fabric.set_user_message(user_message)
+        fabric.find_pattern()
 
-        if self.fabric.get_pattern() in self.fabric.get_patterns():
-            filtered_user_message = self.fabric.apply_pattern()
+        # Only the summarize requests by default: a message merely containing "translate" or "analyze" is left alone
+        if fabric.get_pattern() in fabric.get_patterns() or (self.valves.ALL_PATTERNS and fabric.get_pattern()):
+            with span("inlet", pipeline="fabric_filter"):
+                filtered_user_message = await fabric.aapply_pattern()
             for message in reversed(messages):
                 if message["role"] == "user":
                     message["content"] = filtered_user_message
@@ -123,9 +167,7 @@ class Pipeline:
 
 
 class Fabric():
-    # Define the allowlist of characters
     DEBUG = os.getenv("DEBUG", False)
-    ALLOWLIST_PATTERN = re.compile(r"^[a-zA-Z0-9\s.,;:!?\-]+$")
     PROMPTS = {
         'translate_to_english': """Translate the following text to English. Provide only the translated text and nothing else.
 """,
@@ -146,18 +188,38 @@ class Fabric():
             'traduci': PROMPTS['translate_to_italian']
         }
     }
+    ROUTER = PatternRouter(PATTERNS["languages"], PATTERNS["patterns"])
+    # (pack, router) once a pattern pack is found, see get_router
+    PACK_ROUTER = None
+    LANGUAGE_PROMPT = """
+Write the whole output in {language}, whatever the language of the input.
+"""
 
 
-    def __init__(self, llm: Ollama) -> None:
+    def __init__(self, llm: Ollama, inline_translation: bool = True) -> None:
         self.system_pattern_message = ChatMessage(role="system")
         self.user_pattern_message = ChatMessage(role="user")
         self.user_message = None
         self.pattern = None
         self.llm = llm
         self.language = "en"
+        self.inline_translation = inline_translation
         self.__set_translation_prompt()
 
 
+    @classmethod
+    def get_router(cls) -> PatternRouter:
+        """
+        The keyword router, extended with the names of the patterns of the pattern pack when there is one
+        """
+        pack = get_pattern_pack()
+        if pack is None:
+            return cls.ROUTER
+        if cls.PACK_ROUTER is None or cls.PACK_ROUTER[0] is not pack:
+            cls.PACK_ROUTER = (pack, PatternRouter(cls.PATTERNS["languages"], {**pack.keywords(), **cls.PATTERNS["patterns"]}))
+        return cls.PACK_ROUTER[1]
+
+
     def get_patterns(self) -> dict:
         return self.PATTERNS['patterns']
 
@@ -186,26 +248,16 @@ class Fabric():
 
     def find_pattern(self) -> None:
         """
-        Check for the pattern to apply if any and set the pattern attribute
+        Check for the pattern and the language to apply if any and set the related attributes
         """
-        found = None
-        self.pattern = None
-        for lang in self.get_available_languages():
-            reg = fr'\b{re.escape(lang.lower())}\b'
-            langfound = re.search(reg, self.user_message.lower())
-            self.language = lang.lower() if langfound else "en"
+        language, self.pattern = self.get_router().route(self.user_message)
+        self.language = language if language else "en"
 
         if self.DEBUG: print(f"Language: {self.language}")
-
-        for target, fn in self.get_patterns().items():
-            reg = fr'\b{re.escape(target.lower())}\b'
-            found = re.search(reg, self.user_message.lower())
-            self.pattern = fn if found else self.pattern                    
-
         if self.DEBUG: print(f"Pattern: {self.pattern}")
 
 
-    def apply_pattern(self, message: str = Optional[str], pattern: Optional[str] = Optional[str]) -> str:
+    def apply_pattern(self, message: Optional[str] = None, pattern: Optional[str] = None) -> str:
         """
         Apply the pattern to return the assistant content
 
@@ -217,27 +269,76 @@ class Fabric():
         """
         content = message if message else self.get_user_message()
         self.pattern = pattern if pattern else self.pattern
-        if len(self.pattern) < 30:
-            system_url = f"https://raw.githubusercontent.com/danielmiessler/fabric/main/patterns/{self.pattern}/system.md"
-            user_url = f"https://raw.githubusercontent.com/danielmiessler/fabric/main/patterns/{self.pattern}/user.md"
-
-            # Fetch the prompt content
-            try:
-                system_content = self.__fetch_content_from_url(system_url)
-                user_file_content = self.__fetch_content_from_url(user_url)
-            except Exception as e:
-                if not self.pattern:
-                    return f"Pattern not found in Fabric: {str(e)}"
-        else:
-            system_content = self.pattern
+        system_content, user_file_content = self.pattern, None
+        if is_pattern_name(self.pattern):
+            system_url, user_url = self.__get_pattern_urls()
+            system_content = self.__fetch_content_from_url(system_url)
+            user_file_content = self.__fetch_content_from_url(user_url)
+
+        self.__call_ollama(self.__localize_messages(self.__get_pattern_messages(content, system_content, user_file_content)))
+        if self.__translation_needed():
+            with span("translate"):
+                self.__call_ollama(self.__get_translation_messages())
+        return self.get_response_content()
+
+
+    async def aapply_pattern(self, message: Optional[str] = None, pattern: Optional[str] = None) -> str:
+        """
+        Apply the pattern to return the assistant content, without blocking the event loop:
+        the pattern files are fetched concurrently and Ollama is called with its async client
 
+        Args:
+            message (str): user message
+
+        Returns:
+            str: response content from llama-index Ollama
+        """
+        content = message if message else self.get_user_message()
+        self.pattern = pattern if pattern else self.pattern
+        system_content, user_file_content = self.pattern, None
+        if is_pattern_name(self.pattern):
+            system_url, user_url = self.__get_pattern_urls()
+            system_content, user_file_content = await asyncio.gather(
+                self.__afetch_content_from_url(system_url),
+                self.__afetch_content_from_url(user_url)
+            )
+
+        await self.__acall_ollama(self.__localize_messages(self.__get_pattern_messages(content, system_content, user_file_content)))
+        if self.__translation_needed():
+            with span("translate"):
+                await self.__acall_ollama(self.__get_translation_messages())
+        return self.get_response_content()
+
+
+    def __get_pattern_urls(self):
+        system_url = f"https://raw.githubusercontent.com/danielmiessler/fabric/main/patterns/{self.pattern}/system.md"
+        user_url = f"https://raw.githubusercontent.com/danielmiessler/fabric/main/patterns/{self.pattern}/user.md"
+        return system_url, user_url
+
+
+    def __get_pattern_messages(self, content: str, system_content: str, user_file_content: Optional[str]) -> List[ChatMessage]:
         self.system_pattern_message.content = system_content
         self.user_pattern_message.content = user_file_content + "\n" + content if user_file_content else content
-        messages: List[ChatMessage] = [self.system_pattern_message, self.user_pattern_message]
-        self.__call_ollama(messages)
-        if self.language and self.language == "it":
-            self.__call_ollama([ChatMessage(role="system", content=self.prompt), ChatMessage(role="user", content=self.get_response_content())])
-        return self.get_response_content()
+        return [self.system_pattern_message, self.user_pattern_message]
+
+
+    def __translation_needed(self) -> bool:
+        # The answer is already localized when the language instruction is in the system message
+        return self.language == "it" and not self.inline_translation
+
+
+    def __localize_messages(self, messages: List[ChatMessage]) -> List[ChatMessage]:
+        '''
+        Add the target language instruction to the system message, so that one generation gives the localized answer
+        '''
+        if not self.inline_translation or not self.language or self.language == "en":
+            return messages
+        instruction = self.LANGUAGE_PROMPT.format(language=self.get_available_languages()[self.language])
+        return [ChatMessage(role="system", content=(messages[0].content or "") + "\n" + instruction)] + messages[1:]
+
+
+    def __get_translation_messages(self) -> List[ChatMessage]:
+        return [ChatMessage(role="system", content=self.prompt), ChatMessage(role="user", content=self.get_response_content())]
 
 
     def apply_extra_pattern(self, prompt_template: PromptTemplate, message):
@@ -250,32 +351,81 @@ class Fabric():
         self.prompt = """Translate the following text to Italian
     """
 
+    async def aprefetch_patterns(self) -> str:
+        """
+        Download the files of every pattern in PATTERNS into the local pattern cache, concurrently
+
+        Returns:
+            str: the number of patterns cached
+        """
+        names = sorted({pattern for pattern in self.get_patterns().values() if is_pattern_name(pattern)})
+        pack = get_pattern_pack()
+        urls = [
+            f"https://raw.githubusercontent.com/danielmiessler/fabric/main/patterns/{name}/{file}"
+            for name in names if pack is None or name not in pack
+            for file in ("system.md", "user.md")
+        ]
+        cache = get_pattern_cache()
+        outcomes = await asyncio.gather(*(cache.aget(url, self.__sanitize_content) for url in urls), return_exceptions=True)
+        errors = [outcome for outcome in outcomes if isinstance(outcome, Exception)]
+        if errors:
+            raise errors[0]
+        return f"{len(names)} patterns"
+
+
     # Pull the URL content's from the GitHub repo
     def __fetch_content_from_url(self, url):
-        """    Fetches content from the given URL.
+        """    Fetches content from the given URL through the local pattern cache.
 
         Args:
             url (str): The URL from which to fetch content.
 
         Returns:
-            str: The sanitized content fetched from the URL.
+            str: The sanitized content fetched from the URL or from the cache.
 
         Raises:
-            requests.RequestException: If an error occurs while making the request to the URL.
+            httpx.HTTPError: If an error occurs while making the request to the URL.
         """
 
+        pack = get_pattern_pack()
+        content = pack.lookup_url(url) if pack is not None else None
+        if content is not None:
+            return content
+
         try:
-            response = requests.get(url)
-            response.raise_for_status()
-            sanitized_content = self.__sanitize_content(response.text)
+            with span("pattern_fetch"):
+                sanitized_content = get_pattern_cache().get(url, self.__sanitize_content)
+            if self.DEBUG: print(f"Fabric pattern cache: {get_pattern_cache().stats}")
             return sanitized_content
-        except requests.RequestException as e:
+        except httpx.HTTPError as e:
+            return f"Error fetching Fabric Patterns: {str(e)}"
+
+
+    async def __afetch_content_from_url(self, url):
+        """    Fetches content from the given URL through the local pattern cache, without blocking the event loop.
+
+        Args:
+            url (str): The URL from which to fetch content.
+
+        Returns:
+            str: The sanitized content fetched from the URL or from the cache.
+        """
+
+        pack = get_pattern_pack()
+        content = pack.lookup_url(url) if pack is not None else None
+        if content is not None:
+            return content
+
+        try:
+            with span("pattern_fetch"):
+                return await get_pattern_cache().aget(url, self.__sanitize_content)
+        except httpx.HTTPError as e:
             return f"Error fetching Fabric Patterns: {str(e)}"
         
 
     # Sanitize the content, sort of. Prompt injection is the main threat so this isn't a huge deal
     def __sanitize_content(self, content):
-        """    Sanitize the content by removing characters that do not match the ALLOWLIST_PATTERN.
+        """    Sanitize the content by removing the characters outside the allowlist (letters, digits, whitespace and .,;:!?-).
 
         Args:
             content (str): The content to be sanitized.
@@ -284,7 +434,21 @@ class Fabric():
             str: The sanitized content.
         """
 
-        return "".join(char for char in content if self.ALLOWLIST_PATTERN.match(char))
+        return sanitize_pattern(content)
+
+
+    def __lookup_cache(self, messages: List[ChatMessage]) -> tuple:
+        '''
+        Returns the LLM response cache (None when disabled), the key of the request and the cached answer if any
+        '''
+        cache = get_llm_cache()
+        if cache is None:
+            return None, None, None
+        key = cache.key(self.llm, messages, self.language)
+        cached = cache.get(key)
+        inc("llm_cache_total", result="miss" if cached is None else "hit")
+        if self.DEBUG and cached is not None: print(f"LLM response cache hit: {cache.stats}")
+        return cache, key, cached
 
 
     def __call_ollama(self, messages: List[ChatMessage]) -> None:
@@ -296,10 +460,41 @@ class Fabric():
         Returns:
             str: the response content
         '''
+        cache, key, cached = self.__lookup_cache(messages)
+        if cached is not None:
+            self.response = ChatResponse(message=ChatMessage(role="assistant", content=cached))
+            return
+
         # Build the API call
         try:
             if self.DEBUG: print(f"Ollama Client: {self.llm}")
+            started = time.perf_counter()
             self.response: ChatResponse = self.llm.chat(messages)
+            observe_llm(self.llm.model, self.response.raw, started)
         except Exception as e:
             self.response = f"Error with the Ollama call in Fabric pattern workflow: {str(e)}"
+            return
+        if cache: cache.set(key, self.response.message.content)
+
 
+    async def __acall_ollama(self, messages: List[ChatMessage]) -> None:
+        ''' 
+        Call OLLAMA API with the async client
+        Args:
+            messages (List[ChatMessage]): a List of ChatMessages with user message and system message
+        '''
+        # The cache is SQLite (locks, busy timeout, eviction): off the event loop, like the model call
+        cache, key, cached = await asyncio.to_thread(self.__lookup_cache, messages)
+        if cached is not None:
+            self.response = ChatResponse(message=ChatMessage(role="assistant", content=cached))
+            return
+
+        try:
+            if self.DEBUG: print(f"Ollama Client: {self.llm}")
+            started = time.perf_counter()
+            self.response: ChatResponse = await self.llm.achat(messages)
+            observe_llm(self.llm.model, self.response.raw, started)
+        except Exception as e:
+            self.response = f"Error with the Ollama call in Fabric pattern workflow: {str(e)}"
+            return
+        if cache: await asyncio.to_thread(cache.set, key, self.response.message.content)
@@ -2,17 +2,20 @@
 title: Langfuse Filter Pipeline
 author: open-webui
 date: 2024-09-27
-version: 1.4
+version: 1.6
 license: MIT
-description: A filter pipeline that uses Langfuse.
+description: A filter pipeline that uses Langfuse. Traces are sampled and reduced before they are sent.
 requirements: langfuse
 """
 
 from typing import List, Optional
 import os
 import uuid
+import asyncio
 
 from utils.pipelines.main import get_last_assistant_message
+from utils.pipelines.metrics import inc
+from utils.pipelines.trace_export import PAYLOAD_POLICIES, TTLTable, apply_messages_policy, apply_payload_policy, parse_rates, sampled
 from pydantic import BaseModel
 from langfuse import Langfuse
 from langfuse.api.resources.commons.errors.unauthorized_error import UnauthorizedError
@@ -31,6 +34,21 @@ class Pipeline:
         secret_key: str
         public_key: str
         host: str
+        # The SDK sends the events from a background thread, in batches of flush_at events or every flush_interval seconds
+        flush_at: int = 15
+        flush_interval: float = 0.5
+        # Generations waiting for their outlet, the older ones are ended as incomplete
+        max_pending_generations: int = 10000
+        pending_generation_ttl: int = 3600
+        # Share of the chats traced (head sampling by chat), overridden per user email or model
+        # with "key=rate" lists, i.e. "llama3:8b=0.5, mistral=1". Token usage is counted for every chat.
+        sample_rate: float = 1.0
+        user_sample_rates: str = ""
+        model_sample_rates: str = ""
+        # What the traces keep of the messages: full, truncate (to max_payload_chars), hash, last_n (last_n_messages)
+        payload_policy: str = "full"
+        max_payload_chars: int = 2000
+        last_n_messages: int = 4
 
     def __init__(self):
         self.type = "filter"
@@ -43,19 +61,59 @@ class Pipeline:
                 "host": os.getenv("LANGFUSE_HOST", "https://cloud.langfuse.com"),
             }
         )
+        self.DEBUG = os.getenv("DEBUG", False)
         self.langfuse = None
-        self.chat_generations = {}
+        self.chat_generations = self.new_generation_table()
+        self.user_sample_rates = {}
+        self.model_sample_rates = {}
+        # Exact token usage per model, sampled or not: {model: {"turns", "input", "output"}}
+        self.usage = {}
 
     async def on_startup(self):
         print(f"on_startup:{__name__}")
-        self.set_langfuse()
+        self.set_sampling()
+        # The credentials check is a blocking HTTP call
+        await asyncio.to_thread(self.set_langfuse)
 
     async def on_shutdown(self):
         print(f"on_shutdown:{__name__}")
-        self.langfuse.flush()
+        if self.langfuse is not None:
+            await asyncio.to_thread(self.langfuse.flush)
+        print(f"Token usage: {self.usage}")
 
     async def on_valves_updated(self):
-        self.set_langfuse()
+        # Lower caps apply to the generations already pending too
+        self.chat_generations.max_entries = self.valves.max_pending_generations
+        self.chat_generations.ttl = self.valves.pending_generation_ttl
+        self.chat_generations.purge()
+        self.set_sampling()
+        await asyncio.to_thread(self.set_langfuse)
+
+    def set_sampling(self):
+        self.user_sample_rates = parse_rates(self.valves.user_sample_rates)
+        self.model_sample_rates = parse_rates(self.valves.model_sample_rates)
+        if self.valves.payload_policy not in PAYLOAD_POLICIES:
+            print(f"Unknown payload_policy {self.valves.payload_policy}, expected one of {', '.join(PAYLOAD_POLICIES)}: using truncate")
+            self.valves.payload_policy = "truncate"
+
+    def sample_rate(self, body: dict, user: dict) -> float:
+        if user.get("email") in self.user_sample_rates:
+            return self.user_sample_rates[user["email"]]
+        if body.get("model") in self.model_sample_rates:
+            return self.model_sample_rates[body["model"]]
+        return self.valves.sample_rate
+
+    def reduce_messages(self, messages: List[dict]) -> List[dict]:
+        return apply_messages_policy(
+            messages, self.valves.payload_policy, self.valves.max_payload_chars, self.valves.last_n_messages
+        )
+
+    def new_generation_table(self) -> TTLTable:
+        return TTLTable(
+            max_entries=self.valves.max_pending_generations,
+            ttl=self.valves.pending_generation_ttl,
+            on_evict=self.end_incomplete_generation,
+        )
 
     def set_langfuse(self):
         try:
@@ -63,6 +121,8 @@ class Pipeline:
                 secret_key=self.valves.secret_key,
                 public_key=self.valves.public_key,
                 host=self.valves.host,
+                flush_at=self.valves.flush_at,
+                flush_interval=self.valves.flush_interval,
                 debug=False,
             )
             self.langfuse.auth_check()
@@ -73,16 +133,18 @@ class Pipeline:
         except Exception as e:
             print(f"Langfuse error: {e} Please re-enter your Langfuse credentials in the pipeline settings.")
 
+    def end_incomplete_generation(self, chat_id: str, generation):
+        # No outlet for this chat (aborted, failed...): end the generation instead of leaving it open
+        generation.end(level="WARNING", status_message="No outlet received for this generation")
+
     async def inlet(self, body: dict, user: Optional[dict] = None) -> dict:
-        print(f"inlet:{__name__}")
-        print(f"Received body: {body}")
-        print(f"User: {user}")
+        if self.DEBUG: print(f"inlet:{__name__} chat_id={body.get('chat_id')} messages={len(body.get('messages', []))}")
 
         # Check for presence of required keys and generate chat_id if missing
         if "chat_id" not in body:
             unique_id = f"SYSTEM MESSAGE {uuid.uuid4()}"
             body["chat_id"] = unique_id
-            print(f"chat_id was missing, set to: {unique_id}")
+            if self.DEBUG: print(f"chat_id was missing, set to: {unique_id}")
 
         required_keys = ["model", "messages"]
         missing_keys = [key for key in required_keys if key not in body]
@@ -92,39 +154,46 @@ class Pipeline:
             print(error_message)
             raise ValueError(error_message)
 
+        if self.langfuse is None:
+            return body
+
+        # Head sampling: the chats left out only count their token usage in the outlet
+        user = user or {}
+        rate = self.sample_rate(body, user)
+        if not sampled(body["chat_id"], rate):
+            inc("llm_monitor_chats_total", sampled="false")
+            return body
+        inc("llm_monitor_chats_total", sampled="true")
+
+        messages = self.reduce_messages(body["messages"])
+        metadata = {"interface": "open-webui", "sample_rate": rate, "payload_policy": self.valves.payload_policy}
+        if len(messages) != len(body["messages"]):
+            metadata["messages"] = len(body["messages"])
         trace = self.langfuse.trace(
             name=f"filter:{__name__}",
-            input=body,
-            user_id=user["email"],
-            metadata={"user_name": user["name"], "user_id": user["id"]},
+            input=body if messages is body["messages"] else {**body, "messages": messages},
+            user_id=user.get("email"),
+            metadata={"user_name": user.get("name"), "user_id": user.get("id"), "sample_rate": rate},
             session_id=body["chat_id"],
         )
-
         generation = trace.generation(
             name=body["chat_id"],
             model=body["model"],
-            input=body["messages"],
-            metadata={"interface": "open-webui"},
+            input=messages,
+            metadata=metadata,
         )
 
-        self.chat_generations[body["chat_id"]] = generation
-        print(trace.get_trace_url())
+        self.chat_generations.put(body["chat_id"], generation)
+        if self.DEBUG: print(f"Langfuse trace: {trace.id}")
 
         return body
 
     async def outlet(self, body: dict, user: Optional[dict] = None) -> dict:
-        print(f"outlet:{__name__}")
-        print(f"Received body: {body}")
-        if body["chat_id"] not in self.chat_generations:
-            return body
+        if self.DEBUG: print(f"outlet:{__name__} chat_id={body.get('chat_id')} messages={len(body.get('messages', []))}")
 
-        generation = self.chat_generations[body["chat_id"]]
-        assistant_message = get_last_assistant_message(body["messages"])
-
-        
         # Extract usage information for models that support it
         usage = None
-        assistant_message_obj = get_last_assistant_message_obj(body["messages"])
+        assistant_message_obj = get_last_assistant_message_obj(body.get("messages", []))
         if assistant_message_obj:
             info = assistant_message_obj.get("info", {})
             if isinstance(info, dict):
@@ -136,15 +205,33 @@ class Pipeline:
                         "output": output_tokens,
                         "unit": "TOKENS",
                     }
+        self.count_usage(body.get("model"), usage)
+
+        generation = self.chat_generations.pop(body.get("chat_id"))
+        if generation is None:
+            return body
 
-        # Update generation
+        assistant_message = get_last_assistant_message(body["messages"])
+        if assistant_message is not None:
+            assistant_message = apply_payload_policy(
+                assistant_message, self.valves.payload_policy, self.valves.max_payload_chars
+            )
+
+        # End the generation
         generation.end(
             output=assistant_message,
-            metadata={"interface": "open-webui"},
+            metadata={"interface": "open-webui", "payload_policy": self.valves.payload_policy},
             usage=usage,
         )
 
-        # Clean up the chat_generations dictionary
-        del self.chat_generations[body["chat_id"]]
+        return body
 
-        return body
\ No newline at end of file
+    def count_usage(self, model: Optional[str], usage: Optional[dict]):
+        model = model or "unknown"
+        totals = self.usage.setdefault(model, {"turns": 0, "input": 0, "output": 0})
+        totals["turns"] += 1
+        if usage:
+            totals["input"] += usage["input"]
+            totals["output"] += usage["output"]
+            inc("llm_usage_tokens_total", usage["input"], model=model, kind="input")
+            inc("llm_usage_tokens_total", usage["output"], model=model, kind="output")
@@ -6,26 +6,42 @@ author: Dario Palladino
 author_url: https://github.com/dariopalladino
 version: 0.1.0
 license: MIT
-TODO:
-user message keyworkds based on the ArticleTypes to extract news from that category
-
 """
 import os
 import re
 import json
-import requests
+import hashlib
+import time
+import httpx
+import asyncio
+import threading
 from enum import Enum
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from bs4 import BeautifulSoup
 from dotenv import load_dotenv, find_dotenv
-import xml.etree.ElementTree as ElementTree
-from typing import Awaitable, Callable, Union, Generator, List, Iterator, Optional, Any
+from typing import Awaitable, Callable, Union, Generator, List, Iterator, Optional, Any, Tuple
 from pydantic import BaseModel, Field
 from llama_index.core import ChatPromptTemplate, PromptTemplate
 from llama_index.llms.ollama import Ollama
 from llama_index.core.schema import Document
 from llama_index.core.llms import ChatMessage, ChatResponse
 
+from utils.pipelines.http_client import aclose_http_client, get_http_client
+from utils.pipelines.llm_cache import get_llm_cache
+from utils.pipelines.metrics import span, inc, observe_stage, observe_llm
+from utils.pipelines.pattern_cache import get_pattern_cache
+from utils.pipelines.pattern_pack import get_pattern_pack, is_pattern_name, sanitize_pattern
+from utils.pipelines.article import extract_article_paragraphs
+from utils.pipelines.batch import join_batch, run_batch, stream_batch
+from utils.pipelines.router import PatternRouter
+from utils.pipelines.rss import iter_rss_items
+from utils.pipelines.seen_items import SeenItems, get_seen_items
+from utils.pipelines.singleflight import SingleFlight
+from utils.pipelines.snapshots import Snapshot, SnapshotScheduler
+from utils.pipelines.warmup import WarmUp, keep_alive
+
 
 BASE_DIR = Path(__file__).parent
 
@@ -47,6 +63,50 @@ class Pipeline:
 			default=os.getenv("BBC_FEEDS_DOMAIN", "feeds.bbci.co.uk"),
 			description="The OLLAMA model name"
 		)
+		NATIVE_DIGEST: bool = Field(
+			default=True,
+			description="Render the digest without the LLM, which is then only used when the user asks for a commentary"
+		)
+		BBC_FEEDS_CONCURRENCY: int = Field(
+			default=8,
+			description="Maximum number of BBC feeds fetched at the same time"
+		)
+		STREAMING: bool = Field(
+			default=True,
+			description="Stream the Ollama response to the client as it's generated"
+		)
+		INLINE_TRANSLATION: bool = Field(
+			default=True,
+			description="Ask the model to answer directly in the requested language instead of translating the English answer with a second call"
+		)
+		WARM_UP: bool = Field(
+			default=True,
+			description="Prefetch the Fabric patterns and load the Ollama model at startup, so the first request is as fast as the next ones"
+		)
+		DIGEST_SUBSCRIPTIONS: str = Field(
+			default=os.getenv("BBC_DIGEST_SUBSCRIPTIONS", "top_stories"),
+			description="Digests precomputed in background in every language, categories separated by commas and digests by semicolons (i.e. top_stories;world,business)"
+		)
+		DIGEST_REFRESH_INTERVAL: int = Field(
+			default=int(os.getenv("BBC_DIGEST_REFRESH_INTERVAL", 900)),
+			description="Seconds between two refreshes of the precomputed digests, 0 to compute every digest on the request"
+		)
+		MAX_BATCH_URLS: int = Field(
+			default=10,
+			description="Articles processed from a single message (i.e. \"summarize these BBC articles\"), the next ones are ignored"
+		)
+		BATCH_CONCURRENCY: int = Field(
+			default=4,
+			description="Articles of a message downloaded at the same time"
+		)
+		BATCH_LLM_CONCURRENCY: int = Field(
+			default=2,
+			description="Articles of a message processed by Ollama at the same time"
+		)
+		WHATS_NEW_SCOPE: str = Field(
+			default=os.getenv("BBC_WHATS_NEW_SCOPE", "user"),
+			description="Remember the news shown per 'user' or per 'chat', so that \"what's new\" digests only show the others; 'off' to remember nothing"
+		)
 	
 
 	def __init__(self):
@@ -54,6 +114,11 @@ class Pipeline:
 		self.DEBUG = os.getenv("DEBUG", False)
 		self.name = "BBC News Daily Digest"
 		self.llm: Ollama = None
+		self.warmup = WarmUp(self.name)
+		# Concurrent identical requests (i.e. the morning digest) share one computation
+		self.singleflight = SingleFlight("bbc_news")
+		# Digests of the subscribed categories, refreshed in background and served at once
+		self.digests = SnapshotScheduler("bbc_news")
 		self.valves = self.Valves()
 		print(f"DEBUG: {self.DEBUG}")
 		if self.DEBUG: self.set_llm() # Just for local tests
@@ -62,16 +127,77 @@ class Pipeline:
 	async def on_startup(self):
 		print(f"on_startup:{__name__}")
 		self.set_llm()
+		self.start_warm_up()
+		self.start_digests()
 		
 
 	async def on_valves_updated(self):
 		print(f"on_valves_updated:{__name__}")
 		self.set_llm()
+		self.start_warm_up()
+		self.start_digests()
 
 
 	async def on_shutdown(self):
 		print(f"on_shutdown:{__name__}")
+		self.warmup.cancel()
+		self.digests.cancel()
 		self.llm = None
+		await aclose_http_client()
+
+
+	def start_warm_up(self):
+		"""
+		Prefetch the patterns and load the model in background, self.warmup.ready tells when it's done
+		"""
+		if not self.valves.WARM_UP or self.llm is None:
+			return
+		fabric = Fabric(self.llm)
+		self.warmup.start({
+			"patterns": fabric.aprefetch_patterns,
+			"model": lambda: keep_alive(self.llm, blocking=True),
+		})
+
+
+	def start_digests(self):
+		"""
+		Refresh the digests of DIGEST_SUBSCRIPTIONS, in every language, every DIGEST_REFRESH_INTERVAL seconds in background
+		"""
+		if self.valves.DIGEST_REFRESH_INTERVAL <= 0 or self.llm is None:
+			self.digests.cancel()
+			self.digests.snapshots = {}
+			return
+		jobs = {
+			(language, subscription): self.__digest_job(language, subscription)
+			for subscription in BBCDailyDigest.parse_subscriptions(self.valves.DIGEST_SUBSCRIPTIONS)
+			for language in Fabric.PATTERNS["languages"].values()
+		}
+		self.digests.start(jobs, self.valves.DIGEST_REFRESH_INTERVAL)
+
+
+	def __digest_job(self, language: str, subscription: tuple) -> Callable[[], Snapshot]:
+		def job() -> Snapshot:
+			# Not streamed: the whole digest is kept, and the translation (if any) is done now rather than on the request
+			fabric = Fabric(self.llm, stream=False, inline_translation=self.valves.INLINE_TRANSLATION)
+			fabric.language = language
+			tools = BBCDailyDigest(fabric=fabric, bbc_domain=self.valves.BBC_FEEDS_DOMAIN, max_workers=self.valves.BBC_FEEDS_CONCURRENCY, native_digest=self.valves.NATIVE_DIGEST)
+			content = tools.get_bbc_news_feeds(list(subscription))
+			if not content or str(content).startswith("Error"):
+				raise RuntimeError(content or "No information found")
+			# The items are kept to remember which news the users were shown
+			return Snapshot(content, tools.items)
+		return job
+
+
+	def __format_snapshot(self, snapshot: Snapshot) -> str:
+		"""
+		The precomputed digest, with its age when it's stale
+		"""
+		if snapshot.error is not None:
+			return f"{snapshot.content}\n\n_Digest from {snapshot.describe_age()} ago, the BBC feeds could not be refreshed since._"
+		if self.digests.is_stale(snapshot):
+			return f"{snapshot.content}\n\n_Digest from {snapshot.describe_age()} ago._"
+		return snapshot.content
 
 
 	def set_llm(self):
@@ -83,7 +209,8 @@ class Pipeline:
 			temperature=0.5,
 			top_p=1,
 			frequency_penalty=0.1,
-			presence_penalty=0.1
+			presence_penalty=0.1,
+			**get_http_client().ollama_clients(self.valves.OLLAMA_HOST, 180.0)
 		)
 		return self.llm
 
@@ -97,20 +224,114 @@ class Pipeline:
 		if self.DEBUG: print(f"UserMessage: {user_message}")
 		if self.DEBUG: print(f"OLLAMA_HOST: {self.valves.OLLAMA_HOST}")
 		if self.DEBUG: print(f"OLLAMA_MODEL_NAME: {self.valves.OLLAMA_MODEL_NAME}")
+		if self.DEBUG: print(f"HTTP connections: {get_http_client().stats()}")
 
-		self.fabric = Fabric(self.llm)
-		self.fabric.set_user_message(user_message)
-		self.fabric.find_pattern()
+		# Local instance, concurrent requests must not share the Fabric state
+		fabric = Fabric(
+			self.llm,
+			stream=self.valves.STREAMING and body.get('stream', False),
+			inline_translation=self.valves.INLINE_TRANSLATION
+		)
+		fabric.set_user_message(user_message)
+		fabric.find_pattern()
 
 		if body.get('title', False):
 			return self.__create_title()
-		else:
-			tools = BBCDailyDigest(fabric=self.fabric, bbc_domain=self.valves.BBC_FEEDS_DOMAIN)
-			if self.fabric.get_pattern() in self.fabric.get_patterns():
-				context = tools.get_bbc_news_content(user_message=user_message)
+		with span("pipe", pipeline="bbc_news"):
+			tools = BBCDailyDigest(
+				fabric=fabric,
+				bbc_domain=self.valves.BBC_FEEDS_DOMAIN,
+				max_workers=self.valves.BBC_FEEDS_CONCURRENCY,
+				native_digest=self.valves.NATIVE_DIGEST,
+				max_urls=self.valves.MAX_BATCH_URLS,
+				batch_concurrency=self.valves.BATCH_CONCURRENCY,
+				batch_llm_concurrency=self.valves.BATCH_LLM_CONCURRENCY
+			)
+			# Any pattern, the keyword ones and those of the pattern pack: the user wants an article processed
+			if fabric.get_pattern():
+				key = ("article", fabric.get_pattern(), fabric.language, tools.find_article_urls(user_message))
+				compute = lambda: tools.get_bbc_news_content(user_message=user_message)
+				context = self.singleflight.run(key + self.__settings_key(), compute, stream=fabric.stream)
 			else:
-				context = tools.get_bbc_news_feed("top_stories")
-			return context if context else "No information found"
+				context = self.__get_digest(fabric, tools, user_message, body)
+		return context if context else "No information found"
+
+
+	def __get_digest(self, fabric: "Fabric", tools: "BBCDailyDigest", user_message: str, body: dict) -> Union[str, Generator]:
+		"""
+		The digest of the categories in the user message, the precomputed one when there is one.
+		The news shown are remembered per user (or chat): a "what's new" digest only sends the others downstream.
+		"""
+		types = tools.find_article_types(user_message)
+		commentary = tools.wants_commentary(user_message)
+		whats_new = tools.wants_whats_new(user_message)
+		owner = self.__get_owner(body)
+		seen_items = get_seen_items("bbc_seen_items") if owner else None
+
+		if not commentary and not whats_new:
+			snapshot = self.digests.get((fabric.language, tuple(sorted(type.value for type in types))))
+			if snapshot is not None:
+				return self.__mark_when_delivered(self.__format_snapshot(snapshot), seen_items, owner, snapshot.items)
+
+		# Identical digests in flight fetch the feeds once, the items of each user are filtered from the shared result
+		categories = tuple(sorted(type.value for type in types))
+		items, errors = self.singleflight.run(("feeds", categories, self.valves.BBC_FEEDS_DOMAIN), lambda: tools.collect_feed_items(types))
+		if whats_new and seen_items is not None:
+			items = seen_items.unseen(owner, items)
+			if not items and not errors:
+				return "Nothing new since your last digest."
+		items = tools.recent_items(items)
+
+		# Identical renderings (same items, language and mode) in flight are computed once too
+		fingerprint = hashlib.blake2b("\n".join(item["link"] or item["guid"] or item["title"] for item in items).encode("utf-8"), digest_size=16).hexdigest()
+		key = ("digest", fabric.language, commentary, fingerprint, tuple(errors) if not items else ())
+		context = self.singleflight.run(key + self.__settings_key(), lambda: tools.render_feed_items(items, errors), stream=fabric.stream)
+		return self.__mark_when_delivered(context, seen_items, owner, items)
+
+
+	def __mark_when_delivered(self, context: Union[str, Generator], seen_items: Optional[SeenItems], owner: Optional[str], items: List[dict]) -> Union[str, Generator]:
+		"""
+		Remember the items as seen by owner once the digest is delivered: at once for an answer, after its last chunk
+		for a stream. A failed answer, or a stream the client left, doesn't mark them, they are shown next time.
+		"""
+		if seen_items is None:
+			return context
+		if isinstance(context, str):
+			if self.__delivered(context): seen_items.mark(owner, items)
+			return context
+		return self.__stream_and_mark(context, seen_items, owner, items)
+
+
+	def __stream_and_mark(self, chunks: Iterator, seen_items: SeenItems, owner: str, items: List[dict]) -> Generator:
+		content = []
+		for chunk in chunks:
+			content.append(chunk)
+			yield chunk
+		# Only reached when the client read the whole stream
+		if self.__delivered("".join(content)): seen_items.mark(owner, items)
+
+
+	@staticmethod
+	def __delivered(content: str) -> bool:
+		# The errors are answered as text: no digest (the feeds failed) or the LLM call failed
+		return bool(content) and not content.startswith("Error") and "Error with the Ollama call" not in content
+
+
+	def __get_owner(self, body: dict) -> Optional[str]:
+		# Whose news are remembered, None when WHATS_NEW_SCOPE is off or the request doesn't tell
+		scope = self.valves.WHATS_NEW_SCOPE.lower()
+		if scope not in ("user", "chat"):
+			return None
+		user_id = (body.get("user") or {}).get("id")
+		chat_id = body.get("chat_id") or (body.get("metadata") or {}).get("chat_id")
+		if scope == "chat" and chat_id:
+			return f"chat:{chat_id}"
+		return f"user:{user_id}" if user_id else (f"chat:{chat_id}" if chat_id else None)
+
+
+	def __settings_key(self) -> tuple:
+		# The valves changing the answer, requests made before and after an update are not shared
+		return (self.valves.OLLAMA_MODEL_NAME, self.valves.BBC_FEEDS_DOMAIN, self.valves.NATIVE_DIGEST, self.valves.INLINE_TRANSLATION, self.valves.MAX_BATCH_URLS)
 
 
 	def __create_title(self):
@@ -118,9 +339,7 @@ class Pipeline:
 
 
 class Fabric():
-	# Define the allowlist of characters
 	DEBUG = os.getenv("DEBUG", False)
-	ALLOWLIST_PATTERN = re.compile(r"^[a-zA-Z0-9\s.,;:!?\-]+$")
 	PATTERNS = {
         "languages": {
             "en": "English", 
@@ -131,17 +350,49 @@ class Fabric():
 			'riassumi': "summarize",
 		}
 	}
+	ROUTER = PatternRouter(PATTERNS["languages"], PATTERNS["patterns"])
+	# (pack, router) once a pattern pack is found, see get_router
+	PACK_ROUTER = None
+	LANGUAGE_PROMPT = """
+Write the whole output in {language}, whatever the language of the input.
+"""
 
 
-	def __init__(self, llm: Ollama) -> None:
+	def __init__(self, llm: Ollama, stream: bool = False, inline_translation: bool = True) -> None:
 		self.system_pattern_message = ChatMessage(role="system")
 		self.user_pattern_message = ChatMessage(role="user")
 		self.user_message = None
 		self.pattern = None
 		self.llm = llm
 		self.language = None
+		self.stream = stream
+		self.inline_translation = inline_translation
+
+
+	def fork(self) -> "Fabric":
+		"""
+		A Fabric with the same model, pattern and language, not streaming, to process a part of the input concurrently
+		"""
+		fabric = Fabric(self.llm, inline_translation=self.inline_translation)
+		fabric.user_message = self.user_message
+		fabric.pattern = self.pattern
+		fabric.language = self.language
+		return fabric
 		
 
+	@classmethod
+	def get_router(cls) -> PatternRouter:
+		"""
+		The keyword router, extended with the names of the patterns of the pattern pack when there is one
+		"""
+		pack = get_pattern_pack()
+		if pack is None:
+			return cls.ROUTER
+		if cls.PACK_ROUTER is None or cls.PACK_ROUTER[0] is not pack:
+			cls.PACK_ROUTER = (pack, PatternRouter(cls.PATTERNS["languages"], {**pack.keywords(), **cls.PATTERNS["patterns"]}))
+		return cls.PACK_ROUTER[1]
+
+
 	def get_patterns(self) -> dict:
 		return self.PATTERNS['patterns']
 
@@ -170,26 +421,16 @@ class Fabric():
 
 	def find_pattern(self) -> None:
 		"""
-		Check for the pattern to apply if any and set the pattern attribute
+		Check for the pattern and the language to apply if any and set the related attributes
 		"""
-		found = None
-		self.pattern = None
-		for lang, text in self.get_available_languages().items():
-			reg = fr'\b{re.escape(lang.lower())}\b'
-			langfound = re.search(reg, self.user_message.lower())
-			self.language = text if langfound else "English"
+		language, self.pattern = self.get_router().route(self.user_message)
+		self.language = self.get_available_languages()[language] if language else "English"
 
 		if self.DEBUG: print(f"Language: {self.language}")
-
-		for target, fn in self.PATTERNS["patterns"].items():
-			reg = fr'\b{re.escape(target.lower())}\b'
-			found = re.search(reg, self.user_message.lower())
-			self.pattern = fn if found else self.pattern                    
-
 		if self.DEBUG: print(f"Pattern: {self.pattern}")
 
 
-	def apply_pattern(self, transcript: str, pattern: Optional[str] = None) -> str:
+	def apply_pattern(self, transcript: str, pattern: Optional[str] = None) -> Union[str, Generator]:
 		"""
 		Apply the pattern to return the assistant content
 
@@ -197,7 +438,7 @@ class Fabric():
 			message (str): user message
 
 		Returns:
-			ChatResponse: response from llama-index Ollama
+			Union[str, Generator]: response content from llama-index Ollama, a generator of chunks when streaming
 		"""
 		self.pattern = pattern if pattern else self.pattern
 		system_url = f"https://raw.githubusercontent.com/danielmiessler/fabric/main/patterns/{self.pattern}/system.md"
@@ -209,55 +450,149 @@ class Fabric():
 
 		self.system_pattern_message.content = system_content
 		self.user_pattern_message.content = user_file_content + "\n" + transcript if user_file_content else transcript
-		messages: List[ChatMessage] = [self.system_pattern_message, self.user_pattern_message]
+		messages: List[ChatMessage] = self.__localize_messages([self.system_pattern_message, self.user_pattern_message])
+		if self.stream:
+			return self.__stream_pattern(messages)
 		self.__call_ollama(messages)
 		self.translate()
 		return self.get_response_content()
 
 
 	def apply_extra_pattern(self, prompt_template: PromptTemplate, message):
-		message: ChatMessage = prompt_template.format_messages(input=message, llm=self.llm)
+		message: List[ChatMessage] = self.__localize_messages(prompt_template.format_messages(input=message, llm=self.llm))
+		if self.stream:
+			return self.__stream_pattern(message)
 		self.__call_ollama(messages=message)
 		self.translate()
 		return self.get_response_content()
 
 
 	def translate(self) -> None:
-		if self.language != "English":
-			self.__set_translation_prompt(self.language)
-			self.__call_ollama([ChatMessage(role="system", content=self.translation_prompt), ChatMessage(role="user", content=self.get_response_content())])			
-				
+		if self.__translation_needed():
+			with span("translate"):
+				self.__call_ollama(self.__get_translation_messages())
+
+
+	def __translation_needed(self) -> bool:
+		# The answer is already localized when the language instruction is in the system message
+		return self.language != "English" and not self.inline_translation
+
+
+	def localize_lines(self, lines: List[str]) -> List[str]:
+		"""
+		Return the lines as they are for English, or their translation in the language requested by the user.
+		All of them go in one short, not streamed, call; a line missing from the answer stays as it is.
+
+		Args:
+			lines (List[str]): short texts to localize, i.e. headlines and descriptions
+
+		Returns:
+			List[str]: the localized lines, in the same order
+		"""
+		if self.language == "English" or not lines:
+			return lines
+		self.__set_translation_prompt(self.language)
+		numbered = "\n".join(f"{index}. {' '.join(line.split())}" for index, line in enumerate(lines, 1))
+		self.__call_ollama([
+			ChatMessage(role="system", content=self.translation_prompt + "Keep the numbered lines, one per input line, and don't add anything else."),
+			ChatMessage(role="user", content=numbered)
+		])
+		content = self.get_response_content()
+		if not isinstance(content, str) or content.startswith("Error"):
+			return lines
+		translated = {}
+		for match in re.finditer(r"^\s*(\d+)[.)]\s*(.+?)\s*$", content, flags=re.MULTILINE):
+			translated.setdefault(int(match.group(1)), match.group(2))
+		return [translated.get(index, line) for index, line in enumerate(lines, 1)]
+
+
+	def __localize_messages(self, messages: List[ChatMessage]) -> List[ChatMessage]:
+		'''
+		Add the target language instruction to the system message, so that one generation gives the localized answer
+		'''
+		if not self.inline_translation or self.language == "English":
+			return messages
+		instruction = self.LANGUAGE_PROMPT.format(language=self.language)
+		if messages and messages[0].role == "system":
+			return [ChatMessage(role="system", content=(messages[0].content or "") + "\n" + instruction)] + list(messages[1:])
+		return [ChatMessage(role="system", content=instruction)] + list(messages)
+
+
+	def __get_translation_messages(self) -> List[ChatMessage]:
+		self.__set_translation_prompt(self.language)
+		return [ChatMessage(role="system", content=self.translation_prompt), ChatMessage(role="user", content=self.get_response_content())]
+
+
+	def __stream_pattern(self, messages: List[ChatMessage]) -> Generator:
+		'''
+		Stream the response of the pattern, or of its translation when the user asked for another language
+		since the whole answer is needed before translating it
+		'''
+		if self.__translation_needed():
+			self.__call_ollama(messages)
+			with span("translate"):
+				yield from self.__stream_ollama(self.__get_translation_messages())
+			return
+		yield from self.__stream_ollama(messages)
+
 
 	def __set_translation_prompt(self, language: str):
 		self.translation_prompt = f"""Translate the following text to {self.language}
 	"""
 
+	async def aprefetch_patterns(self) -> str:
+		"""
+		Download the files of every pattern in PATTERNS into the local pattern cache, concurrently
+
+		Returns:
+			str: the number of patterns cached
+		"""
+		names = sorted({pattern for pattern in self.get_patterns().values() if is_pattern_name(pattern)})
+		pack = get_pattern_pack()
+		urls = [
+			f"https://raw.githubusercontent.com/danielmiessler/fabric/main/patterns/{name}/{file}"
+			for name in names if pack is None or name not in pack
+			for file in ("system.md", "user.md")
+		]
+		cache = get_pattern_cache()
+		outcomes = await asyncio.gather(*(cache.aget(url, self.__sanitize_content) for url in urls), return_exceptions=True)
+		errors = [outcome for outcome in outcomes if isinstance(outcome, Exception)]
+		if errors:
+			raise errors[0]
+		return f"{len(names)} patterns"
+
+
 	# Pull the URL content's from the GitHub repo
 	def __fetch_content_from_url(self, url):
-		"""    Fetches content from the given URL.
+		"""    Fetches content from the given URL through the local pattern cache.
 
 		Args:
 			url (str): The URL from which to fetch content.
 
 		Returns:
-			str: The sanitized content fetched from the URL.
+			str: The sanitized content fetched from the URL or from the cache.
 
 		Raises:
-			requests.RequestException: If an error occurs while making the request to the URL.
+			httpx.HTTPError: If an error occurs while making the request to the URL.
 		"""
 
+		pack = get_pattern_pack()
+		content = pack.lookup_url(url) if pack is not None else None
+		if content is not None:
+			return content
+
 		try:
-			response = requests.get(url)
-			response.raise_for_status()
-			sanitized_content = self.__sanitize_content(response.text)
+			with span("pattern_fetch"):
+				sanitized_content = get_pattern_cache().get(url, self.__sanitize_content)
+			if self.DEBUG: print(f"Fabric pattern cache: {get_pattern_cache().stats}")
 			return sanitized_content
-		except requests.RequestException as e:
+		except httpx.HTTPError as e:
 			return f"Error fetching Fabric Patterns: {str(e)}"
 		
 
 	# Sanitize the content, sort of. Prompt injection is the main threat so this isn't a huge deal
 	def __sanitize_content(self, content):
-		"""    Sanitize the content by removing characters that do not match the ALLOWLIST_PATTERN.
+		"""    Sanitize the content by removing the characters outside the allowlist (letters, digits, whitespace and .,;:!?-).
 
 		Args:
 			content (str): The content to be sanitized.
@@ -266,7 +601,21 @@ class Fabric():
 			str: The sanitized content.
 		"""
 
-		return "".join(char for char in content if self.ALLOWLIST_PATTERN.match(char))
+		return sanitize_pattern(content)
+
+
+	def __lookup_cache(self, messages: List[ChatMessage]) -> tuple:
+		'''
+		Returns the LLM response cache (None when disabled), the key of the request and the cached answer if any
+		'''
+		cache = get_llm_cache()
+		if cache is None:
+			return None, None, None
+		key = cache.key(self.llm, messages, self.language)
+		cached = cache.get(key)
+		inc("llm_cache_total", result="miss" if cached is None else "hit")
+		if self.DEBUG and cached is not None: print(f"LLM response cache hit: {cache.stats}")
+		return cache, key, cached
 
 
 	def __call_ollama(self, messages: List[ChatMessage]) -> None:
@@ -278,12 +627,57 @@ class Fabric():
 		Returns:
 			str: the response content
 		'''
+		cache, key, cached = self.__lookup_cache(messages)
+		if cached is not None:
+			self.response = ChatResponse(message=ChatMessage(role="assistant", content=cached))
+			return
+
 		# Build the API call
 		try:
 			if self.DEBUG: print(f"Ollama Client: {self.llm}")
+			started = time.perf_counter()
 			self.response: ChatResponse = self.llm.chat(messages)
+			observe_llm(self.llm.model, self.response.raw, started)
 		except Exception as e:
 			self.response = f"Error with the Ollama call in Fabric pattern workflow: {str(e)}"
+			return
+		if cache: cache.set(key, self.response.message.content)
+
+
+	def __stream_ollama(self, messages: List[ChatMessage]) -> Generator:
+		'''
+		Call OLLAMA API in streaming mode
+		Args:
+			messages (List[ChatMessage]): a List of ChatMessages with user message and system message
+
+		Yields:
+			str: the response content, chunk by chunk as it's generated
+		'''
+		cache, key, cached = self.__lookup_cache(messages)
+		if cached is not None:
+			self.response = cached
+			yield cached
+			return
+
+		content = ""
+		try:
+			if self.DEBUG: print(f"Ollama Client (streaming): {self.llm}")
+			started, first_chunk, raw = time.perf_counter(), None, None
+			for chunk in self.llm.stream_chat(messages):
+				first_chunk = first_chunk or time.perf_counter()
+				raw = chunk.raw
+				delta = chunk.delta or ""
+				content += delta
+				yield delta
+			observe_llm(self.llm.model, raw, started, first_chunk)
+		except Exception as e:
+			error = f"Error with the Ollama call in Fabric pattern workflow: {str(e)}"
+			self.response = content + error
+			yield error
+			return
+		# Only complete answers are cached, an interrupted stream never gets here
+		self.response = content
+		if cache: cache.set(key, content)
 
 
 class Tools():
@@ -292,21 +686,33 @@ class Tools():
    
     def _extract_url(self, text):
         """
-        Extracts URL(s) from the given text.
+        Extracts the first URL of the given text, like _extract_urls.
         
         Args:
             text (str): The input string containing one or more URLs.
         
         Returns:
-            list: A list of extracted URLs.
+            str: The first URL, without the punctuation ending a sentence; an empty list when there is none.
         """
-        url_pattern = r'http[s]?://(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\\(\\),]|(?:%[0-9a-fA-F][0-9a-fA-F]))+'
-        
-        urls = re.findall(url_pattern, text)
-        
+        urls = self._extract_urls(text)
         return urls[0] if len(urls) > 0 else urls
 
 
+    def _extract_urls(self, text) -> List[str]:
+        """
+        Extracts every URL of the given text, once each and in order, i.e. "summarize these articles: url1, url2".
+
+        Args:
+            text (str): The input string containing one or more URLs.
+
+        Returns:
+            list: The URLs, without the punctuation ending a sentence or separating them.
+        """
+        url_pattern = r'http[s]?://(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\\(\\),]|(?:%[0-9a-fA-F][0-9a-fA-F]))+'
+        urls = [url.rstrip(".,;:!?)") for url in re.findall(url_pattern, text or "")]
+        return list(dict.fromkeys(url for url in urls if url))
+
+
 
 class BBCDailyDigest(Tools):
 	# Regex to match a BBC News article URI.
@@ -342,10 +748,46 @@ class BBCDailyDigest(Tools):
 		def get_name(self) -> str: return self.name.replace("_", " ").title()
 		def get_uri(self, domain) -> str: return f"https://{domain}/news/{self.value}/rss.xml" if self.name != "top_stories" else f"https://{domain}/news/rss.xml"
 
-	def __init__(self, fabric: Fabric = None, bbc_domain: str = "feed.bbc.com" ):
+	# Enabled news categories, by name (i.e. "science and environment" -> ArticleType.science_and_environment)
+	CATEGORY_ROUTER = PatternRouter({}, {type.get_name(): type.value for type in ArticleType})
+	# The user asks only for the news not shown yet
+	WHATS_NEW_REGEX = re.compile(r"(\bwhat'?s new\b|\bwhat is new\b|\bnew since\b|\bsince (my|the) last\b|\bnovit[aà]|\bcosa c'?è di nuovo\b)", re.IGNORECASE)
+	# The user asks for an LLM commentary of the news, not only the list of articles
+	COMMENTARY_REGEX = re.compile(r"\b(comments?|commentary|opinions?|insights?|analysis|commento|commenta|commenti|opinione|analisi)\b", re.IGNORECASE)
+	DIGEST_LABELS = ["Title", "Description", "Link", "Published at"]
+	DIGEST_ITEM_TEMPLATE = """{labels[0]}: {title}
+{labels[1]}: {description}
+{labels[2]}: {link}
+{labels[3]}: {published}"""
+	# Items read from a single feed, BBC feeds usually have less than 50
+	MAX_FEED_ITEMS = 100
+	# Items and validators (ETag / Last-Modified) of the last successful fetch, per feed URI
+	FEEDS_CACHE = {}
+	FEEDS_CACHE_LOCK = threading.Lock()
+
+	def __init__(
+		self,
+		fabric: Fabric = None,
+		bbc_domain: str = "feed.bbc.com",
+		max_workers: int = 8,
+		native_digest: bool = True,
+		max_items: int = 25,
+		max_urls: int = 10,
+		batch_concurrency: int = 4,
+		batch_llm_concurrency: int = 2
+	):
 		super().__init__()
 		self.fabric = fabric
 		self.bbc_domain = bbc_domain
+		self.max_workers = max_workers
+		self.native_digest = native_digest
+		self.max_items = max_items
+		self.max_urls = max_urls
+		self.batch_concurrency = batch_concurrency
+		self.batch_llm_concurrency = batch_llm_concurrency
+		# The items of the last digest, once get_bbc_news_feeds returned
+		self.items: List[dict] = []
+		# Only used when NATIVE_DIGEST is off, the previous behaviour
 		self.prompt: PromptTemplate = PromptTemplate(template="""You are a JSON format expert. Given an input array formatted with JSON, order the results by the "published" field descending to return a more readable list from the given input. Return only the most recent items, max 25, based on the "published" field, and don't add any of your comments.
 Pay attention to the following fields available in each single row of the array: "title", "description", "link", "published" and provide a response using the following format:
 Title: value of the "title" field
@@ -354,9 +796,73 @@ Link: value of the "link" field
 Published at: value of the "published" field
 
 Input json array: {input}
+""")
+		self.commentary_prompt: PromptTemplate = PromptTemplate(template="""You are a news analyst. Below are the latest BBC news, newest first, one per line with their description.
+Write a short commentary of the news, 200 words at most: the main stories, the themes they have in common and why they matter.
+Only use the information given, don't invent any fact, and don't repeat the list of the news.
+
+News:
+{input}
 """)
 		self.DEBUG = os.getenv("DEBUG", False)
         
+	def find_article_types(self, user_message: str) -> List[ArticleType]:
+		"""
+		Find the news categories requested in the user message, i.e. "world, business and technology digest".
+		:param user_message: The user message.
+		:return: The list of ArticleType mentioned in the message, top stories when none is.
+		"""
+		values = self.CATEGORY_ROUTER.find_all(user_message)
+		return [self.ArticleType(value) for value in values] or [self.ArticleType.top_stories]
+
+
+	@classmethod
+	def parse_subscriptions(cls, subscriptions: str) -> List[tuple]:
+		"""
+		Parse the subscribed digests, i.e. "top_stories;world,business".
+		:param subscriptions: Digests separated by semicolons, each a list of ArticleType names or values separated by commas.
+		:return: The digests, each a sorted tuple of ArticleType values; the unknown categories are ignored.
+		"""
+		digests = []
+		for subscription in (subscriptions or "").split(";"):
+			values = set()
+			for category in subscription.split(","):
+				category = category.strip().lower().replace(" ", "_")
+				if category in cls.ArticleType.__members__:
+					values.add(cls.ArticleType[category].value)
+				elif category in cls.ArticleType._value2member_map_:
+					values.add(category)
+				elif category:
+					print(f"Unknown BBC news category ignored: {category}")
+			if values and tuple(sorted(values)) not in digests:
+				digests.append(tuple(sorted(values)))
+		return digests
+
+
+	def find_article_urls(self, user_message: str) -> tuple:
+		"""
+		The article URLs of the user message, normalized (scheme, host and trailing slash) to identify the request.
+		:param user_message: The user message.
+		:return: The URLs processed (max_urls at most), an empty tuple when there is none.
+		"""
+		urls = self._extract_urls(user_message)[:max(self.max_urls, 1)]
+		return tuple(re.sub(r"^https?://(www\.)?", "https://", url.rstrip("/"), flags=re.IGNORECASE).lower() for url in urls)
+
+
+	def wants_commentary(self, user_message: str) -> bool:
+		"""
+		True when the user asks for an LLM commentary of the news, not only the list of articles.
+		"""
+		return bool(self.COMMENTARY_REGEX.search(user_message or ""))
+
+
+	def wants_whats_new(self, user_message: str) -> bool:
+		"""
+		True when the user asks only for the news not shown yet, i.e. "what's new since last time".
+		"""
+		return bool(self.WHATS_NEW_REGEX.search(user_message or ""))
+
+
 	def get_bbc_news_feed(
 			self,
 			type: ArticleType,
@@ -366,28 +872,166 @@ Input json array: {input}
 		:param type: The type of news to get. It can be any of the ArticleType enum values (world, uk, business, politics, health, education, science_and_environment, technology, entertainment_and_arts, england, northern_ireland, scotland, wales, world/africa, world/asia, world/australia, world/europe, world/latin_america, world/middle_east, world/us_and_canada).
 		:return: A list of news items or an error message.
 		"""
-		type = self.ArticleType(type) # Enforce the type (it seems to get dropped by openwebui...)
+		return self.get_bbc_news_feeds([type])
+
+
+	def get_bbc_news_feeds(
+			self,
+			types: List[ArticleType],
+		) -> str:
+		"""
+		Get the latest news from several BBC feeds, fetched concurrently and merged in a single digest.
+		:param types: The types of news to get, any of the ArticleType enum values.
+		:return: A list of news items or an error message.
+		"""
+		items, errors = self.collect_feed_items(types)
+		self.items = self.recent_items(items)
+		return self.render_feed_items(self.items, errors)
+
+
+	def collect_feed_items(self, types: List[ArticleType]) -> Tuple[List[dict], List[str]]:
+		"""
+		Fetch several BBC feeds concurrently and merge their items, the stories published in several categories once.
+		:param types: The types of news to get, any of the ArticleType enum values.
+		:return: The items and the error messages of the feeds that couldn't be fetched.
+		"""
+		types = [self.ArticleType(type) for type in types] # Enforce the type (it seems to get dropped by openwebui...)
 		output = []
+		errors = []
+		links = set()
+		with ThreadPoolExecutor(max_workers=max(1, min(self.max_workers, len(types)))) as executor, span("feeds_fetch"):
+			for items in executor.map(self.__fetch_feed_items, types):
+				if isinstance(items, str):
+					errors.append(items)
+					continue
+				for item in items:
+					# The same story is often published in several categories
+					key = item["link"] or item["guid"] or item["title"]
+					if key not in links:
+						links.add(key)
+						output.append(item)
+
+		if self.DEBUG and errors: print(f"Feed errors: {errors}")
+		return output, errors
+
+
+	def recent_items(self, items: List[dict]) -> List[dict]:
+		"""
+		The most recent items, newest first, the ones a digest shows.
+		"""
+		return sorted(items, key=self.__get_published_at, reverse=True)[:self.max_items]
+
+
+	def render_feed_items(self, items: List[dict], errors: List[str]) -> Union[str, Generator]:
+		"""
+		The digest of the items, natively rendered (headlines, descriptions and labels translated when the user asks for another language)
+		and followed by an LLM commentary of the news when the user asks for one.
+		:param items: The feed items, only these are sent to the LLM.
+		:param errors: The feeds errors, returned when there is no item.
+		:return: The digest or the error messages, a generator of chunks when streaming the commentary.
+		"""
+		if not items and errors:
+			return "\n".join(errors)
+		if not self.native_digest:
+			return self.fabric.apply_extra_pattern(self.prompt, json.dumps(items))
+
+		items = self.recent_items(items)
+		labels = self.DIGEST_LABELS
+		if self.fabric.language not in (None, "English"):
+			# One call for everything: each headline followed by its description, then the labels
+			lines = [text for item in items for text in (item.get("title") or "", item.get("description") or "")]
+			with span("translate"):
+				localized = self.fabric.localize_lines(lines + self.DIGEST_LABELS)
+			items = [
+				{**item, "title": localized[2 * index], "description": localized[2 * index + 1]}
+				for index, item in enumerate(items)
+			]
+			labels = localized[len(lines):]
+		with span("render"):
+			digest = self.render_digest(items, labels)
+		if not self.wants_commentary(self.fabric.get_user_message()):
+			return digest
+
+		news = "\n".join(f"- {item.get('title') or ''}: {item.get('description') or ''}" for item in items)
+		commentary = self.fabric.apply_extra_pattern(self.commentary_prompt, news)
+		if isinstance(commentary, str):
+			return f"{digest}\n\n---\n\n{commentary}"
+		return self.__stream_after(f"{digest}\n\n---\n\n", commentary)
+
+
+	def __stream_after(self, head: str, chunks: Generator) -> Generator:
+		# The digest is sent at once, then the commentary as it's generated
+		yield head
+		yield from chunks
+
+
+	def render_digest(self, items: List[dict], labels: List[str] = None) -> str:
+		"""
+		Format the most recent items, newest first, without any LLM round-trip.
+		:param items: The feed items, with a title, description, link, and published date.
+		:param labels: The localized DIGEST_LABELS, the English ones by default.
+		:return: The digest, one block per item.
+		"""
+		items = self.recent_items(items)
+		labels = labels or self.DIGEST_LABELS
+		return "\n\n".join(
+			self.DIGEST_ITEM_TEMPLATE.format(labels=labels, **{key: item.get(key) or "" for key in ("title", "description", "link", "published")})
+			for item in items
+		)
+
+
+	def __get_published_at(self, item: dict) -> datetime:
+		# RSS dates are RFC 822, i.e. "Mon, 01 Jan 2024 10:00:00 GMT"
 		try:
-			response = requests.get(type.get_uri(self.bbc_domain))
-			if not response.ok: 
-				return f"Error: '{type}' ({type.get_uri(self.bbc_domain)}) not found ({response.status_code})"
-			
-			root = ElementTree.fromstring(response.content)
-			for item in root.iter("item"): 
-				output.append({
-					"title": item.find("title").text,
-					"description": item.find("description").text,
-					"link": item.find("link").text,
-					"published": item.find("pubDate").text,
-				})
-			
+			published_at = parsedate_to_datetime(item.get("published") or "")
+		except (TypeError, ValueError):
+			return datetime.min.replace(tzinfo=timezone.utc)
+		return published_at if published_at.tzinfo else published_at.replace(tzinfo=timezone.utc)
+
+
+	def __fetch_feed_items(self, type: ArticleType) -> Union[List[dict], str]:
+		"""
+		Fetch the items of a feed, with a conditional GET so that an unchanged feed comes back as a 304 with no body.
+		:param type: The type of news to get.
+		:return: The list of items or an error message.
+		"""
+		uri = type.get_uri(self.bbc_domain)
+		with self.FEEDS_CACHE_LOCK:
+			cached = self.FEEDS_CACHE.get(uri)
+
+		headers = {}
+		if cached and cached["etag"]:
+			headers["If-None-Match"] = cached["etag"]
+		if cached and cached["last_modified"]:
+			headers["If-Modified-Since"] = cached["last_modified"]
+
+		try:
+			http_client = get_http_client()
+			started = time.perf_counter()
+			with http_client.stream("GET", uri, headers=headers) as response:
+				observe_stage("http_fetch", time.perf_counter() - started, target="bbc_feed")
+				if response.status_code == 304 and cached:
+					# Drain the (empty) body so the connection goes back to the pool
+					response.read()
+					return cached["items"]
+				if response.status_code >= 400:
+					return f"Error: '{type}' ({uri}) not found ({response.status_code})"
+
+				# Parsed while downloading, the rest of the feed is not even read once we have enough items
+				started = time.perf_counter()
+				output = list(iter_rss_items(http_client.iter_bytes(response), max_items=self.MAX_FEED_ITEMS))
+				observe_stage("parse", time.perf_counter() - started, target="bbc_feed")
+
 		except Exception as e:
 			return f"Error: {e}"
-		
-		return self.fabric.apply_extra_pattern(self.prompt, json.dumps(output))
 
-		# return json.dumps(output)
+		with self.FEEDS_CACHE_LOCK:
+			self.FEEDS_CACHE[uri] = {
+				"etag": response.headers.get("ETag"),
+				"last_modified": response.headers.get("Last-Modified"),
+				"items": output,
+			}
+		return output
 		
 
 	def get_bbc_news_content(
@@ -395,34 +1039,73 @@ Input json array: {input}
 		user_message: str,
 	) -> str:
 		"""
-		Get the content of a news article from the BBC.
+		Get the content of a news article from the BBC, of every article when the message has several URLs.
 		:param uri: The URI of the article to get the content of, which should start with https://bbc.com/news or https://bbc.co.uk/news.
-		:return: The content of the article or an error message.
+		:return: The content of the article or an error message; for several articles their outputs, streamed as they complete when streaming.
 		"""
 		if user_message == "":
 			return "Error: No User Message provided"
-		
+
+		urls = self._extract_urls(user_message)[:max(self.max_urls, 1)]
+		if len(urls) > 1:
+			return self.__get_bbc_news_contents(urls)
+
 		url = super()._extract_url(user_message)
+		content = self.fetch_article(url)
+		if content.startswith("Error"):
+			return content
+
+		if self.fabric.get_pattern():
+			print(f"Inside the PATTERN: {self.fabric.get_pattern()}")
+			return self.fabric.apply_pattern(content)
+		
+		return content
+
 
-		if not re.match(self.URI_REGEX, url):
+	def __get_bbc_news_contents(self, urls: List[str]) -> Union[str, Generator]:
+		"""
+		The articles are downloaded concurrently and the pattern applied to each one as soon as it's ready,
+		at most batch_llm_concurrency at a time, each on its own (not streamed) Fabric.
+		"""
+		def apply(fabric: Fabric, content: str) -> str:
+			return fabric.apply_pattern(content) if fabric.get_pattern() else content
+
+		fabrics = [self.fabric.fork() for _ in urls]
+		results = run_batch(
+			list(zip(urls, fabrics)),
+			fetch=lambda item: self.fetch_article(item[0]),
+			apply=lambda item, content: apply(item[1], content),
+			max_workers=self.batch_concurrency,
+			llm_concurrency=self.batch_llm_concurrency
+		)
+		if self.fabric.stream:
+			return stream_batch(urls, results)
+		return join_batch(urls, results)
+
+
+	def fetch_article(self, url: str) -> str:
+		"""
+		The paragraphs of a BBC News article, one per line, or an error message.
+		"""
+		if not isinstance(url, str) or not re.match(self.URI_REGEX, url):
 			return "Error: URI must be a BBC News article."
 
 		content = ""
 		try:
-			response = requests.get(url)
-			if not response.ok: return f"Error: '{url}' not found ({response.status_code})"
-			article = BeautifulSoup(response.content, "html.parser").find("article")
-			if article is None:
+			http_client = get_http_client()
+			started = time.perf_counter()
+			with http_client.stream("GET", url) as response:
+				observe_stage("http_fetch", time.perf_counter() - started, target="bbc_article")
+				if response.status_code >= 400: return f"Error: '{url}' not found ({response.status_code})"
+				# Only the <article> is parsed, the rest of the page is not even downloaded
+				started = time.perf_counter()
+				paragraphs = extract_article_paragraphs(http_client.iter_bytes(response), response.encoding or "utf-8")
+				observe_stage("parse", time.perf_counter() - started, target="bbc_article")
+			if paragraphs is None:
 				return f"Error: Article content for {url} not found."
 			
-			paragraphs = article.find_all("p")
-			for paragraph in paragraphs: content += f"{paragraph.text}\n"
+			for paragraph in paragraphs: content += f"{paragraph}\n"
 		except Exception as e:
 			return f"Error: {e}"
-
-		if self.fabric.get_pattern():
-			print(f"Inside the PATTERN: {self.fabric.get_pattern()}")
-			return self.fabric.apply_pattern(content)
-		
 		return content
 	
\ No newline at end of file
@@ -9,17 +9,35 @@ license: MIT
 """
 import os
 import re
-import requests
+import time
+import httpx
+import asyncio
+import threading
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from dotenv import load_dotenv, find_dotenv
 from pydantic import BaseModel, Field
-from typing import List, Union, Generator, Iterator, Any
+from typing import List, Optional, Union, Generator, Iterator, Any
 from llama_index.llms.ollama import Ollama
-from llama_index.core.schema import Document
 from llama_index.core.llms import ChatMessage, ChatResponse
 from llama_index.core import ChatPromptTemplate, PromptTemplate
 from llama_index.readers.youtube_transcript import YoutubeTranscriptReader
-from llama_index.readers.youtube_transcript.utils import is_youtube_video
+from llama_index.readers.youtube_transcript.utils import is_youtube_video, YOUTUBE_URL_PATTERNS
+
+from utils.pipelines.batch import join_batch, run_batch, stream_batch
+from utils.pipelines.compress import compress_transcript
+from utils.pipelines.http_client import aclose_http_client, get_http_client
+from utils.pipelines.llm_cache import get_llm_cache
+from utils.pipelines.metrics import span, inc, observe_stage, observe_llm
+from utils.pipelines.pattern_cache import get_pattern_cache
+from utils.pipelines.pattern_pack import get_pattern_pack, is_pattern_name, sanitize_pattern
+from utils.pipelines.ratelimit import RateLimitTimeout, get_rate_limiter
+from utils.pipelines.router import PatternRouter
+from utils.pipelines.store import get_store
+from utils.pipelines.singleflight import SingleFlight
+from utils.pipelines.text import estimate_tokens, split_text
+from utils.pipelines.warmup import WarmUp, keep_alive
 
 BASE_DIR = Path(__file__).parent
 
@@ -36,6 +54,62 @@ class Pipeline:
             default="",
             description="The OLLAMA model name"
         )
+        STREAMING: bool = Field(
+            default=True,
+            description="Stream the Ollama response to the client as it's generated"
+        )
+        INLINE_TRANSLATION: bool = Field(
+            default=True,
+            description="Ask the model to answer directly in the requested language instead of translating the English answer with a second call"
+        )
+        WARM_UP: bool = Field(
+            default=True,
+            description="Prefetch the Fabric patterns and load the Ollama model at startup, so the first request is as fast as the next ones"
+        )
+        CHUNK_TOKENS: int = Field(
+            default=20000,
+            description="Transcripts longer than this many tokens are summarized chunk by chunk, then the partial outputs are merged"
+        )
+        CHUNK_OVERLAP_TOKENS: int = Field(
+            default=200,
+            description="Tokens repeated between consecutive chunks"
+        )
+        CHUNK_PARALLELISM: int = Field(
+            default=2,
+            description="Chunks sent to Ollama at the same time, should match OLLAMA_NUM_PARALLEL on the server"
+        )
+        MAX_BATCH_URLS: int = Field(
+            default=10,
+            description="Videos processed from a single message (i.e. \"summarize these five videos\"), the next ones are ignored"
+        )
+        BATCH_CONCURRENCY: int = Field(
+            default=4,
+            description="Videos of a message whose transcripts are downloaded at the same time"
+        )
+        BATCH_LLM_CONCURRENCY: int = Field(
+            default=2,
+            description="Ollama calls at the same time for the videos of a message, the chunks of the long transcripts included"
+        )
+        TRANSCRIPT_RATE_LIMIT: float = Field(
+            default=float(os.getenv("YOUTUBE_TRANSCRIPT_RATE_LIMIT", 30)),
+            description="Transcripts downloaded per minute at most, by all the worker processes together (lowered after a 429 and raised back as downloads succeed); 0 for no limit"
+        )
+        TRANSCRIPT_RATE_BURST: int = Field(
+            default=5,
+            description="Transcripts downloaded at once after an idle period"
+        )
+        TRANSCRIPT_RATE_LIMIT_WAIT: float = Field(
+            default=30,
+            description="Seconds a request waits in the queue for a download slot, or backs off after 429s, before giving up"
+        )
+        COMPRESS_TRANSCRIPT: bool = Field(
+            default=False,
+            description="Remove the repeated captions, the hesitations and the near duplicate sentences of the transcript before applying the pattern, to cut the prompt tokens (lossy: see the README)"
+        )
+        TRANSCRIPT_TARGET_TOKENS: int = Field(
+            default=0,
+            description="Token budget of the transcript once compressed, only its most salient sentences are kept above it; 0 to keep them all"
+        )
 
 
     def __init__(self):
@@ -43,6 +117,9 @@ class Pipeline:
         self.DEBUG = os.getenv("DEBUG", False)
         self.name = "Youtube Transcript Generator"
         self.llm: Ollama = None
+        self.warmup = WarmUp(self.name)
+        # Concurrent requests for the same video, pattern and language share one computation
+        self.singleflight = SingleFlight("youtube")
         self.valves = self.Valves(
             **{
                 "OLLAMA_HOST": os.getenv('OLLAMA_HOST', 'http://localhost:11434/'),
@@ -58,16 +135,33 @@ class Pipeline:
     async def on_startup(self):
         print(f"on_startup:{__name__}") 
         self.set_llm()
+        self.start_warm_up()
 
 
     async def on_valves_updated(self):
         print(f"on_valves_updated:{__name__}")
         self.set_llm()
+        self.start_warm_up()
 
 
     async def on_shutdown(self):
         print(f"on_shutdown:{__name__}")
+        self.warmup.cancel()
         self.llm = None
+        await aclose_http_client()
+
+
+    def start_warm_up(self):
+        """
+        Prefetch the patterns and load the model in background, self.warmup.ready tells when it's done
+        """
+        if not self.valves.WARM_UP or self.llm is None:
+            return
+        fabric = Fabric(self.llm)
+        self.warmup.start({
+            "patterns": fabric.aprefetch_patterns,
+            "model": lambda: keep_alive(self.llm, blocking=True),
+        })
 
 
     def set_llm(self):
@@ -80,7 +174,8 @@ class Pipeline:
             temperature=0.0,
             top_p=1,
             frequency_penalty=0.1,
-            presence_penalty=0.1
+            presence_penalty=0.1,
+            **get_http_client().ollama_clients(self.valves.OLLAMA_HOST, 180.0)
         )
         return self.llm
     
@@ -91,17 +186,50 @@ class Pipeline:
         if self.DEBUG: print(f"pipe: {__name__}")
         if self.DEBUG: print(f"Body: {body}")
         if self.DEBUG: print(f"UserMessage: {user_message}")
+        if self.DEBUG: print(f"HTTP connections: {get_http_client().stats()}")
         
-        self.fabric = Fabric(self.llm)
-        self.fabric.set_user_message(user_message)
-        self.fabric.find_pattern()
+        # Local instance, concurrent requests must not share the Fabric state
+        fabric = Fabric(
+            self.llm,
+            stream=self.valves.STREAMING and body.get('stream', False),
+            inline_translation=self.valves.INLINE_TRANSLATION
+        )
+        fabric.set_user_message(user_message)
+        fabric.find_pattern()
 
         if body.get('title', False):
             return self.__create_title()
-        else:
-            tools = YouTubeTool(self.fabric)
-            context = tools.get_youtube_transcript()
-            return context if context else "No information found"
+        with span("pipe", pipeline="youtube"):
+            tools = YouTubeTool(
+                fabric,
+                chunk_tokens=self.valves.CHUNK_TOKENS,
+                chunk_overlap_tokens=self.valves.CHUNK_OVERLAP_TOKENS,
+                chunk_parallelism=self.valves.CHUNK_PARALLELISM,
+                max_urls=self.valves.MAX_BATCH_URLS,
+                batch_concurrency=self.valves.BATCH_CONCURRENCY,
+                batch_llm_concurrency=self.valves.BATCH_LLM_CONCURRENCY,
+                rate_limit=self.valves.TRANSCRIPT_RATE_LIMIT,
+                rate_burst=self.valves.TRANSCRIPT_RATE_BURST,
+                rate_limit_wait=self.valves.TRANSCRIPT_RATE_LIMIT_WAIT,
+                compress=self.valves.COMPRESS_TRANSCRIPT,
+                target_tokens=self.valves.TRANSCRIPT_TARGET_TOKENS
+            )
+            key = (fabric.get_pattern(), fabric.language, tuple(tools.get_video_ids()) or str(tools.url)) + self.__settings_key()
+            context = self.singleflight.run(key, tools.get_youtube_transcripts, stream=fabric.stream)
+        return context if context else "No information found"
+
+
+    def __settings_key(self) -> tuple:
+        # The valves changing the answer, requests made before and after an update are not shared
+        return (
+            self.valves.OLLAMA_MODEL_NAME,
+            self.valves.INLINE_TRANSLATION,
+            self.valves.CHUNK_TOKENS,
+            self.valves.CHUNK_OVERLAP_TOKENS,
+            self.valves.MAX_BATCH_URLS,
+            self.valves.COMPRESS_TRANSCRIPT,
+            self.valves.TRANSCRIPT_TARGET_TOKENS,
+        )
 
 
     def __create_title(self):
@@ -112,9 +240,7 @@ class Pipeline:
 
 
 class Fabric():
-    # Define the allowlist of characters
     DEBUG = os.getenv("DEBUG", False)
-    ALLOWLIST_PATTERN = re.compile(r"^[a-zA-Z0-9\s.,;:!?\-]+$")
     PATTERNS = {
         "languages": {
             "en": "English", 
@@ -129,15 +255,55 @@ class Fabric():
             "analizza": "analyze_presentation"
         }
     }
+    ROUTER = PatternRouter(PATTERNS["languages"], PATTERNS["patterns"])
+    # (pack, router) once a pattern pack is found, see get_router
+    PACK_ROUTER = None
+    LANGUAGE_PROMPT = """
+Write the whole output in {language}, whatever the language of the input.
+"""
+    REDUCE_PROMPT = """
+The input is made of the outputs you gave for consecutive parts of the same long transcript, separated by ---.
+Merge them into a single output for the whole transcript, following the same instructions and output format, without repeating the same points.
+"""
 
 
-    def __init__(self, llm: Ollama) -> None:
+    def __init__(self, llm: Ollama, stream: bool = False, inline_translation: bool = True) -> None:
         self.system_pattern_message = ChatMessage(role="system")
         self.user_pattern_message = ChatMessage(role="user")
         self.user_message = None
         self.pattern = None
         self.llm = llm
         self.language = None
+        self.stream = stream
+        self.inline_translation = inline_translation
+        # Blocking Ollama calls allowed at the same time, shared with the forks (i.e. by the videos of a batch); None for no limit
+        self.llm_slots: Optional[threading.Semaphore] = None
+
+
+    def fork(self) -> "Fabric":
+        """
+        A Fabric with the same model, pattern and language, not streaming, to process a part of the input concurrently
+        """
+        fabric = Fabric(self.llm, inline_translation=self.inline_translation)
+        fabric.user_message = self.user_message
+        fabric.pattern = self.pattern
+        fabric.language = self.language
+        fabric.llm_slots = self.llm_slots
+        return fabric
+
+
+    @classmethod
+    def get_router(cls) -> PatternRouter:
+        """
+        The keyword router, extended with the names of the patterns of the pattern pack when there is one
+        """
+        pack = get_pattern_pack()
+        if pack is None:
+            return cls.ROUTER
+        if cls.PACK_ROUTER is None or cls.PACK_ROUTER[0] is not pack:
+            cls.PACK_ROUTER = (pack, PatternRouter(cls.PATTERNS["languages"], {**pack.keywords(), **cls.PATTERNS["patterns"]}))
+        return cls.PACK_ROUTER[1]
+
 
     def get_patterns(self) -> dict:
         return self.PATTERNS['patterns']
@@ -167,26 +333,16 @@ class Fabric():
 
     def find_pattern(self) -> None:
         """
-        Check for the pattern to apply if any and set the pattern attribute
+        Check for the pattern and the language to apply if any and set the related attributes
         """
-        found = None
-        self.pattern = None
-        for lang, text in self.get_available_languages().items():
-            reg = fr'\b{re.escape(lang.lower())}\b'
-            langfound = re.search(reg, self.user_message.lower())
-            self.language = text if langfound else "English"
+        language, self.pattern = self.get_router().route(self.user_message)
+        self.language = self.get_available_languages()[language] if language else "English"
 
         print(f"Language: {self.language}")
-
-        for target, fn in self.PATTERNS["patterns"].items():
-            reg = fr'\b{re.escape(target.lower())}\b'
-            found = re.search(reg, self.user_message.lower())
-            self.pattern = fn if found else self.pattern                    
-
         print(f"Pattern: {self.pattern}")
 
 
-    def apply_pattern(self, transcript: str) -> str:
+    def apply_pattern(self, transcript: str) -> Union[str, Generator]:
         """
         Apply the pattern to return the assistant content
 
@@ -194,34 +350,161 @@ class Fabric():
             message (str): user message
 
         Returns:
-            ChatResponse: response from llama-index Ollama
+            Union[str, Generator]: response content from llama-index Ollama, a generator of chunks when streaming
         """
-        system_url = f"https://raw.githubusercontent.com/danielmiessler/fabric/main/patterns/{self.pattern}/system.md"
-        user_url = f"https://raw.githubusercontent.com/danielmiessler/fabric/main/patterns/{self.pattern}/user.md"
+        messages = self.__localize_messages(self.__get_pattern_messages(transcript))
+        if self.stream:
+            return self.__stream_pattern(messages)
+        self.__call_ollama(messages)
+        self.translate()
+        return self.get_response_content()
 
-        # Fetch the prompt content
-        system_content = self.__fetch_content_from_url(system_url)
-        user_file_content = self.__fetch_content_from_url(user_url)
 
-        self.system_pattern_message.content = system_content
-        self.user_pattern_message.content = user_file_content + "\n" + transcript if user_file_content else transcript
-        messages: List[ChatMessage] = [self.system_pattern_message, self.user_pattern_message]
-        self.__call_ollama(messages)        
+    def apply_pattern_chunked(self, transcript: str, chunk_tokens: int, overlap_tokens: int = 0, parallelism: int = 1) -> Union[str, Generator]:
+        """
+        Apply the pattern to a transcript that may not fit the context window: the pattern runs
+        on each chunk (map, concurrently), then the partial outputs are merged by a final call (reduce).
+        Short transcripts take the single call of apply_pattern.
+
+        Args:
+            transcript (str): the transcript, one caption per line
+            chunk_tokens (int): token budget of a chunk
+            overlap_tokens (int): tokens repeated between consecutive chunks
+            parallelism (int): chunks processed at the same time
+
+        Returns:
+            Union[str, Generator]: response content from llama-index Ollama, a generator of chunks when streaming
+        """
+        chunks = split_text(transcript, chunk_tokens, overlap_tokens)
+        if len(chunks) <= 1:
+            return self.apply_pattern(transcript.replace('\n', ' '))
+
+        if self.DEBUG: print(f"Transcript of ~{estimate_tokens(transcript)} tokens split in {len(chunks)} chunks")
+        with ThreadPoolExecutor(max_workers=max(parallelism, 1)) as executor, span("chunk_map"):
+            partials = list(executor.map(self.__map_chunk, chunks))
+            # Merge by groups until the partial outputs fit a single call
+            while not self.__find_error(partials) and estimate_tokens(self.__join_partials(partials)) > chunk_tokens:
+                groups = self.__group_partials(partials, chunk_tokens)
+                if len(groups) == len(partials):
+                    break
+                partials = list(executor.map(self.__reduce_group, groups))
+
+        error = self.__find_error(partials)
+        if error:
+            return error
+
+        messages = self.__localize_messages(self.__get_reduce_messages(partials))
+        if self.stream:
+            return self.__stream_pattern(messages)
+        self.__call_ollama(messages)
         self.translate()
         return self.get_response_content()
 
 
     def apply_extra_pattern(self, prompt_template: PromptTemplate, message):
-        message: ChatMessage = prompt_template.format_messages(input=message, llm=self.llm)
+        message: List[ChatMessage] = self.__localize_messages(prompt_template.format_messages(input=message, llm=self.llm))
+        if self.stream:
+            return self.__stream_pattern(message)
         self.__call_ollama(messages=message)
         self.translate()
         return self.get_response_content()
 
 
     def translate(self) -> None:
-        if self.language != "English":
-            self.__set_translation_prompt(self.language)
-            self.__call_ollama([ChatMessage(role="system", content=self.translation_prompt), ChatMessage(role="user", content=self.get_response_content())])			
+        if self.__translation_needed():
+            with span("translate"):
+                self.__call_ollama(self.__get_translation_messages())
+
+
+    def __translation_needed(self) -> bool:
+        # The answer is already localized when the language instruction is in the system message
+        return self.language != "English" and not self.inline_translation
+
+
+    def __localize_messages(self, messages: List[ChatMessage]) -> List[ChatMessage]:
+        '''
+        Add the target language instruction to the system message, so that one generation gives the localized answer
+        '''
+        if not self.inline_translation or self.language == "English":
+            return messages
+        instruction = self.LANGUAGE_PROMPT.format(language=self.language)
+        if messages and messages[0].role == "system":
+            return [ChatMessage(role="system", content=(messages[0].content or "") + "\n" + instruction)] + list(messages[1:])
+        return [ChatMessage(role="system", content=instruction)] + list(messages)
+
+
+    def __get_translation_messages(self) -> List[ChatMessage]:
+        self.__set_translation_prompt(self.language)
+        return [ChatMessage(role="system", content=self.translation_prompt), ChatMessage(role="user", content=self.get_response_content())]
+
+
+    def __stream_pattern(self, messages: List[ChatMessage]) -> Generator:
+        '''
+        Stream the response of the pattern, or of its translation when the user asked for another language
+        since the whole answer is needed before translating it
+        '''
+        if self.__translation_needed():
+            self.__call_ollama(messages)
+            with span("translate"):
+                yield from self.__stream_ollama(self.__get_translation_messages())
+            return
+        yield from self.__stream_ollama(messages)
+
+
+
+    def __get_pattern_messages(self, content: str) -> List[ChatMessage]:
+        system_url = f"https://raw.githubusercontent.com/danielmiessler/fabric/main/patterns/{self.pattern}/system.md"
+        user_url = f"https://raw.githubusercontent.com/danielmiessler/fabric/main/patterns/{self.pattern}/user.md"
+
+        # Fetch the prompt content
+        system_content = self.__fetch_content_from_url(system_url)
+        user_file_content = self.__fetch_content_from_url(user_url)
+
+        self.system_pattern_message.content = system_content
+        self.user_pattern_message.content = user_file_content + "\n" + content if user_file_content else content
+        return [self.system_pattern_message, self.user_pattern_message]
+
+
+    def __get_reduce_messages(self, partials: List[str]) -> List[ChatMessage]:
+        system_message, user_message = self.__get_pattern_messages(self.__join_partials(partials))
+        system_message.content = system_message.content + "\n" + self.REDUCE_PROMPT
+        return [system_message, user_message]
+
+
+    def __join_partials(self, partials: List[str]) -> str:
+        return "\n\n---\n\n".join(partials)
+
+
+    def __find_error(self, partials: List[str]) -> Union[str, None]:
+        return next((partial for partial in partials if partial.startswith("Error")), None)
+
+
+    def __group_partials(self, partials: List[str], max_tokens: int) -> List[List[str]]:
+        groups = [[]]
+        size = 0
+        for partial in partials:
+            tokens = estimate_tokens(partial)
+            if groups[-1] and size + tokens > max_tokens:
+                groups.append([])
+                size = 0
+            groups[-1].append(partial)
+            size += tokens
+        return groups
+
+
+    def __map_chunk(self, chunk: str) -> str:
+        # Each chunk on its own Fabric, the response is kept in English until the final merge
+        fabric = self.fork()
+        fabric.__call_ollama(fabric.__get_pattern_messages(chunk))
+        return fabric.get_response_content()
+
+
+    def __reduce_group(self, partials: List[str]) -> str:
+        if len(partials) == 1:
+            return partials[0]
+        fabric = self.fork()
+        fabric.__call_ollama(fabric.__get_reduce_messages(partials))
+        return fabric.get_response_content()
 
 
     def __set_translation_prompt(self, language: str):
@@ -229,32 +512,59 @@ class Fabric():
 """
 
 
+    async def aprefetch_patterns(self) -> str:
+        """
+        Download the files of every pattern in PATTERNS into the local pattern cache, concurrently
+
+        Returns:
+            str: the number of patterns cached
+        """
+        names = sorted({pattern for pattern in self.get_patterns().values() if is_pattern_name(pattern)})
+        pack = get_pattern_pack()
+        urls = [
+            f"https://raw.githubusercontent.com/danielmiessler/fabric/main/patterns/{name}/{file}"
+            for name in names if pack is None or name not in pack
+            for file in ("system.md", "user.md")
+        ]
+        cache = get_pattern_cache()
+        outcomes = await asyncio.gather(*(cache.aget(url, self.__sanitize_content) for url in urls), return_exceptions=True)
+        errors = [outcome for outcome in outcomes if isinstance(outcome, Exception)]
+        if errors:
+            raise errors[0]
+        return f"{len(names)} patterns"
+
+
     # Pull the URL content's from the GitHub repo
     def __fetch_content_from_url(self, url):
-        """    Fetches content from the given URL.
+        """    Fetches content from the given URL through the local pattern cache.
 
         Args:
             url (str): The URL from which to fetch content.
 
         Returns:
-            str: The sanitized content fetched from the URL.
+            str: The sanitized content fetched from the URL or from the cache.
 
         Raises:
-            requests.RequestException: If an error occurs while making the request to the URL.
+            httpx.HTTPError: If an error occurs while making the request to the URL.
         """
 
+        pack = get_pattern_pack()
+        content = pack.lookup_url(url) if pack is not None else None
+        if content is not None:
+            return content
+
         try:
-            response = requests.get(url)
-            response.raise_for_status()
-            sanitized_content = self.__sanitize_content(response.text)
+            with span("pattern_fetch"):
+                sanitized_content = get_pattern_cache().get(url, self.__sanitize_content)
+            if self.DEBUG: print(f"Fabric pattern cache: {get_pattern_cache().stats}")
             return sanitized_content
-        except requests.RequestException as e:
+        except httpx.HTTPError as e:
             return f"Error fetching Fabric Patterns: {str(e)}"
         
 
     # Sanitize the content, sort of. Prompt injection is the main threat so this isn't a huge deal
     def __sanitize_content(self, content):
-        """    Sanitize the content by removing characters that do not match the ALLOWLIST_PATTERN.
+        """    Sanitize the content by removing the characters outside the allowlist (letters, digits, whitespace and .,;:!?-).
 
         Args:
             content (str): The content to be sanitized.
@@ -263,7 +573,21 @@ class Fabric():
             str: The sanitized content.
         """
 
-        return "".join(char for char in content if self.ALLOWLIST_PATTERN.match(char))
+        return sanitize_pattern(content)
+
+
+    def __lookup_cache(self, messages: List[ChatMessage]) -> tuple:
+        '''
+        Returns the LLM response cache (None when disabled), the key of the request and the cached answer if any
+        '''
+        cache = get_llm_cache()
+        if cache is None:
+            return None, None, None
+        key = cache.key(self.llm, messages, self.language)
+        cached = cache.get(key)
+        inc("llm_cache_total", result="miss" if cached is None else "hit")
+        if self.DEBUG and cached is not None: print(f"LLM response cache hit: {cache.stats}")
+        return cache, key, cached
 
 
     def __call_ollama(self, messages: List[ChatMessage]) -> None:
@@ -275,12 +599,58 @@ class Fabric():
         Returns:
             str: the response content
         '''
+        cache, key, cached = self.__lookup_cache(messages)
+        if cached is not None:
+            self.response = ChatResponse(message=ChatMessage(role="assistant", content=cached))
+            return
+
         # Build the API call
         try:
             if self.DEBUG: print(f"Ollama Client: {self.llm}")
-            self.response: ChatResponse = self.llm.chat(messages)
+            with self.llm_slots or nullcontext():
+                started = time.perf_counter()
+                self.response: ChatResponse = self.llm.chat(messages)
+            observe_llm(self.llm.model, self.response.raw, started)
         except Exception as e:
             self.response = f"Error with the Ollama call in Fabric pattern workflow: {str(e)}"
+            return
+        if cache: cache.set(key, self.response.message.content)
+
+
+    def __stream_ollama(self, messages: List[ChatMessage]) -> Generator:
+        '''
+        Call OLLAMA API in streaming mode
+        Args:
+            messages (List[ChatMessage]): a List of ChatMessages with user message and system message
+
+        Yields:
+            str: the response content, chunk by chunk as it's generated
+        '''
+        cache, key, cached = self.__lookup_cache(messages)
+        if cached is not None:
+            self.response = cached
+            yield cached
+            return
+
+        content = ""
+        try:
+            if self.DEBUG: print(f"Ollama Client (streaming): {self.llm}")
+            started, first_chunk, raw = time.perf_counter(), None, None
+            for chunk in self.llm.stream_chat(messages):
+                first_chunk = first_chunk or time.perf_counter()
+                raw = chunk.raw
+                delta = chunk.delta or ""
+                content += delta
+                yield delta
+            observe_llm(self.llm.model, raw, started, first_chunk)
+        except Exception as e:
+            error = f"Error with the Ollama call in Fabric pattern workflow: {str(e)}"
+            self.response = content + error
+            yield error
+            return
+        # Only complete answers are cached, an interrupted stream never gets here
+        self.response = content
+        if cache: cache.set(key, content)
 
 
 class Tools:
@@ -290,29 +660,133 @@ class Tools:
 
     def _extract_url(self, text):
         """
-        Extracts URL(s) from the given text.
+        Extracts the first URL of the given text, like _extract_urls.
         
         Args:
             text (str): The input string containing one or more URLs.
         
         Returns:
-            list: A list of extracted URLs.
+            str: The first URL, without the punctuation ending a sentence; an empty list when there is none.
         """
-        url_pattern = r'http[s]?://(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\\(\\),]|(?:%[0-9a-fA-F][0-9a-fA-F]))+'
-        
-        urls = re.findall(url_pattern, text)
-        
+        urls = self._extract_urls(text)
         return urls[0] if len(urls) > 0 else urls
+
+
+    def _extract_urls(self, text) -> List[str]:
+        """
+        Extracts every URL of the given text, once each and in order, i.e. "summarize these videos: url1, url2".
+
+        Args:
+            text (str): The input string containing one or more URLs.
+
+        Returns:
+            list: The URLs, without the punctuation ending a sentence or separating them.
+        """
+        url_pattern = r'http[s]?://(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\\(\\),]|(?:%[0-9a-fA-F][0-9a-fA-F]))+'
+        urls = [url.rstrip(".,;:!?)") for url in re.findall(url_pattern, text or "")]
+        return list(dict.fromkeys(url for url in urls if url))
         
 
 class YouTubeTool(Tools):
-    def __init__(self, fabric: Fabric = None):        
+    TRANSCRIPT_LANGUAGES = ("en",)
+
+    def __init__(
+        self,
+        fabric: Fabric = None,
+        chunk_tokens: int = 20000,
+        chunk_overlap_tokens: int = 200,
+        chunk_parallelism: int = 2,
+        url: Optional[str] = None,
+        max_urls: int = 10,
+        batch_concurrency: int = 4,
+        batch_llm_concurrency: int = 2,
+        rate_limit: float = 0,
+        rate_burst: int = 5,
+        rate_limit_wait: float = 30,
+        compress: bool = False,
+        target_tokens: int = 0
+    ):
         super().__init__()
         self.fabric = fabric
-        self.url = super()._extract_url(self.fabric.get_user_message())
+        self.chunk_tokens = chunk_tokens
+        self.chunk_overlap_tokens = chunk_overlap_tokens
+        self.chunk_parallelism = chunk_parallelism
+        self.batch_concurrency = batch_concurrency
+        self.batch_llm_concurrency = batch_llm_concurrency
+        # Transcript downloads per minute, shared by the worker processes (0 for no limit)
+        self.rate_limit = rate_limit
+        self.rate_burst = rate_burst
+        self.rate_limit_wait = rate_limit_wait
+        # Transcript compression before the pattern, target_tokens 0 for no token budget
+        self.compress = compress
+        self.target_tokens = target_tokens
+        # Every video of the message, self.url being the first one (an empty list when there is none)
+        self.urls = [url] if url else self._extract_urls(self.fabric.get_user_message())[:max(max_urls, 1)]
+        self.url = self.urls[0] if self.urls else []
         self.DEBUG = os.getenv("DEBUG", False)
 
 
+    def get_video_id(self) -> Union[str, None]:
+        if not isinstance(self.url, str):
+            return None
+        for pattern in YOUTUBE_URL_PATTERNS:
+            match = re.search(pattern, self.url)
+            if match:
+                return match.group(1)
+        return None
+
+
+    def get_video_ids(self) -> List[str]:
+        """
+        The ids of the videos of the message, the URL itself when it has none
+        """
+        return [YouTubeTool(self.fabric, url=url).get_video_id() or url for url in self.urls]
+
+
+    def get_youtube_transcripts(self) -> Union[str, Generator]:
+        """
+        Provides the output of get_youtube_transcript for every video of the message, under its URL.
+        The transcripts are downloaded concurrently and the pattern applied to each one as soon as it's ready,
+        at most batch_llm_concurrency at a time; when streaming, each output is sent as it completes.
+
+        :return: The outputs, a generator of them when streaming; the output of get_youtube_transcript for a single video.
+        """
+        if len(self.urls) <= 1:
+            return self.get_youtube_transcript()
+
+        # Each video on its own tool and Fabric, the outputs are complete (not streamed) answers.
+        # The forks share the Ollama slots: the map calls of the long transcripts count too, so the videos and their
+        # chunks together never exceed batch_llm_concurrency calls (rather than batch_llm_concurrency x chunk_parallelism)
+        fabric = self.fabric.fork()
+        fabric.llm_slots = threading.BoundedSemaphore(max(self.batch_llm_concurrency, 1))
+        tools = [
+            YouTubeTool(
+                fabric.fork(),
+                chunk_tokens=self.chunk_tokens,
+                chunk_overlap_tokens=self.chunk_overlap_tokens,
+                chunk_parallelism=self.chunk_parallelism,
+                url=url,
+                rate_limit=self.rate_limit,
+                rate_burst=self.rate_burst,
+                rate_limit_wait=self.rate_limit_wait,
+                compress=self.compress,
+                target_tokens=self.target_tokens
+            )
+            for url in self.urls
+        ]
+        results = run_batch(
+            tools,
+            fetch=lambda tool: tool.fetch_transcript(),
+            apply=lambda tool, transcript: tool.apply_pattern(transcript),
+            max_workers=self.batch_concurrency,
+            # Bounded by the slots of the Fabric instead, a video waiting for its chunks must not hold one
+            llm_concurrency=len(tools)
+        )
+        if self.fabric.stream:
+            return stream_batch(self.urls, results)
+        return join_batch(self.urls, results)
+
+
     def get_youtube_transcript(self) -> str:
         """
         Provides the title and full transcript of a YouTube video in English.
@@ -321,7 +795,20 @@ class YouTubeTool(Tools):
 
         :return: The title and full transcript of the YouTube video in English, or an error message.
         """
+        transcript = self.fetch_transcript()
+        if transcript.startswith("Error"):
+            return transcript
+        try:
+            return self.apply_pattern(transcript)
+        except Exception as e:
+            error_message = f"Error: {str(e)}"
+            return error_message
+
 
+    def fetch_transcript(self) -> str:
+        """
+        The transcript of the video, one caption per line, or an error message.
+        """
         try:
             error_message = f"Error: Invalid YouTube URL: {self.url}"
             if not self.url or self.url == "":
@@ -330,45 +817,97 @@ class YouTubeTool(Tools):
             print(f'URL: {self.url}')
 
             if type(self.url) == str and is_youtube_video(self.url):
-                loader = YoutubeTranscriptReader()
-                if self.DEBUG and os.getenv("TEST_TEXT"):  # Avoid calling YT API just for local testing
-                    transcript = [Document(id_='-IAwW3pUEew', 
-                                           embedding=None, 
-                                           metadata={'video_id': '-IAwW3pUEew'}, 
-                                           excluded_embed_metadata_keys=[], 
-                                           excluded_llm_metadata_keys=[], 
-                                           relationships={}, 
-                                           text=os.getenv("TEST_TEXT"), 
-                                           mimetype='text/plain', 
-                                           start_char_idx=None, 
-                                           end_char_idx=None, 
-                                           text_template='{metadata_str}\n\n{content}', 
-                                           metadata_template='{key}: {value}', 
-                                           metadata_seperator='\n'
-                                           )
-                                ]
-                else:
-                    transcript = loader.load_data(
-                        ytlinks=[self.url]
-                    )
-                if self.DEBUG: print(f'Youtube Transcript: {transcript}')
-                
-                if len(transcript) == 0:
+                transcript = self.__load_transcript()
+                if not transcript:
                     error_message = f"Error: Failed to find transcript for {self.url}"
                     return error_message
             else:
                 error_message = f"Error: This '{self.url}' is not a Youtube video url"
                 return error_message
-                
-            # title = transcript[0].metadata["video_id"]
-            transcript = " ".join([document.text.replace('\n', ' ') for document in transcript])
-            
-            if self.fabric.get_pattern():
-                if self.DEBUG: print(f"Inside the PATTERN: {self.fabric.get_pattern()}")                
-                return self.fabric.apply_pattern(transcript)
             return transcript
 
+        except RateLimitTimeout as e:
+            error_message = f"Error: YouTube is limiting the transcript downloads, try again in a few minutes ({str(e)})"
+            return error_message
         except Exception as e:
             error_message = f"Error: {str(e)}"
             return error_message
 
+
+    def apply_pattern(self, transcript: str) -> Union[str, Generator]:
+        """
+        The output of the Fabric pattern for the transcript, or the transcript itself when there is no pattern.
+        """
+        if self.fabric.get_pattern():
+            if self.DEBUG: print(f"Inside the PATTERN: {self.fabric.get_pattern()}")
+            if self.compress:
+                transcript = self.compress_transcript(transcript)
+            return self.fabric.apply_pattern_chunked(
+                transcript,
+                chunk_tokens=self.chunk_tokens,
+                overlap_tokens=self.chunk_overlap_tokens,
+                parallelism=self.chunk_parallelism
+            )
+        return transcript.replace('\n', ' ')
+
+
+    def compress_transcript(self, transcript: str) -> str:
+        """
+        The transcript without its redundancy (and its least salient sentences above target_tokens), see utils/pipelines/compress.py.
+        The transcript itself when the compression fails, it's only an optimization.
+        """
+        started = time.perf_counter()
+        try:
+            compressed = compress_transcript(transcript, max_tokens=self.target_tokens)
+        except Exception as e:
+            if self.DEBUG: print(f"Transcript compression failed: {e}")
+            return transcript
+        observe_stage("compress", time.perf_counter() - started, target="youtube")
+        if not compressed:
+            return transcript
+        inc("transcript_tokens_total", estimate_tokens(transcript), stage="raw")
+        inc("transcript_tokens_total", estimate_tokens(compressed), stage="compressed")
+        if self.DEBUG: print(f"Transcript compressed from {estimate_tokens(transcript)} to {estimate_tokens(compressed)} tokens")
+        return compressed
+
+
+    def __load_transcript(self) -> str:
+        """
+        Returns the transcript of the video, with one caption per line, from the transcript cache when available.
+        Transcripts don't change once published, so they are cached on disk by video id and caption language.
+        """
+        if self.DEBUG and os.getenv("TEST_TEXT"):  # Avoid calling YT API just for local testing
+            return os.getenv("TEST_TEXT")
+
+        started = time.perf_counter()
+        video_id = self.get_video_id()
+        key = f"{video_id}:{','.join(self.TRANSCRIPT_LANGUAGES)}"
+        store = get_store(
+            "youtube_transcripts",
+            ttl=float(os.getenv("YOUTUBE_TRANSCRIPT_CACHE_TTL", 30 * 24 * 60 * 60)),
+            max_bytes=int(os.getenv("YOUTUBE_TRANSCRIPT_CACHE_MAX_BYTES", 200 * 1024 * 1024)),
+        )
+        transcript = store.get_text(key) if video_id else None
+        if transcript is not None:
+            if self.DEBUG: print(f"Transcript of {video_id} found in cache")
+            observe_stage("transcript_fetch", time.perf_counter() - started, source="cache")
+            return transcript
+
+        loader = YoutubeTranscriptReader()
+        load = lambda: loader.load_data(
+            ytlinks=[self.url],
+            languages=list(self.TRANSCRIPT_LANGUAGES)
+        )
+        if self.rate_limit > 0:
+            # Queued behind the other downloads of every worker process, retried after a backoff on 429s
+            limiter = get_rate_limiter("youtube_transcripts", rate=self.rate_limit / 60, burst=self.rate_burst)
+            documents = limiter.call(load, timeout=self.rate_limit_wait)
+        else:
+            documents = load()
+        if self.DEBUG: print(f'Youtube Transcript: {documents}')
+
+        transcript = "\n".join([document.text for document in documents])
+        observe_stage("transcript_fetch", time.perf_counter() - started, source="youtube")
+        if video_id and transcript:
+            store.set_text(key, transcript)
+        return transcript
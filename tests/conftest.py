@@ -0,0 +1,42 @@
+import os
+import sys
+import tempfile
+import importlib
+
+import pytest
+
+# The tests import the pipelines and utils packages from the root of the repository, like the pipelines server
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# The stores and the rate limiters keep their files in the cache folder: a new one for every run, without LLM cache
+os.environ["PIPELINES_CACHE_DIR"] = tempfile.mkdtemp(prefix="pipelines-tests-")
+os.environ["LLM_CACHE_MAX_BYTES"] = "0"
+
+
+@pytest.fixture(scope="session")
+def services():
+    """
+    The local fake BBC, YouTube, Fabric patterns and Ollama (benchmarks/fake_services.py), installed in the shared HTTP client
+    """
+    from benchmarks.fake_services import FakeServices, install
+
+    with FakeServices(prefill_tps=1e6, decode_tps=1e5) as services:
+        install(services)
+        yield services
+
+
+@pytest.fixture
+def new_pipeline(request):
+    """
+    A factory of pipelines of the module given as parameter (i.e. pipelines.bbc_news_daily_feeds), on the fake Ollama:
+        @pytest.mark.parametrize("new_pipeline", ["pipelines.bbc_news_daily_feeds"], indirect=True)
+    """
+    module = importlib.import_module(request.param)
+
+    def new():
+        pipeline = module.Pipeline()
+        pipeline.valves.OLLAMA_HOST = "http://ollama.local:11434"
+        pipeline.valves.OLLAMA_MODEL_NAME = "fake"
+        pipeline.set_llm()
+        return pipeline
+
+    return new
@@ -0,0 +1,45 @@
+from utils.pipelines.article import extract_article_paragraphs
+
+PAGE = """<!DOCTYPE html>
+<html><head>
+<title>Markets rally - BBC News</title>
+<script>window.__INITIAL_DATA__ = {"p": "<p>not the article</p>"};</script>
+<style>p { color: red }</style>
+</head><body>
+<nav><ul><li><a href="/news">Home</a></li><li><p>Menu paragraph</p></li></ul></nav>
+<article>
+  <header><h1>Markets rally</h1></header>
+  <p>Stocks rose on <b>Monday</b> &amp; bonds fell.</p>
+  <script type="application/ld+json">{"headline": "Markets rally"}</script>
+  <figure><img src="chart.png" alt="chart"/><figcaption>A chart</figcaption></figure>
+  <p>Analysts said the caf&eacute; index<br/>was up 2&#37;.
+  <p>Central banks <noscript>Enable JavaScript</noscript>will meet next week.</p>
+  <svg><text>logo</text></svg>
+</article>
+<footer><p>Copyright BBC</p><script>track()</script></footer>
+</body></html>
+""".encode("utf-8")
+
+
+def test_only_the_article_paragraphs_are_extracted():
+    assert extract_article_paragraphs([PAGE]) == [
+        "Stocks rose on Monday & bonds fell.",
+        "Analysts said the café indexwas up 2%.\n  ",
+        "Central banks will meet next week.",
+    ]
+
+
+def test_reading_stops_once_the_article_is_closed():
+    read = []
+
+    def chunks():
+        for start in range(0, len(PAGE), 16):
+            read.append(start)
+            yield PAGE[start:start + 16]
+
+    assert len(extract_article_paragraphs(chunks())) == 3
+    assert read[-1] < PAGE.index(b"<footer>")
+
+
+def test_page_without_article():
+    assert extract_article_paragraphs([b"<html><body><p>No article</p></body></html>"]) is None
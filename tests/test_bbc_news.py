@@ -0,0 +1,116 @@
+import time
+import threading
+
+import pytest
+
+from benchmarks.fake_services import ARTICLE_IDS
+from utils.pipelines import pattern_pack
+from utils.pipelines.pattern_pack import build_pack, default_pack_path
+from utils.pipelines.seen_items import get_seen_items
+
+
+pytestmark = pytest.mark.parametrize("new_pipeline", ["pipelines.bbc_news_daily_feeds"], indirect=True)
+
+
+@pytest.fixture
+def pack():
+    path = default_pack_path()
+    build_pack(iter([("create_quiz", {"system.md": "Write a quiz.", "user.md": ""}), ("summarize", {"system.md": "Summarize.", "user.md": ""})]), path)
+    pattern_pack._checked_at = None
+    yield path
+    path.unlink()
+    pattern_pack._checked_at = None
+
+
+def test_pack_pattern_processes_the_article(services, pack, new_pipeline):
+    pipeline = new_pipeline()
+    articles = services.stats["articles"]
+    answer = pipeline.pipe(f"create_quiz https://www.bbc.com/news/articles/{ARTICLE_IDS[0]}", "bbc", [], {"stream": False})
+    assert services.stats["articles"] == articles + 1
+    assert "Link:" not in answer
+
+
+def test_digest_without_pattern(services, new_pipeline):
+    pipeline = new_pipeline()
+    chats = services.stats["chat"]
+    answer = pipeline.pipe("give me the world digest", "bbc", [], {"stream": False})
+    assert answer.count("Link:") == 25
+    assert services.stats["chat"] == chats
+
+
+def whats_new(pipeline, body: dict) -> str:
+    answer = pipeline.pipe("what's new?", "bbc", [], body)
+    return answer if isinstance(answer, str) else "".join(answer)
+
+
+def test_streamed_digest_is_marked_once_read(services, new_pipeline):
+    pipeline = new_pipeline()
+    body = {"stream": True, "user": {"id": "reader"}}
+    # The commentary is streamed after the digest
+    chunks = pipeline.pipe("what's new? with your commentary", "bbc", [], body)
+    assert not isinstance(chunks, str)
+    # Nothing is marked while the digest hasn't been read
+    assert get_seen_items("bbc_seen_items").store.get("user:reader") is None
+    assert "".join(chunks).count("Link:") == 25
+    # The next digest only has the 15 other stories of the feed
+    assert whats_new(pipeline, {**body, "stream": False}).count("Link:") == 15
+
+
+def test_failed_digest_is_not_marked(services, monkeypatch, new_pipeline):
+    from pipelines.bbc_news_daily_feeds import BBCDailyDigest
+
+    pipeline = new_pipeline()
+    body = {"stream": False, "user": {"id": "unlucky"}}
+    monkeypatch.setattr(BBCDailyDigest, "render_feed_items", lambda self, items, errors: "Error with the Ollama call in Fabric pattern workflow: down")
+    assert whats_new(pipeline, body).startswith("Error")
+    monkeypatch.undo()
+    assert whats_new(pipeline, body).count("Link:") == 25
+
+
+def test_concurrent_digests_fetch_the_feeds_once(services, monkeypatch, new_pipeline):
+    from pipelines.bbc_news_daily_feeds import BBCDailyDigest
+
+    collect = BBCDailyDigest.collect_feed_items
+    calls = []
+
+    def slow_collect(self, types):
+        calls.append(types)
+        time.sleep(0.3)
+        return collect(self, types)
+
+    monkeypatch.setattr(BBCDailyDigest, "collect_feed_items", slow_collect)
+    pipeline = new_pipeline()
+    answers = []
+    bodies = [{"stream": False, "user": {"id": f"reader-{index}"}} for index in range(5)]
+    threads = [threading.Thread(target=lambda body=body: answers.append(whats_new_digest(pipeline, body))) for body in bodies]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+    assert len(calls) == 1
+    assert [answer.count("Link:") for answer in answers] == [25] * 5
+
+
+def whats_new_digest(pipeline, body: dict) -> str:
+    return pipeline.pipe("what's new in world, business and technology news?", "bbc", [], body)
+
+
+def test_localized_digest_translates_descriptions_and_labels_in_one_call(services, monkeypatch, new_pipeline):
+    from pipelines.bbc_news_daily_feeds import Fabric
+
+    calls = []
+
+    def localize_lines(self, lines):
+        calls.append(lines)
+        return [f"IT {line}" for line in lines]
+
+    monkeypatch.setattr(Fabric, "localize_lines", localize_lines)
+    pipeline = new_pipeline()
+    answer = pipeline.pipe("give me the world digest it", "bbc", [], {"stream": False})
+    assert len(calls) == 1
+    assert calls[0][-4:] == ["Title", "Description", "Link", "Published at"]
+    assert len(calls[0]) == 2 * 25 + 4
+    first = answer.split("\n\n")[0].splitlines()
+    assert first[0].startswith("IT Title: IT ")
+    assert first[1].startswith("IT Description: IT ")
+    assert answer.count("IT Link: https://") == 25
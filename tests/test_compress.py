@@ -0,0 +1,35 @@
+from utils.pipelines.compress import clean_caption, compress_transcript, dedupe_captions
+from utils.pipelines.text import estimate_tokens
+
+
+def test_rolling_captions_are_deduplicated():
+    captions = ["so today we talk about", "we talk about the economy", "the economy and the budget", "the budget"]
+    assert dedupe_captions(captions) == ["so today we talk about", "the economy", "and the budget"]
+
+
+def test_a_single_word_in_common_is_kept():
+    assert dedupe_captions(["we said yes", "yes we did"]) == ["we said yes", "yes we did"]
+
+
+def test_hesitations_annotations_and_stutters_are_removed():
+    assert clean_caption("[Music] um so the the budget uh grows") == "so the budget grows"
+    # Repeated words that are often right are kept
+    assert clean_caption("I know that that is true") == "I know that that is true"
+
+
+def test_near_duplicate_sentences_are_dropped():
+    transcript = "The budget grows by five percent.\nInflation stays high this year.\nThe budget grows by five percent!"
+    assert compress_transcript(transcript) == "The budget grows by five percent.\nInflation stays high this year."
+
+
+def test_budget_keeps_the_salient_units_in_order():
+    sentences = [f"The budget {topic} point {index} matters." for topic in ("deficit", "deficit", "deficit", "tax") for index in range(10)]
+    compressed = compress_transcript("\n".join(sentences), max_tokens=60)
+    kept = compressed.splitlines()
+    assert estimate_tokens(compressed) <= 60
+    assert kept == sorted(kept, key=sentences.index)
+
+
+def test_short_transcripts_are_returned():
+    assert compress_transcript("") == ""
+    assert compress_transcript("one line") == "one line"
@@ -0,0 +1,42 @@
+import asyncio
+
+import httpx
+
+from utils.pipelines import http_client
+from utils.pipelines.http_client import HttpClient, aclose_http_client, get_http_client, set_http_client
+
+
+def new_client() -> HttpClient:
+    transport = httpx.MockTransport(lambda request: httpx.Response(200, text="ok"))
+    return HttpClient(transport=transport, async_transport=transport)
+
+
+def test_close_closes_both_clients():
+    client = new_client()
+    assert client.client.get("http://example.com").text == "ok"
+    client.close()
+    assert client.client.is_closed
+    assert client.async_client.is_closed
+
+
+def test_aclose_from_the_event_loop():
+    client = new_client()
+
+    async def use_and_close():
+        assert (await client.async_client.get("http://example.com")).text == "ok"
+        await client.aclose()
+
+    asyncio.run(use_and_close())
+    assert client.client.is_closed
+    assert client.async_client.is_closed
+
+
+def test_shutdown_closes_the_process_client(monkeypatch):
+    monkeypatch.setattr(http_client, "_http_client", None)
+    client = new_client()
+    set_http_client(client)
+    asyncio.run(aclose_http_client())
+    assert client.async_client.is_closed
+    # The next use gets a new client
+    assert get_http_client() is not client
+    asyncio.run(aclose_http_client())
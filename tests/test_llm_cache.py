@@ -0,0 +1,73 @@
+import os
+import time
+import sqlite3
+from types import SimpleNamespace
+
+from utils.pipelines.llm_cache import LLMResponseCache
+from utils.pipelines.store import SqliteStore
+
+
+def llm(**overrides):
+    return SimpleNamespace(**{"model": "llama3.1", "temperature": 0.5, "context_window": 30000, "additional_kwargs": {}, **overrides})
+
+
+def messages(pattern: str = "summarize", content: str = "the article"):
+    return [SimpleNamespace(role="system", content=f"# {pattern} instructions"), SimpleNamespace(role="user", content=content)]
+
+
+def accessed_at(store: SqliteStore, key: str) -> float:
+    with sqlite3.connect(store.path) as connection:
+        return connection.execute("SELECT accessed_at FROM entries WHERE key = ?", (key,)).fetchone()[0]
+
+
+def test_key_covers_everything_that_changes_the_answer():
+    key = LLMResponseCache.key(llm(), messages(), "English")
+    assert key == LLMResponseCache.key(llm(), messages(), "English")
+    assert key != LLMResponseCache.key(llm(model="mistral"), messages(), "English")
+    assert key != LLMResponseCache.key(llm(), messages(pattern="extract_wisdom"), "English")
+    assert key != LLMResponseCache.key(llm(), messages(content="another article"), "English")
+    assert key != LLMResponseCache.key(llm(), messages(), "Italian")
+    assert key != LLMResponseCache.key(llm(temperature=0.7), messages(), "English")
+
+
+def test_entries_expire(tmp_path):
+    cache = LLMResponseCache(SqliteStore(tmp_path / "ttl.sqlite3", ttl=0.2, max_bytes=1 << 20))
+    cache.set("answer", "the summary")
+    cache.set("error", "Error with the Ollama call")
+    assert cache.get("answer") == "the summary"
+    assert cache.get("error") is None
+    time.sleep(0.3)
+    assert cache.get("answer") is None
+    assert cache.stats["hits"] == 1
+
+
+def test_reads_are_written_in_batches(tmp_path):
+    store = SqliteStore(tmp_path / "lru.sqlite3", ttl=0, max_bytes=3000)
+    # Random values, zlib can't make them smaller
+    for key in ("first", "second"):
+        store.set(key, os.urandom(1000))
+    written = accessed_at(store, "first")
+    time.sleep(0.01)
+    for _ in range(10):
+        assert store.get("first") is not None
+    # Nothing written by the reads themselves
+    assert accessed_at(store, "first") == written
+
+    # The next write records them, before evicting: "second" is now the least recently used
+    store.set("third", os.urandom(1000))
+    assert accessed_at(store, "first") > written
+    assert store.get("second") is None
+    assert store.get("first") is not None
+    assert store.stats["evictions"] == 1
+
+
+def test_reads_are_written_once_the_batch_is_full(tmp_path):
+    store = SqliteStore(tmp_path / "batch.sqlite3", ttl=0, max_bytes=1 << 20)
+    store.ACCESS_BATCH = 5
+    for index in range(5):
+        store.set(str(index), b"value")
+    written = accessed_at(store, "0")
+    time.sleep(0.01)
+    for index in range(5):
+        store.get(str(index))
+    assert accessed_at(store, "0") > written
@@ -0,0 +1,142 @@
+import os
+import sys
+import json
+import time
+import types
+import threading
+import subprocess
+
+import pytest
+
+from benchmarks.fake_services import FakeServices
+from utils.pipelines.ratelimit import RateLimiter, RateLimitTimeout, is_rate_limited
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# A worker process downloading transcripts through the shared limiter, prints the times of its successful downloads
+CHILD = """
+import sys, json, time, types
+from benchmarks.fake_services import install
+from utils.pipelines.ratelimit import RateLimiter
+client = install(types.SimpleNamespace(url=sys.argv[1])).client
+limiter = RateLimiter(sys.argv[2], rate=float(sys.argv[3]), burst=2)
+
+def download(index):
+    response = client.get(f"https://www.youtube.com/api/timedtext?v={sys.argv[4]}{index:07d}")
+    response.raise_for_status()
+    return time.time()
+
+print(json.dumps([limiter.call(lambda: download(index), timeout=30) for index in range(int(sys.argv[5]))]))
+"""
+
+
+class RateLimited(Exception):
+    def __init__(self) -> None:
+        super().__init__("429 Too Many Requests")
+        self.response = types.SimpleNamespace(status_code=429, headers={})
+
+
+def test_slots_are_spaced_by_the_rate(tmp_path):
+    limiter = RateLimiter(tmp_path / "spacing.json", rate=20, burst=1)
+    times = []
+    for _ in range(6):
+        limiter.acquire(timeout=5)
+        times.append(time.time())
+    gaps = [later - earlier for earlier, later in zip(times, times[1:])]
+    assert min(gaps) >= 0.04
+    assert times[-1] - times[0] >= 5 / 20 - 0.01
+
+
+def test_burst_is_served_at_once(tmp_path):
+    limiter = RateLimiter(tmp_path / "burst.json", rate=2, burst=3)
+    started = time.time()
+    for _ in range(3):
+        limiter.acquire(timeout=5)
+    assert time.time() - started < 0.2
+
+
+def test_no_slot_before_the_deadline_fails_at_once(tmp_path):
+    limiter = RateLimiter(tmp_path / "deadline.json", rate=1, burst=1)
+    limiter.acquire(timeout=0)
+    started = time.time()
+    with pytest.raises(RateLimitTimeout):
+        limiter.acquire(timeout=0.2)
+    assert time.time() - started < 0.1
+    assert limiter.stats["timeouts"] == 1
+
+
+def test_rate_limited_answers_pause_and_halve_the_rate(tmp_path):
+    path = tmp_path / "backoff.json"
+    limiter = RateLimiter(path, rate=10, burst=5)
+    assert limiter.on_rate_limited(retry_after=0.3) == pytest.approx(0.3)
+    # Answers to the requests sent before the pause count once
+    limiter.on_rate_limited(retry_after=0.3)
+    state = json.loads(path.read_text())
+    assert state["rate"] == 5
+    assert state["strikes"] == 1
+
+    started = time.time()
+    limiter.acquire(timeout=5)
+    assert time.time() - started >= 0.25
+    limiter.on_success()
+    assert json.loads(path.read_text())["rate"] == pytest.approx(5.1)
+
+
+def test_waiting_during_a_pause_takes_no_slot(tmp_path):
+    path = tmp_path / "pause.json"
+    limiter = RateLimiter(path, rate=20, burst=1)
+    limiter.on_rate_limited(retry_after=0.3)
+    tat = json.loads(path.read_text())["tat"]
+    waiters = [threading.Thread(target=limiter.acquire, args=(5,)) for _ in range(3)]
+    for waiter in waiters:
+        waiter.start()
+    for waiter in waiters:
+        waiter.join(5)
+    state = json.loads(path.read_text())
+    # Three slots taken once the pause is over, none reserved while it lasted
+    assert limiter.stats["acquired"] == 3
+    assert state["tat"] - max(tat, state["blocked_until"]) == pytest.approx(3 / state["rate"], abs=0.05)
+
+
+def test_call_retries_after_the_backoff(tmp_path):
+    limiter = RateLimiter(tmp_path / "call.json", rate=50, burst=1, base_backoff=0.1)
+    attempts = []
+
+    def download():
+        attempts.append(time.time())
+        if len(attempts) < 3:
+            raise RateLimited()
+        return "transcript"
+
+    assert limiter.call(download, timeout=5) == "transcript"
+    assert len(attempts) == 3
+    assert attempts[-1] - attempts[0] >= 0.1
+    assert limiter.stats["rate_limited"] == 2
+    assert is_rate_limited(RateLimited())
+    # Only the status or the error class count, not the words of a message
+    assert not is_rate_limited(ValueError("Video 429 Too Many Requests not found"))
+    with pytest.raises(RateLimitTimeout):
+        RateLimiter(tmp_path / "timeout.json", rate=50, base_backoff=10).call(lambda: (_ for _ in ()).throw(RateLimited()), timeout=0.5)
+
+
+def test_worker_processes_share_the_limit(tmp_path):
+    """
+    Two processes at 8 downloads per second each would get 429s from an API serving 10 per second;
+    sharing the limiter they don't, and they stay at the configured rate together
+    """
+    rate, downloads = 8, 12
+    with FakeServices(transcript_rate=10, transcript_burst=2, transcript_penalty=1) as services:
+        command = [sys.executable, "-c", CHILD, services.url, str(tmp_path / "youtube.json"), str(rate)]
+        environment = dict(os.environ, PYTHONPATH=ROOT)
+        children = [
+            subprocess.Popen(command + [f"p{index}", str(downloads)], stdout=subprocess.PIPE, text=True, cwd=ROOT, env=environment)
+            for index in range(2)
+        ]
+        outputs = [process.communicate(timeout=60)[0] for process in children]
+        rejected = services.stats["transcripts_429"]
+    assert [process.returncode for process in children] == [0, 0]
+    times = sorted(time for output in outputs for time in json.loads(output.strip().splitlines()[-1]))
+    assert len(times) == 2 * downloads
+    assert rejected == 0
+    # The burst aside, the downloads of both processes together don't go faster than the rate
+    assert (len(times) - 2) / (times[-1] - times[0]) <= rate * 1.1
@@ -0,0 +1,45 @@
+from utils.pipelines.router import PatternRouter
+
+LANGUAGES = {"en": "English", "it": "Italian"}
+PATTERNS = {
+    "summarize": "summarize",
+    "riassumi": "summarize",
+    "extract wisdom": "extract_wisdom",
+    "extract": "extract_article_wisdom",
+    "analyze": "analyze_presentation",
+}
+
+
+def router() -> PatternRouter:
+    return PatternRouter(LANGUAGES, PATTERNS)
+
+
+def test_multi_word_keys():
+    assert router().route("please extract wisdom from this talk") == (None, "extract_wisdom")
+    # Any spacing between the words, and the longest keyword wins over its prefix
+    assert router().route("extract\n   wisdom it") == ("it", "extract_wisdom")
+    assert router().route("extract the wisdom") == (None, "extract_article_wisdom")
+
+
+def test_first_language_and_pattern_win():
+    assert router().route("summarize it then analyze en") == ("it", "summarize")
+    assert router().route("en analyze and summarize it") == ("en", "analyze_presentation")
+    assert router().find_all("analyze, summarize, riassumi and analyze") == ["analyze_presentation", "summarize"]
+    assert router().find_all("it en it", PatternRouter.LANGUAGE) == ["it", "en"]
+
+
+def test_case_insensitive():
+    assert router().route("SUMMARIZE this IT") == ("it", "summarize")
+    assert router().route("Extract Wisdom") == (None, "extract_wisdom")
+
+
+def test_word_boundaries():
+    assert router().route("the summarizer of the item") == (None, None)
+    assert router().route("reanalyze this, italian edition") == (None, None)
+    assert router().route("summarize: https://example.com/it") == ("it", "summarize")
+
+
+def test_empty_router_and_message():
+    assert PatternRouter({}, {}).route("summarize it") == (None, None)
+    assert router().route(None) == (None, None)
+    assert router().find_all("") == []
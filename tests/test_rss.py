@@ -0,0 +1,58 @@
+import pytest
+
+from utils.pipelines.rss import FeedParseError, iter_rss_items
+
+BILLION_LAUGHS = b"""<?xml version="1.0"?>
+<!DOCTYPE lolz [
+ <!ENTITY lol "lol">
+ <!ENTITY lol1 "&lol;&lol;&lol;&lol;&lol;&lol;&lol;&lol;&lol;&lol;">
+ <!ENTITY lol2 "&lol1;&lol1;&lol1;&lol1;&lol1;&lol1;&lol1;&lol1;&lol1;&lol1;">
+ <!ENTITY lol3 "&lol2;&lol2;&lol2;&lol2;&lol2;&lol2;&lol2;&lol2;&lol2;&lol2;">
+]>
+<rss><channel><item><title>&lol3;</title></item></channel></rss>"""
+
+FEED = """<?xml version="1.0" encoding="UTF-8"?>
+<rss version="2.0"><channel>
+<title>BBC News</title>
+<item>
+  <title><![CDATA[Markets <b>rally</b> & recover]]></title>
+  <description>Prices &amp; wages &lt;rise&gt; &#8211; caf&#233; &#x2019;s</description>
+  <link>https://www.bbc.com/news/articles/a1</link>
+  <pubDate>Mon, 01 Jan 2024 10:00:00 GMT</pubDate>
+  <guid isPermaLink="false">a1</guid>
+</item>
+<item>
+  <title>Second</title>
+  <media:thumbnail xmlns:media="http://search.yahoo.com/mrss/" url="https://ichef.bbci.co.uk/a2.jpg"/>
+  <link>https://www.bbc.com/news/articles/a2</link>
+</item>
+</channel></rss>""".encode("utf-8")
+
+
+def chunks(data: bytes, size: int):
+    return [data[start:start + size] for start in range(0, len(data), size)]
+
+
+def test_billion_laughs_is_refused():
+    with pytest.raises(FeedParseError):
+        list(iter_rss_items([BILLION_LAUGHS]))
+
+
+def test_cdata_and_character_entities():
+    first, second = list(iter_rss_items([FEED]))
+    assert first["title"] == "Markets <b>rally</b> & recover"
+    assert first["description"] == "Prices & wages <rise> – café ’s"
+    assert first["published"] == "Mon, 01 Jan 2024 10:00:00 GMT"
+    assert first["guid"] == "a1"
+    assert second == {"title": "Second", "description": None, "link": "https://www.bbc.com/news/articles/a2", "published": None, "guid": None}
+
+
+def test_items_are_the_same_whatever_the_chunks():
+    # Chunks of 7 bytes cut the tags, the CDATA sections and the multi-byte characters
+    assert list(iter_rss_items(chunks(FEED, 7))) == list(iter_rss_items([FEED]))
+    assert [item["link"] for item in iter_rss_items(chunks(FEED, 7), max_items=1)] == ["https://www.bbc.com/news/articles/a1"]
+
+
+def test_malformed_feed():
+    with pytest.raises(FeedParseError):
+        list(iter_rss_items([b"<rss><channel><item><title>cut</channel></rss>"]))
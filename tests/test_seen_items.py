@@ -0,0 +1,43 @@
+import threading
+
+from utils.pipelines.seen_items import SeenItems
+from utils.pipelines.store import SqliteStore
+
+
+def story(index: int) -> dict:
+    return {"guid": f"story-{index}", "link": f"https://www.bbc.com/news/articles/{index}"}
+
+
+def test_marked_items_are_not_new(tmp_path):
+    seen_items = SeenItems(SqliteStore(tmp_path / "seen.sqlite3", ttl=0, max_bytes=1 << 20))
+    seen_items.mark("user:1", [story(1), story(2)])
+    assert seen_items.unseen("user:1", [story(1), story(2), story(3)]) == [story(3)]
+    assert seen_items.unseen("user:2", [story(1)]) == [story(1)]
+    # The same story republished with another GUID is still seen
+    assert seen_items.unseen("user:1", [{"guid": "new-guid", "link": story(1)["link"]}]) == []
+
+
+def test_concurrent_marks_are_merged(tmp_path):
+    path = tmp_path / "seen.sqlite3"
+    # One store per worker, like separate processes sharing the database
+    workers = [SeenItems(SqliteStore(path, ttl=0, max_bytes=1 << 20)) for _ in range(4)]
+    barrier = threading.Barrier(len(workers))
+
+    def mark(index: int) -> None:
+        barrier.wait()
+        for batch in range(10):
+            workers[index].mark("user:1", [story(index * 100 + batch)])
+
+    threads = [threading.Thread(target=mark, args=(index,)) for index in range(len(workers))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(30)
+    stories = [story(index * 100 + batch) for index in range(len(workers)) for batch in range(10)]
+    assert workers[0].unseen("user:1", stories) == []
+
+
+def test_oldest_marks_are_dropped(tmp_path):
+    seen_items = SeenItems(SqliteStore(tmp_path / "seen.sqlite3", ttl=0, max_bytes=1 << 20), max_items=4)
+    seen_items.mark("user:1", [{"guid": f"story-{index}"} for index in range(6)])
+    assert seen_items.unseen("user:1", [{"guid": f"story-{index}"} for index in range(6)]) == [{"guid": "story-0"}, {"guid": "story-1"}]
@@ -0,0 +1,122 @@
+import threading
+import time
+
+import pytest
+
+from utils.pipelines.singleflight import SingleFlight
+
+
+def wait_for(condition, timeout: float = 5.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.001)
+
+
+def run_concurrently(flight: SingleFlight, key, compute, requests: int, stream: bool = False) -> list:
+    """
+    Run the leader, wait until it's computing, then the followers; returns what every request got (or raised)
+    """
+    results = [None] * requests
+
+    def request(index: int) -> None:
+        try:
+            answer = flight.run(key, compute, stream=stream)
+            results[index] = list(answer) if stream and not isinstance(answer, str) else answer
+        except Exception as e:
+            results[index] = e
+
+    threads = [threading.Thread(target=request, args=(index,)) for index in range(requests)]
+    threads[0].start()
+    wait_for(lambda: key in flight._flights)
+    for thread in threads[1:]:
+        thread.start()
+    wait_for(lambda: flight.stats["followers"] == requests - 1)
+    return threads, results
+
+
+def test_identical_requests_are_computed_once():
+    flight = SingleFlight("test")
+    release = threading.Event()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        release.wait(5)
+        return "answer"
+
+    threads, results = run_concurrently(flight, "key", compute, 5)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    assert results == ["answer"] * 5
+    assert len(calls) == 1
+    assert flight.stats == {"leaders": 1, "followers": 4}
+
+
+def test_later_requests_compute_again():
+    flight = SingleFlight("test")
+    assert flight.run("key", lambda: "first") == "first"
+    assert flight.run("key", lambda: "second") == "second"
+    assert flight.stats == {"leaders": 2, "followers": 0}
+    assert flight._flights == {}
+
+
+def test_the_error_is_shared():
+    flight = SingleFlight("test")
+    release = threading.Event()
+
+    def compute():
+        release.wait(5)
+        raise ValueError("boom")
+
+    threads, results = run_concurrently(flight, "key", compute, 3)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    assert all(isinstance(result, ValueError) for result in results)
+    with pytest.raises(KeyError):
+        flight.run("other", lambda: {}["missing"])
+
+
+def test_streams_are_shared_from_the_start():
+    flight = SingleFlight("test")
+    release = threading.Event()
+    pulled = []
+
+    def chunks():
+        for index in range(5):
+            release.wait(5)
+            pulled.append(index)
+            yield f"{index} "
+
+    threads, results = run_concurrently(flight, "key", chunks, 4, stream=True)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    assert results == [["0 ", "1 ", "2 ", "3 ", "4 "]] * 4
+    # Every chunk is generated once, whoever pulled it
+    assert pulled == [0, 1, 2, 3, 4]
+
+
+def test_streams_are_joined_for_the_requests_not_streaming():
+    flight = SingleFlight("test")
+    assert flight.run("key", lambda: iter(["a", "b"]), stream=False) == "ab"
+
+
+def test_abandoned_stream_is_closed():
+    flight = SingleFlight("test")
+    closed = threading.Event()
+
+    def chunks():
+        try:
+            while True:
+                yield "chunk"
+        finally:
+            closed.set()
+
+    answer = flight.run("key", chunks, stream=True)
+    assert next(answer) == "chunk"
+    answer.close()
+    assert closed.is_set()
+    assert flight._flights == {}
@@ -0,0 +1,70 @@
+import asyncio
+
+from utils.pipelines.snapshots import Snapshot, SnapshotScheduler
+
+
+def failing_job():
+    raise RuntimeError("feeds down")
+
+
+def test_miss_before_the_first_refresh():
+    scheduler = SnapshotScheduler("test")
+    assert scheduler.get("digest") is None
+
+
+def test_refresh_serves_a_fresh_snapshot():
+    scheduler = SnapshotScheduler("test")
+    scheduler.interval = 60
+    asyncio.run(scheduler.refresh({"digest": lambda: "news", "items": lambda: Snapshot("more news", ["item"])}))
+    snapshot = scheduler.get("digest")
+    assert snapshot.content == "news"
+    assert not scheduler.is_stale(snapshot)
+    assert scheduler.get("items").items == ["item"]
+
+
+def test_failed_refresh_keeps_the_last_snapshot_as_stale():
+    scheduler = SnapshotScheduler("test")
+    scheduler.interval = 60
+    asyncio.run(scheduler.refresh({"digest": lambda: "news"}))
+    asyncio.run(scheduler.refresh({"digest": failing_job, "other": failing_job}))
+    snapshot = scheduler.get("digest")
+    assert snapshot.content == "news"
+    assert snapshot.error == "feeds down"
+    assert scheduler.is_stale(snapshot)
+    assert scheduler.get("other") is None
+
+    # The next good refresh replaces it
+    asyncio.run(scheduler.refresh({"digest": lambda: "fresh news"}))
+    assert not scheduler.is_stale(scheduler.get("digest"))
+
+
+def test_late_snapshots_are_stale():
+    scheduler = SnapshotScheduler("test")
+    scheduler.interval = 60
+    snapshot = Snapshot("news")
+    snapshot.refreshed_at -= 119
+    assert not scheduler.is_stale(snapshot)
+    snapshot.refreshed_at -= 2
+    assert scheduler.is_stale(snapshot)
+    assert snapshot.describe_age() == "2 minutes"
+    snapshot.refreshed_at -= 3 * 60 * 60
+    assert snapshot.describe_age() == "3 hours"
+
+
+def test_start_refreshes_in_background():
+    scheduler = SnapshotScheduler("test")
+    calls = []
+
+    def job():
+        calls.append(1)
+        return f"news {len(calls)}"
+
+    async def main():
+        scheduler.start({"digest": job}, interval=0.05)
+        await asyncio.sleep(0.3)
+        scheduler.cancel()
+
+    asyncio.run(main())
+    assert len(calls) >= 3
+    assert scheduler.get("digest").content.startswith("news ")
+    assert scheduler.task is None
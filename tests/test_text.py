@@ -0,0 +1,50 @@
+from utils.pipelines.text import estimate_tokens, split_text
+
+
+def captions(count: int) -> str:
+    # 40 characters, 10 tokens, per caption
+    return "\n".join(f"caption {index:04d} of the talk, said.." for index in range(count))
+
+
+def test_short_text_is_a_single_chunk():
+    assert split_text("a short caption\nanother one", 100) == ["a short caption\nanother one"]
+    assert split_text("", 100) == []
+
+
+def test_chunks_fit_the_budget_and_cut_on_captions():
+    text = captions(100)
+    chunks = split_text(text, 100)
+    assert len(chunks) > 1
+    assert all(estimate_tokens(chunk) <= 100 for chunk in chunks)
+    # No caption is cut, and without overlap each one is in a single chunk
+    assert sum(chunk.count("caption ") for chunk in chunks) == 100
+    assert chunks[0].startswith("caption 0000") and chunks[-1].endswith("caption 0099 of the talk, said..")
+
+
+def test_consecutive_chunks_overlap():
+    chunks = split_text(captions(100), 100, overlap_tokens=25)
+    for previous, chunk in zip(chunks, chunks[1:]):
+        first = chunk[:len("caption 0000")]
+        # The next chunk starts with the last two captions (11 tokens each with the separator) of the previous one
+        assert first in previous
+        assert previous.index(first) > len(previous) - 2 * 45
+    assert all(estimate_tokens(chunk) <= 100 for chunk in chunks)
+
+
+def test_overlap_is_at_most_half_a_chunk():
+    without = split_text(captions(100), 100)
+    capped = split_text(captions(100), 100, overlap_tokens=1000)
+    # The chunks still move forward: each one brings at least half a chunk of new captions
+    assert len(without) < len(capped) <= 2 * len(without) + 1
+
+
+def test_text_without_lines_is_cut_on_sentences_then_words():
+    sentences = " ".join(f"Sentence number {index} of the transcript." for index in range(50))
+    chunks = split_text(sentences, 60)
+    assert all(chunk.endswith(".") for chunk in chunks)
+    assert all(estimate_tokens(chunk) <= 60 for chunk in chunks)
+
+    words = " ".join(f"word{index}" for index in range(400))
+    chunks = split_text(words, 50)
+    assert " ".join(chunks) == words
+    assert all(estimate_tokens(chunk) <= 50 for chunk in chunks)
@@ -0,0 +1,73 @@
+from utils.pipelines import trace_export
+from utils.pipelines.trace_export import TTLTable, apply_messages_policy, sampled
+
+
+class Clock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_sampling_is_stable_per_key():
+    assert all(sampled(f"chat-{index}", 1) for index in range(100))
+    assert not any(sampled(f"chat-{index}", 0) for index in range(100))
+    assert [sampled(f"chat-{index}", 0.3) for index in range(100)] == [sampled(f"chat-{index}", 0.3) for index in range(100)]
+
+
+def test_sampling_follows_the_rate():
+    traced = sum(sampled(f"chat-{index}", 0.25) for index in range(20000))
+    assert 0.23 < traced / 20000 < 0.27
+
+
+def test_messages_policies():
+    messages = [{"role": "user", "content": f"message {index} " + "x" * 100} for index in range(6)]
+    assert apply_messages_policy(messages, "full") is messages
+    assert apply_messages_policy(messages, "last_n", last_n=2) == messages[-2:]
+    truncated = apply_messages_policy(messages, "truncate", max_chars=10)
+    assert truncated[0]["content"].startswith("message 0 ... [")
+    hashed = apply_messages_policy([{"role": "user", "content": [{"type": "text", "text": "hi"}, {"type": "image_url", "image_url": "data:"}]}], "hash")
+    assert hashed[0]["content"][0]["text"]["chars"] == 2
+    assert hashed[0]["content"][1] == {"type": "image_url"}
+
+
+def test_ttl_table_expires_entries(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(trace_export.time, "monotonic", clock)
+    evicted = []
+    table = TTLTable(max_entries=10, ttl=60, on_evict=lambda key, value: evicted.append(key))
+    table.put("old", 1)
+    clock.now += 30
+    table.put("new", 2)
+    assert table.get("old") == 1
+
+    clock.now += 31
+    assert table.get("old") is None
+    assert table.get("new") == 2
+    table.purge()
+    assert evicted == ["old"]
+    assert len(table) == 1
+    assert table.stats["expired"] == 1
+
+
+def test_ttl_table_evicts_the_oldest_entries():
+    evicted = []
+    table = TTLTable(max_entries=3, ttl=0, on_evict=lambda key, value: evicted.append(key))
+    for index in range(5):
+        table.put(str(index), index)
+    assert evicted == ["0", "1"]
+    assert table.pop("4") == 4
+    assert table.pop("4") is None
+    assert table.stats["evicted"] == 2
+
+
+def test_ttl_table_trims_to_lowered_caps():
+    evicted = []
+    table = TTLTable(max_entries=10, ttl=0, on_evict=lambda key, value: evicted.append(key))
+    for index in range(6):
+        table.put(str(index), index)
+    table.max_entries = 2
+    table.purge()
+    assert evicted == ["0", "1", "2", "3"]
+    assert len(table) == 2
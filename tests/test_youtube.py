@@ -0,0 +1,139 @@
+import time
+import threading
+
+import pytest
+
+from benchmarks.fake_services import VIDEO_IDS, fixture_transcript
+from utils.pipelines.store import get_store
+from utils.pipelines.text import split_text
+
+
+class RecordingLLM:
+    """
+    A model answering partial_tokens tokens to every call, recording the map and reduce calls
+    """
+    model = "recording"
+
+    def __init__(self, partial_tokens: int = 10) -> None:
+        self.partial_tokens = partial_tokens
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def chat(self, messages, **kwargs):
+        from llama_index.core.llms import ChatMessage, ChatResponse
+        from pipelines.download_youtube_transcripts import Fabric
+
+        system, user = messages[0].content, messages[-1].content
+        with self.lock:
+            index = len(self.calls)
+            if Fabric.REDUCE_PROMPT in system:
+                self.calls.append(("reduce", user.count("\n\n---\n\n") + 1))
+            else:
+                self.calls.append(("map", user))
+        content = f"partial {index:04d} " + "x" * (4 * self.partial_tokens - 13)
+        return ChatResponse(message=ChatMessage(role="assistant", content=content), raw={})
+
+
+def new_fabric(llm):
+    from pipelines.download_youtube_transcripts import Fabric
+
+    fabric = Fabric(llm)
+    fabric.pattern = "summarize"
+    fabric.language = "English"
+    return fabric
+
+
+class CountingLLM:
+    """
+    The model of the pipeline, counting the calls running at the same time
+    """
+    def __init__(self, llm) -> None:
+        self.llm = llm
+        self.running = 0
+        self.peak = 0
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def __getattr__(self, name):
+        return getattr(self.llm, name)
+
+    def chat(self, messages, **kwargs):
+        with self.lock:
+            self.running += 1
+            self.calls += 1
+            self.peak = max(self.peak, self.running)
+        try:
+            time.sleep(0.02)
+            return self.llm.chat(messages, **kwargs)
+        finally:
+            with self.lock:
+                self.running -= 1
+
+
+def test_extract_url_strips_the_ending_punctuation():
+    from pipelines.download_youtube_transcripts import Tools
+
+    tools = Tools()
+    assert tools._extract_url("summarize https://www.youtube.com/watch?v=abc.") == "https://www.youtube.com/watch?v=abc"
+    assert tools._extract_urls("these: https://youtu.be/a, https://youtu.be/b.") == ["https://youtu.be/a", "https://youtu.be/b"]
+    assert tools._extract_url("no link here") == []
+
+
+@pytest.mark.parametrize("new_pipeline", ["pipelines.download_youtube_transcripts"], indirect=True)
+def test_batch_bounds_every_ollama_call(services, new_pipeline):
+    store = get_store("youtube_transcripts", ttl=0, max_bytes=1 << 30)
+    videos = VIDEO_IDS[:4]
+    for video_id in videos:
+        store.set_text(f"{video_id}:en", fixture_transcript(video_id, 10))
+
+    pipeline = new_pipeline()
+    # Every transcript is split in several chunks, each mapped by its own call
+    pipeline.valves.CHUNK_TOKENS = 1000
+    pipeline.valves.CHUNK_PARALLELISM = 4
+    pipeline.valves.BATCH_CONCURRENCY = 4
+    pipeline.valves.BATCH_LLM_CONCURRENCY = 2
+    llm = pipeline.llm = CountingLLM(pipeline.llm)
+    message = "summarize these videos: " + ", ".join(f"https://www.youtube.com/watch?v={video_id}" for video_id in videos)
+    answer = pipeline.pipe(message, "youtube", [], {"stream": False})
+    assert answer.count("## ") == len(videos)
+    assert "Error" not in answer
+    assert llm.calls > 2 * len(videos)
+    assert llm.peak <= 2
+
+
+def test_short_transcript_takes_a_single_call(services):
+    llm = RecordingLLM()
+    answer = new_fabric(llm).apply_pattern_chunked("first caption\nsecond caption", chunk_tokens=1000)
+    assert answer.startswith("partial 0000")
+    assert len(llm.calls) == 1
+    kind, user = llm.calls[0]
+    assert kind == "map" and user.endswith("first caption second caption")
+
+
+def test_chunks_are_mapped_then_reduced(services):
+    transcript = fixture_transcript(VIDEO_IDS[0], 10)
+    chunks = split_text(transcript, 1000, 100)
+    assert len(chunks) > 2
+    llm = RecordingLLM()
+    new_fabric(llm).apply_pattern_chunked(transcript, chunk_tokens=1000, overlap_tokens=100, parallelism=3)
+    maps = [user for kind, user in llm.calls if kind == "map"]
+    # Every chunk mapped once, with its overlap, then a single reduce of all the partial outputs
+    assert sorted(user.rsplit("\n", 1)[-1] for user in maps) == sorted(chunks)
+    assert llm.calls[len(chunks):] == [("reduce", len(chunks))]
+
+
+def test_partial_outputs_are_reduced_by_groups(services):
+    transcript = fixture_transcript(VIDEO_IDS[0], 30)
+    chunks = split_text(transcript, 1000)
+    # 400 tokens per partial output: two of them fit a 1000 tokens group, three don't
+    llm = RecordingLLM(partial_tokens=400)
+    new_fabric(llm).apply_pattern_chunked(transcript, chunk_tokens=1000)
+    reduces = [count for kind, count in llm.calls if kind == "reduce"]
+    assert len(chunks) > 4
+    assert len(llm.calls) - len(reduces) == len(chunks)
+    rounds, partials = [], len(chunks)
+    while partials > 2:
+        rounds.append([2] * (partials // 2))
+        partials = (partials + 1) // 2
+    # Groups of two (a group of one is passed as is), until the last two are merged by the final call
+    assert reduces == [count for groups in rounds for count in groups] + [2]
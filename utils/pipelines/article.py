@@ -0,0 +1,103 @@
+"""
+Streaming extraction of the text of a news article.
+
+The page is tokenized incrementally while it's downloaded: everything before
+the first <article> element is skipped without building any tree, only the
+paragraphs inside it are collected, and the caller can stop reading the
+response as soon as the article is closed (navigation, scripts and footer
+are never parsed).
+"""
+import codecs
+from html.parser import HTMLParser
+from typing import Iterable, List, Optional
+
+
+class ArticleExtractor(HTMLParser):
+    """
+    Incremental parser collecting the text of the <p> elements of the first <article>
+    """
+    SKIPPED_TAGS = {"script", "style", "noscript", "template", "svg"}
+
+    def __init__(self) -> None:
+        super().__init__(convert_charrefs=True)
+        self.found = False
+        self.done = False
+        self.paragraphs: List[str] = []
+        self.article_depth = 0
+        self.skip_depth = 0
+        self.text: Optional[List[str]] = None
+
+
+    def handle_starttag(self, tag: str, attrs: list) -> None:
+        if self.done:
+            return
+        if tag == "article":
+            self.found = True
+            self.article_depth += 1
+        elif self.article_depth:
+            if tag in self.SKIPPED_TAGS:
+                self.skip_depth += 1
+            elif tag == "p":
+                # Paragraphs can't be nested, a new one implicitly closes the previous one
+                self.__end_paragraph()
+                self.text = []
+
+
+    def handle_endtag(self, tag: str) -> None:
+        if self.done or not self.article_depth:
+            return
+        if tag == "article":
+            self.article_depth -= 1
+            if not self.article_depth:
+                self.__end_paragraph()
+                self.done = True
+        elif tag in self.SKIPPED_TAGS:
+            self.skip_depth = max(self.skip_depth - 1, 0)
+        elif tag == "p":
+            self.__end_paragraph()
+
+
+    def handle_startendtag(self, tag: str, attrs: list) -> None:
+        # Self closing tags (<br/>, <img/>) don't open anything
+        if tag == "article" or tag in self.SKIPPED_TAGS:
+            return
+        self.handle_starttag(tag, attrs)
+
+
+    def handle_data(self, data: str) -> None:
+        if self.text is not None and not self.skip_depth:
+            self.text.append(data)
+
+
+    def __end_paragraph(self) -> None:
+        if self.text is not None:
+            self.paragraphs.append("".join(self.text))
+            self.text = None
+
+
+def extract_article_paragraphs(chunks: Iterable[bytes], encoding: str = "utf-8") -> Optional[List[str]]:
+    """
+    Extract the paragraphs of the first <article> of an HTML page, reading the chunks only until it's closed.
+
+    Args:
+        chunks (Iterable[bytes]): the raw page, i.e. a streamed HTTP response body
+        encoding (str): the charset of the page
+
+    Returns:
+        List[str]: the text of each paragraph, None if the page has no <article>
+    """
+    try:
+        decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+    except LookupError:
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+
+    extractor = ArticleExtractor()
+    for chunk in chunks:
+        extractor.feed(decoder.decode(chunk))
+        if extractor.done:
+            break
+    else:
+        extractor.feed(decoder.decode(b"", final=True))
+        extractor.close()
+
+    return extractor.paragraphs if extractor.found else None
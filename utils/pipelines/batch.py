@@ -0,0 +1,77 @@
+"""
+Batch processing of the several URLs of a message (i.e. "summarize these five videos").
+
+Every item is fetched and extracted concurrently, then the Fabric pattern runs
+on it as soon as it's ready, with at most llm_concurrency model calls at the
+same time so Ollama isn't flooded. The results come out as they complete, so
+the first one is streamed while the others are still running and the whole
+batch takes about as long as its slowest item rather than the sum.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Generator, Iterator, List, Sequence, Tuple, TypeVar
+
+Item = TypeVar("Item")
+
+
+def run_batch(
+    items: Sequence[Item],
+    fetch: Callable[[Item], str],
+    apply: Callable[[Item, str], str],
+    max_workers: int = 4,
+    llm_concurrency: int = 2,
+) -> Iterator[Tuple[int, str]]:
+    """
+    Fetch every item and apply the pattern to it, concurrently
+
+    Args:
+        items (Sequence): the items, i.e. the URLs
+        fetch (Callable): item -> content, an error message starting with "Error" when it can't be fetched
+        apply (Callable): (item, content) -> result of the pattern, a blocking (not streamed) model call
+        max_workers (int): items processed at the same time
+        llm_concurrency (int): model calls at the same time, the other items wait for a slot once fetched
+
+    Yields:
+        (int, str): the index of the item and its result (or error message), as they complete
+    """
+    slots = threading.BoundedSemaphore(max(llm_concurrency, 1))
+
+    def process(item: Item) -> str:
+        content = fetch(item)
+        if not content or content.startswith("Error"):
+            return content or "Error: nothing found"
+        with slots:
+            return apply(item, content)
+
+    executor = ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(items))))
+    try:
+        futures = {executor.submit(process, item): index for index, item in enumerate(items)}
+        for future in as_completed(futures):
+            try:
+                result = future.result()
+            except Exception as e:
+                result = f"Error: {e}"
+            yield futures[future], result
+    finally:
+        # A client that went away doesn't leave the remaining items running
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def format_result(title: str, result: str) -> str:
+    return f"## {title}\n\n{result}\n\n"
+
+
+def stream_batch(titles: List[str], results: Iterator[Tuple[int, str]]) -> Generator:
+    """
+    Stream the result of every item under its title, in the order they complete
+    """
+    for index, result in results:
+        yield format_result(titles[index], result)
+
+
+def join_batch(titles: List[str], results: Iterator[Tuple[int, str]]) -> str:
+    """
+    The results of every item under its title, in the order of the items
+    """
+    ordered = dict(results)
+    return "".join(format_result(titles[index], ordered[index]) for index in sorted(ordered))
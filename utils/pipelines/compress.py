@@ -0,0 +1,182 @@
+"""
+Extractive compression of the video transcripts, before they go into the prompt.
+
+Auto-generated captions repeat themselves: a caption often starts with the
+last words of the previous one (rolling captions), speakers hesitate, and the
+same sentence comes back in the intro, the body and the outro. Every token of
+it costs prefill time, so the transcript goes through:
+    dedupe      the words a caption repeats from the previous one are removed
+    clean       hesitations (um, uh, erm...), [Music]-like annotations and stutters ("the the") are removed
+    near dups   the sentences (or caption groups, captions have no punctuation)
+                too similar to an earlier one are dropped
+    salience    only when a token budget is given and the transcript is still
+                over it: the units are scored by TF-IDF similarity to the whole
+                transcript and the best ones kept, in their original order
+
+The similarity and the scores are computed with NumPy on hashed bags of words,
+so a one hour transcript takes a few milliseconds.
+"""
+import re
+import zlib
+from typing import List
+
+import numpy as np
+
+from utils.pipelines.text import SENTENCE_END, estimate_tokens
+
+# Hesitations only, the discourse markers ("you know", "I mean") can't be told apart from the same words in a sentence
+HESITATIONS = re.compile(r"\b(?:u+h+m*|u+m+|e+r+m+|h+m+|m+h+m+|a+h+)\b[,.]?\s*", re.IGNORECASE)
+ANNOTATIONS = re.compile(r"\[[^\]]{0,40}\]|[♪♫]+")
+# "that that" and "had had" are often right
+STUTTERS = re.compile(r"\b(?!(?:that|had)\b)(\w+)(?:\s+\1\b)+", re.IGNORECASE)
+SPACES = re.compile(r"[ \t]{2,}")
+WORD = re.compile(r"[a-z0-9']+")
+STOP_WORDS = frozenset(
+    "a an and are as at be but by for from has have i if in is it its of on or so that the their there they this to "
+    "was we were what when which who will with you your just like yeah okay oh well very really going get got".split()
+)
+
+# Longest caption overlap looked for, in words
+MAX_OVERLAP = 30
+# Words of a unit when the captions have no punctuation to cut sentences
+UNIT_WORDS = 20
+# Dimension of the hashed bags of words
+FEATURES = 1024
+NEAR_DUPLICATE = 0.9
+
+
+def dedupe_captions(lines: List[str]) -> List[str]:
+    """
+    Remove from each caption the words it repeats from the end of the previous ones, and the repeated captions
+    """
+    captions = []
+    tail: List[str] = []
+    for line in lines:
+        words = line.split()
+        if not words:
+            continue
+        lowered = [word.lower() for word in words]
+        overlap = 0
+        for size in range(min(len(words), len(tail)), 0, -1):
+            if tail[-size:] == lowered[:size]:
+                overlap = size
+                break
+        # A single word in common is just as likely to be said twice
+        if overlap < 2 and overlap != len(words):
+            overlap = 0
+        rest = words[overlap:]
+        if rest:
+            captions.append(" ".join(rest))
+        tail = (tail + lowered[overlap:])[-MAX_OVERLAP:]
+    return captions
+
+
+def clean_caption(caption: str) -> str:
+    caption = ANNOTATIONS.sub(" ", caption)
+    caption = HESITATIONS.sub("", caption)
+    caption = STUTTERS.sub(r"\1", caption)
+    return SPACES.sub(" ", caption).strip(" ,")
+
+
+def split_units(captions: List[str]) -> List[str]:
+    """
+    The sentences of the transcript when it's punctuated, groups of about UNIT_WORDS words of captions otherwise
+    """
+    text = " ".join(captions)
+    words = len(text.split())
+    if words and len(SENTENCE_END.findall(text)) * 60 >= words:
+        return [sentence for sentence in SENTENCE_END.split(text) if sentence.strip()]
+    units, current = [], []
+    for caption in captions:
+        current.append(caption)
+        if sum(len(part.split()) for part in current) >= UNIT_WORDS:
+            units.append(" ".join(current))
+            current = []
+    if current:
+        units.append(" ".join(current))
+    return units
+
+
+def vectorize(units: List[str]) -> np.ndarray:
+    """
+    The hashed bags of the content words of the units, one row per unit
+    """
+    rows, columns = [], []
+    for index, unit in enumerate(units):
+        for word in WORD.findall(unit.lower()):
+            if word not in STOP_WORDS:
+                rows.append(index)
+                columns.append(zlib.crc32(word.encode("utf-8")) % FEATURES)
+    matrix = np.zeros((len(units), FEATURES), dtype=np.float32)
+    np.add.at(matrix, (np.asarray(rows, dtype=np.intp), np.asarray(columns, dtype=np.intp)), 1.0)
+    return matrix
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-9)
+
+
+def find_near_duplicates(vectors: np.ndarray, threshold: float = NEAR_DUPLICATE, block: int = 256) -> np.ndarray:
+    """
+    True for the units whose cosine similarity with an earlier unit exceeds threshold, by blocks of rows to bound the memory
+    """
+    vectors = normalize_rows(vectors)
+    count = len(vectors)
+    duplicates = np.zeros(count, dtype=bool)
+    for start in range(0, count, block):
+        stop = min(start + block, count)
+        similarity = vectors[start:stop] @ vectors[:stop].T
+        # Only the earlier units count
+        similarity[np.arange(stop)[None, :] >= np.arange(start, stop)[:, None]] = -1.0
+        duplicates[start:stop] = similarity.max(axis=1, initial=-1.0) > threshold
+    # Units without any content word have a null vector, they are never duplicates
+    duplicates &= vectors.any(axis=1)
+    return duplicates
+
+
+def rank_salience(vectors: np.ndarray) -> np.ndarray:
+    """
+    The TF-IDF cosine similarity of every unit with the centroid of the transcript
+    """
+    document_frequency = (vectors > 0).sum(axis=0)
+    idf = np.log((len(vectors) + 1) / (document_frequency + 1)) + 1
+    weighted = normalize_rows(vectors * idf)
+    centroid = weighted.mean(axis=0)
+    return weighted @ (centroid / max(float(np.linalg.norm(centroid)), 1e-9))
+
+
+def select_within_budget(units: List[str], scores: np.ndarray, max_tokens: int) -> List[str]:
+    """
+    The best scored units fitting max_tokens, in their original order
+    """
+    order = np.argsort(-scores, kind="stable")
+    tokens = np.asarray([estimate_tokens(unit) + 1 for unit in units])[order]
+    kept = np.sort(order[np.cumsum(tokens) <= max_tokens])
+    return [units[index] for index in kept]
+
+
+def compress_transcript(transcript: str, max_tokens: int = 0) -> str:
+    """
+    Compress a transcript (one caption per line) for the prompt
+
+    Args:
+        transcript (str): the transcript
+        max_tokens (int): token budget, the least salient units are dropped above it; 0 to only remove the redundancy
+
+    Returns:
+        str: the transcript, one unit (sentence or caption group) per line
+    """
+    captions = [caption for caption in (clean_caption(line) for line in dedupe_captions(transcript.splitlines())) if caption]
+    units = split_units(captions)
+    if len(units) < 2:
+        return "\n".join(units)
+
+    vectors = vectorize(units)
+    keep = ~find_near_duplicates(vectors)
+    units = [unit for unit, kept in zip(units, keep) if kept]
+    vectors = vectors[keep]
+
+    if max_tokens > 0 and estimate_tokens("\n".join(units)) > max_tokens:
+        units = select_within_budget(units, rank_salience(vectors), max_tokens)
+    return "\n".join(units)
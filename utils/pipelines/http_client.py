@@ -0,0 +1,293 @@
+"""
+Shared HTTP client used by the pipelines and the filters.
+
+A single keep-alive connection pool (per process) serves the BBC feeds and
+articles, the Fabric patterns and the Ollama API, so repeated calls to the
+same host skip the TCP and TLS handshakes. Connect/read timeouts and the
+maximum response size can be tuned with the environment variables below,
+gzip (and brotli, when the brotli package is installed) are decoded
+transparently by httpx.
+
+    HTTP_CONNECT_TIMEOUT     seconds to establish a connection (default 5)
+    HTTP_READ_TIMEOUT        seconds to wait for data (default 30)
+    HTTP_MAX_RESPONSE_BYTES  maximum decoded size of a response body (default 10MB)
+    HTTP_MAX_CONNECTIONS     maximum number of open connections (default 50)
+"""
+import os
+import asyncio
+import threading
+from contextlib import contextmanager, asynccontextmanager
+from typing import Iterator, Optional
+
+import httpx
+
+
+class ResponseTooLarge(httpx.HTTPError):
+    """The response body exceeds the configured maximum size"""
+
+
+class HttpResponse:
+    """
+    A fully read response, exposing the subset of the requests API used by the pipelines
+    """
+    def __init__(self, response: httpx.Response, content: bytes) -> None:
+        self.raw = response
+        self.url = str(response.url)
+        self.status_code = response.status_code
+        self.headers = response.headers
+        self.content = content
+
+
+    @property
+    def ok(self) -> bool:
+        return self.status_code < 400
+
+
+    @property
+    def text(self) -> str:
+        return self.content.decode(self.raw.encoding or "utf-8", errors="replace")
+
+
+    def raise_for_status(self) -> None:
+        self.raw.raise_for_status()
+
+
+class ConnectionStats:
+    """
+    Count the requests and the new connections opened per host,
+    every request that didn't need a new connection reused a pooled one
+    """
+    def __init__(self) -> None:
+        self.hosts = {}
+        self._lock = threading.Lock()
+
+
+    def count(self, host: str, key: str) -> None:
+        with self._lock:
+            stats = self.hosts.setdefault(host, {"requests": 0, "connections": 0})
+            stats[key] += 1
+
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            hosts = {host: dict(stats) for host, stats in self.hosts.items()}
+        for stats in hosts.values():
+            stats["reused"] = max(stats["requests"] - stats["connections"], 0)
+            stats["reuse_ratio"] = round(stats["reused"] / stats["requests"], 3) if stats["requests"] else 0.0
+        return hosts
+
+
+class _MeteredTransport(httpx.BaseTransport):
+    def __init__(self, transport: httpx.BaseTransport, stats: ConnectionStats) -> None:
+        self.transport = transport
+        self.stats = stats
+
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        host = request.url.netloc.decode("ascii")
+        self.stats.count(host, "requests")
+
+        def trace(event: str, info: dict) -> None:
+            if event == "connection.connect_tcp.complete":
+                self.stats.count(host, "connections")
+
+        request.extensions = {**request.extensions, "trace": trace}
+        return self.transport.handle_request(request)
+
+
+    def close(self) -> None:
+        # The pool is shared by several clients (i.e. Ollama), it's closed by HttpClient.close
+        pass
+
+
+class _AsyncMeteredTransport(httpx.AsyncBaseTransport):
+    def __init__(self, transport: httpx.AsyncBaseTransport, stats: ConnectionStats) -> None:
+        self.transport = transport
+        self.stats = stats
+
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        host = request.url.netloc.decode("ascii")
+        self.stats.count(host, "requests")
+
+        async def trace(event: str, info: dict) -> None:
+            if event == "connection.connect_tcp.complete":
+                self.stats.count(host, "connections")
+
+        request.extensions = {**request.extensions, "trace": trace}
+        return await self.transport.handle_async_request(request)
+
+
+    async def aclose(self) -> None:
+        pass
+
+
+class HttpClient:
+    def __init__(
+        self,
+        connect_timeout: Optional[float] = None,
+        read_timeout: Optional[float] = None,
+        max_response_bytes: Optional[int] = None,
+        max_connections: Optional[int] = None,
+        transport: Optional[httpx.BaseTransport] = None,
+        async_transport: Optional[httpx.AsyncBaseTransport] = None,
+    ) -> None:
+        """
+        Args:
+            connect_timeout (float): seconds to establish a connection
+            read_timeout (float): seconds to wait for data
+            max_response_bytes (int): maximum decoded size of a response body
+            max_connections (int): maximum number of open connections
+            transport / async_transport: replace the network transports (i.e. to run against local fakes)
+        """
+        self.connect_timeout = float(connect_timeout or os.getenv("HTTP_CONNECT_TIMEOUT", 5))
+        self.read_timeout = float(read_timeout or os.getenv("HTTP_READ_TIMEOUT", 30))
+        self.max_response_bytes = int(max_response_bytes or os.getenv("HTTP_MAX_RESPONSE_BYTES", 10 * 1024 * 1024))
+        max_connections = int(max_connections or os.getenv("HTTP_MAX_CONNECTIONS", 50))
+        limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections, keepalive_expiry=60)
+
+        self.connection_stats = ConnectionStats()
+        self._pool = transport or httpx.HTTPTransport(limits=limits)
+        self._async_pool = async_transport or httpx.AsyncHTTPTransport(limits=limits)
+        self.transport = _MeteredTransport(self._pool, self.connection_stats)
+        self.async_transport = _AsyncMeteredTransport(self._async_pool, self.connection_stats)
+        timeout = self.timeout()
+        self.client = httpx.Client(transport=self.transport, timeout=timeout, follow_redirects=True)
+        self.async_client = httpx.AsyncClient(transport=self.async_transport, timeout=timeout, follow_redirects=True)
+
+
+    def timeout(self, read_timeout: Optional[float] = None) -> httpx.Timeout:
+        return httpx.Timeout(read_timeout or self.read_timeout, connect=self.connect_timeout)
+
+
+    def get(self, url: str, headers: Optional[dict] = None, max_bytes: Optional[int] = None) -> HttpResponse:
+        """
+        GET the URL and read the whole (decoded) body.
+
+        Raises:
+            httpx.HTTPError: on connection errors, timeouts or when the body exceeds max_bytes
+        """
+        with self.stream("GET", url, headers=headers) as response:
+            content = b"".join(self.iter_bytes(response, max_bytes))
+        return HttpResponse(response, content)
+
+
+    async def aget(self, url: str, headers: Optional[dict] = None, max_bytes: Optional[int] = None) -> HttpResponse:
+        """
+        Same as get, without blocking the event loop.
+        """
+        async with self.astream("GET", url, headers=headers) as response:
+            chunks = [chunk async for chunk in self.aiter_bytes(response, max_bytes)]
+        return HttpResponse(response, b"".join(chunks))
+
+
+    @contextmanager
+    def stream(self, method: str, url: str, **kwargs) -> Iterator[httpx.Response]:
+        """
+        Open a streamed response, read it with iter_bytes to enforce the size cap
+        """
+        with self.client.stream(method, url, **kwargs) as response:
+            yield response
+
+
+    @asynccontextmanager
+    async def astream(self, method: str, url: str, **kwargs):
+        async with self.async_client.stream(method, url, **kwargs) as response:
+            yield response
+
+
+    def iter_bytes(self, response: httpx.Response, max_bytes: Optional[int] = None) -> Iterator[bytes]:
+        limit = max_bytes or self.max_response_bytes
+        size = 0
+        for chunk in response.iter_bytes():
+            size += len(chunk)
+            if size > limit:
+                raise ResponseTooLarge(f"Response from {response.url} exceeds {limit} bytes")
+            yield chunk
+
+
+    async def aiter_bytes(self, response: httpx.Response, max_bytes: Optional[int] = None):
+        limit = max_bytes or self.max_response_bytes
+        size = 0
+        async for chunk in response.aiter_bytes():
+            size += len(chunk)
+            if size > limit:
+                raise ResponseTooLarge(f"Response from {response.url} exceeds {limit} bytes")
+            yield chunk
+
+
+    def ollama_clients(self, host: str, request_timeout: float) -> dict:
+        """
+        Ollama clients (sync and async) going through the shared connection pool,
+        to be passed to the llama-index Ollama constructor.
+        """
+        from ollama import Client, AsyncClient
+
+        timeout = self.timeout(request_timeout)
+        return {
+            "client": Client(host=host, timeout=timeout, transport=self.transport),
+            "async_client": AsyncClient(host=host, timeout=timeout, transport=self.async_transport),
+        }
+
+
+    def stats(self) -> dict:
+        return self.connection_stats.snapshot()
+
+
+    def close(self) -> None:
+        """
+        Close the clients and their connection pools, from synchronous code (a coroutine awaits aclose)
+        """
+        self.client.close()
+        self._pool.close()
+        asyncio.run(self.__aclose_async())
+
+
+    async def aclose(self) -> None:
+        """
+        Close the clients and their connection pools, from the event loop
+        """
+        self.client.close()
+        self._pool.close()
+        await self.__aclose_async()
+
+
+    async def __aclose_async(self) -> None:
+        await self.async_client.aclose()
+        await self._async_pool.aclose()
+
+
+_http_client: Optional[HttpClient] = None
+_lock = threading.Lock()
+
+
+def get_http_client() -> HttpClient:
+    """
+    Returns the process wide HTTP client, created on first use so that the
+    environment loaded by the pipelines (.env) is taken into account.
+    """
+    global _http_client
+    with _lock:
+        if _http_client is None:
+            _http_client = HttpClient()
+        return _http_client
+
+
+async def aclose_http_client() -> None:
+    """
+    Close the process wide HTTP client (i.e. from the on_shutdown of the pipelines), the next use creates a new one
+    """
+    global _http_client
+    with _lock:
+        client, _http_client = _http_client, None
+    if client is not None:
+        await client.aclose()
+
+
+def set_http_client(client: HttpClient) -> None:
+    """
+    Replace the process wide HTTP client, i.e. to route the traffic to local fakes
+    """
+    global _http_client
+    with _lock:
+        _http_client = client
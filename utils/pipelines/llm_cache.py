@@ -0,0 +1,94 @@
+"""
+Content addressed cache of the LLM answers.
+
+The key is a hash of everything that determines the answer: the model, its
+sampling parameters, the messages (pattern prompt and input content) and the
+language requested, so the same article or video processed again with the
+same pattern is answered from the cache without touching the GPU.
+Only complete answers are stored, never errors.
+"""
+import os
+import json
+import sqlite3
+import hashlib
+from typing import List, Optional
+
+from utils.pipelines.store import SqliteStore, get_store
+
+
+class LLMResponseCache:
+    def __init__(self, store: SqliteStore) -> None:
+        self.store = store
+
+
+    @property
+    def stats(self) -> dict:
+        return self.store.stats
+
+
+    @staticmethod
+    def key(llm, messages: List, language: Optional[str] = None) -> str:
+        """
+        Hash of the request
+
+        Args:
+            llm (Ollama): the llama-index model, for its name and sampling parameters
+            messages (List[ChatMessage]): the messages sent to the model
+            language (str): the language of the answer
+
+        Returns:
+            str: hex digest identifying the answer
+        """
+        request = {
+            "model": llm.model,
+            "options": {
+                "temperature": llm.temperature,
+                "num_ctx": llm.context_window,
+                **(llm.additional_kwargs or {}),
+            },
+            "json_mode": getattr(llm, "json_mode", False),
+            "messages": [[str(getattr(message.role, "value", message.role)), message.content or ""] for message in messages],
+            "language": language,
+        }
+        payload = json.dumps(request, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+    def get(self, key: str) -> Optional[str]:
+        try:
+            return self.store.get_text(key)
+        except sqlite3.Error as e:
+            # A broken cache must not break the request, just call the model
+            print(f"LLM response cache unavailable: {e}")
+            return None
+
+
+    def set(self, key: str, content: str) -> None:
+        if not content or content.startswith("Error"):
+            return
+        try:
+            self.store.set_text(key, content)
+        except sqlite3.Error as e:
+            print(f"LLM response cache unavailable: {e}")
+
+
+_llm_cache: Optional[LLMResponseCache] = None
+
+
+def get_llm_cache() -> Optional[LLMResponseCache]:
+    """
+    Returns the process wide cache of the LLM answers, None when disabled (LLM_CACHE_MAX_BYTES=0).
+    Entries expire after LLM_CACHE_TTL seconds (default 7 days).
+    """
+    global _llm_cache
+    max_bytes = int(os.getenv("LLM_CACHE_MAX_BYTES", 500 * 1024 * 1024))
+    if not max_bytes:
+        return None
+    if _llm_cache is None:
+        ttl = float(os.getenv("LLM_CACHE_TTL", 7 * 24 * 60 * 60))
+        try:
+            _llm_cache = LLMResponseCache(get_store("llm_responses", ttl=ttl, max_bytes=max_bytes))
+        except (sqlite3.Error, OSError) as e:
+            print(f"LLM response cache unavailable: {e}")
+            return None
+    return _llm_cache
@@ -0,0 +1,251 @@
+"""
+Latency and usage metrics of the pipelines, exposed in the Prometheus text format.
+
+Stages (HTTP fetch, parse, pattern fetch, LLM prefill and decode, translate...)
+are timed with span() and aggregated in histograms, token counts and cache
+hits in counters. Metrics are off unless PIPELINES_METRICS=1: span() then
+returns a shared no-op context manager and the other helpers return
+immediately, so the instrumentation costs a function call.
+
+The text exposition is returned by render(), and served on
+http://0.0.0.0:<PIPELINES_METRICS_PORT>/metrics when the port is set.
+"""
+import os
+import time
+import bisect
+import threading
+from contextlib import contextmanager, nullcontext
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Dict, Optional, Tuple
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+HELP = {
+    "pipeline_stage_seconds": "Duration of the pipeline stages",
+    "pipeline_stage_errors_total": "Pipeline stages that raised an exception",
+    "llm_prefill_seconds": "Time the model spent on the prompt (time to the first chunk when streaming)",
+    "llm_decode_seconds": "Time the model spent generating the answer",
+    "llm_prompt_tokens_total": "Prompt tokens evaluated by the model",
+    "llm_completion_tokens_total": "Tokens generated by the model",
+    "llm_cache_total": "Lookups of the LLM response cache by result",
+    "snapshot_refresh_total": "Background refreshes of the precomputed answers by result",
+    "snapshot_requests_total": "Requests for a precomputed answer: fresh, stale (served with its age) or miss (computed on the request)",
+    "rate_limit_total": "Slots of the shared rate limiters: acquired, timeout (no slot within the deadline) or rate_limited (429 answers)",
+    "transcript_tokens_total": "Estimated tokens of the transcripts before (raw) and after (compressed) the compression",
+    "pipeline_coalesced_total": "Requests computed (leader) or shared with an identical request in flight (follower)",
+    "llm_monitor_chats_total": "Turns seen by the Langfuse filter, by sampling decision",
+    "llm_usage_tokens_total": "Tokens reported by the models at the outlet of the Langfuse filter, traced or not",
+}
+
+_NOOP = nullcontext()
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class Histogram:
+    def __init__(self) -> None:
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Metrics:
+    def __init__(self) -> None:
+        self.counters: Dict[str, Dict[Labels, float]] = {}
+        self.histograms: Dict[str, Dict[Labels, Histogram]] = {}
+        self.lock = threading.Lock()
+
+
+    @staticmethod
+    def labels(labels: dict) -> Labels:
+        return tuple(sorted((key, str(value)) for key, value in labels.items() if value is not None))
+
+
+    def inc(self, name: str, value: float = 1, **labels) -> None:
+        key = self.labels(labels)
+        with self.lock:
+            counter = self.counters.setdefault(name, {})
+            counter[key] = counter.get(key, 0) + value
+
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        key = self.labels(labels)
+        with self.lock:
+            histogram = self.histograms.setdefault(name, {}).get(key)
+            if histogram is None:
+                histogram = self.histograms[name][key] = Histogram()
+            histogram.observe(value)
+
+
+    @contextmanager
+    def span(self, stage: str, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            self.inc("pipeline_stage_errors_total", stage=stage, **labels)
+            raise
+        finally:
+            self.observe("pipeline_stage_seconds", time.perf_counter() - start, stage=stage, **labels)
+
+
+    def render(self) -> str:
+        """
+        The metrics in the Prometheus text exposition format
+        """
+        lines = []
+        with self.lock:
+            for name, series in sorted(self.counters.items()):
+                lines += self.__header(name, "counter")
+                for labels, value in sorted(series.items()):
+                    lines.append(f"{name}{self.__format(labels)} {value:g}")
+            for name, series in sorted(self.histograms.items()):
+                lines += self.__header(name, "histogram")
+                for labels, histogram in sorted(series.items()):
+                    cumulative = 0
+                    for bound, count in zip(BUCKETS + (float("inf"),), histogram.counts):
+                        cumulative += count
+                        le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                        lines.append(f"{name}_bucket{self.__format(labels + (('le', le),))} {cumulative}")
+                    lines.append(f"{name}_sum{self.__format(labels)} {histogram.sum:.6f}")
+                    lines.append(f"{name}_count{self.__format(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+
+    def __header(self, name: str, kind: str) -> list:
+        return [f"# HELP {name} {HELP.get(name, name)}", f"# TYPE {name} {kind}"]
+
+
+    def __format(self, labels: Labels) -> str:
+        if not labels:
+            return ""
+        escaped = (
+            f'{key}="' + value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
+            for key, value in labels
+        )
+        return "{" + ",".join(escaped) + "}"
+
+
+    def serve(self, port: int, host: str = "0.0.0.0") -> ThreadingHTTPServer:
+        """
+        Serve the metrics on /metrics from a daemon thread
+        """
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = metrics.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+
+_metrics: Optional[Metrics] = None
+_enabled: Optional[bool] = None
+_lock = threading.Lock()
+
+
+def get_metrics() -> Optional[Metrics]:
+    """
+    Returns the process wide metrics, None when disabled. The setting is read (and the
+    HTTP endpoint started) on first use, so that the .env of the pipelines is taken into account.
+    """
+    global _metrics, _enabled
+    if _metrics is not None or _enabled is False:
+        return _metrics
+    _enabled = os.getenv("PIPELINES_METRICS", "").lower() in ("1", "true", "yes", "on")
+    if not _enabled:
+        return None
+    with _lock:
+        if _metrics is None:
+            metrics = Metrics()
+            port = os.getenv("PIPELINES_METRICS_PORT")
+            if port:
+                try:
+                    metrics.serve(int(port))
+                except OSError as e:
+                    # Another worker already serves the port
+                    print(f"Metrics endpoint not started on port {port}: {e}")
+            _metrics = metrics
+    return _metrics
+
+
+def span(stage: str, **labels):
+    """
+    Time the enclosed block as a stage of the pipeline:
+        with span("feeds_fetch", pipeline="bbc_news"): ...
+    """
+    metrics = get_metrics()
+    return metrics.span(stage, **labels) if metrics else _NOOP
+
+
+def observe_stage(stage: str, seconds: float, **labels) -> None:
+    """
+    Record the duration of a stage measured by the caller (i.e. interleaved with another one)
+    """
+    metrics = get_metrics()
+    if metrics:
+        metrics.observe("pipeline_stage_seconds", seconds, stage=stage, **labels)
+
+
+def inc(name: str, value: float = 1, **labels) -> None:
+    metrics = get_metrics()
+    if metrics:
+        metrics.inc(name, value, **labels)
+
+
+def observe_llm(model: str, raw: Optional[dict], started: float, first_chunk: Optional[float] = None, **labels) -> None:
+    """
+    Record the prefill and decode time and the tokens of an Ollama call.
+    The durations reported by Ollama (raw response) are used when available,
+    otherwise the prefill is the time to the first chunk and the decode the rest of the stream.
+
+    Args:
+        model (str): the model name
+        raw (dict): the raw Ollama response, or the last chunk of the stream
+        started (float): time.perf_counter() when the call was made
+        first_chunk (float): time.perf_counter() when the first chunk arrived, for streamed calls
+    """
+    metrics = get_metrics()
+    if not metrics:
+        return
+    now = time.perf_counter()
+    raw = raw if isinstance(raw, dict) else {}
+    if raw.get("prompt_eval_duration") is not None and raw.get("eval_duration") is not None:
+        prefill, decode = raw["prompt_eval_duration"] / 1e9, raw["eval_duration"] / 1e9
+    elif first_chunk is not None:
+        prefill, decode = first_chunk - started, now - first_chunk
+    else:
+        prefill, decode = now - started, None
+
+    metrics.observe("llm_prefill_seconds", prefill, model=model, **labels)
+    if decode is not None:
+        metrics.observe("llm_decode_seconds", decode, model=model, **labels)
+    if raw.get("prompt_eval_count") is not None:
+        metrics.inc("llm_prompt_tokens_total", raw["prompt_eval_count"], model=model, **labels)
+    if raw.get("eval_count") is not None:
+        metrics.inc("llm_completion_tokens_total", raw["eval_count"], model=model, **labels)
+
+
+def render() -> str:
+    metrics = get_metrics()
+    return metrics.render() if metrics else ""
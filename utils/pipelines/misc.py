@@ -1,4 +1,6 @@
+import os
 import re
+from pathlib import Path
 
 
 def convert_to_raw_url(github_url):
@@ -33,3 +35,22 @@ def convert_to_raw_url(github_url):
 
     # If the URL does not match the expected pattern, return the original URL or raise an error
     return github_url
+
+
+def get_cache_dir(name: str) -> Path:
+    """
+    Returns the directory used to persist a local cache, creating it if needed.
+
+    The root can be moved with the PIPELINES_CACHE_DIR environment variable,
+    defaults to ~/.cache/open-webui-pipelines.
+
+    Parameters:
+    name (str): The name of the cache, used as sub folder.
+
+    Returns:
+    Path: The cache directory.
+    """
+    root = os.getenv("PIPELINES_CACHE_DIR") or Path.home() / ".cache" / "open-webui-pipelines"
+    cache_dir = Path(root) / name
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    return cache_dir
@@ -0,0 +1,198 @@
+"""
+Local cache for the Fabric pattern files (system.md / user.md).
+
+Patterns are stored already sanitized on disk, one JSON file per URL, and kept
+in memory once loaded. Fresh entries (younger than the TTL) are served without
+touching the network, stale entries are served immediately while a background
+thread revalidates them with a conditional GET (ETag / Last-Modified), so a slow
+or unreachable GitHub never blocks a request that has been served before.
+"""
+import os
+import json
+import time
+import hashlib
+import threading
+from pathlib import Path
+from typing import Callable, Optional
+
+import httpx
+
+from utils.pipelines.misc import get_cache_dir
+from utils.pipelines.http_client import get_http_client
+
+# Bump when the layout of the cached entries changes, old entries are then ignored
+CACHE_VERSION = 1
+
+
+class PatternCache:
+    def __init__(self, cache_dir: Optional[Path] = None, ttl: Optional[float] = None) -> None:
+        self.cache_dir = Path(cache_dir) if cache_dir else get_cache_dir("fabric_patterns")
+        self.ttl = float(ttl if ttl is not None else os.getenv("FABRIC_PATTERN_CACHE_TTL", 24 * 60 * 60))
+        self.retry_after = min(self.ttl, 60.0)
+        self.stats = {
+            "hits": 0,
+            "stale_hits": 0,
+            "misses": 0,
+            "revalidations": 0,
+            "not_modified": 0,
+            "errors": 0,
+        }
+        self._entries = {}
+        self._refreshing = set()
+        self._next_attempt = {}
+        self._lock = threading.Lock()
+
+
+    def get(self, url: str, sanitize: Callable[[str], str]) -> str:
+        """
+        Returns the sanitized content of the given pattern URL.
+
+        Args:
+            url (str): The URL of the pattern file.
+            sanitize (Callable): Function applied to the downloaded content before storing it.
+
+        Returns:
+            str: The sanitized content, an empty string if the file does not exist upstream.
+
+        Raises:
+            httpx.HTTPError: If the pattern has never been cached and cannot be downloaded.
+        """
+        entry = self.__lookup(url, sanitize)
+        if entry is None:
+            entry = self.__fetch(url, sanitize)
+        return entry["content"]
+
+
+    async def aget(self, url: str, sanitize: Callable[[str], str]) -> str:
+        """
+        Same as get, but downloads a missing pattern without blocking the event loop.
+
+        Raises:
+            httpx.HTTPError: If the pattern has never been cached and cannot be downloaded.
+        """
+        entry = self.__lookup(url, sanitize)
+        if entry is None:
+            response = await get_http_client().aget(url)
+            entry = self.__update(url, sanitize, None, response)
+        return entry["content"]
+
+
+    def __lookup(self, url: str, sanitize: Callable[[str], str]) -> Optional[dict]:
+        entry = self.__load(url)
+        if entry is None:
+            self.__count("misses")
+        elif time.time() - entry["validated_at"] < self.ttl:
+            self.__count("hits")
+        else:
+            self.__count("stale_hits")
+            self.__revalidate_in_background(url, sanitize, entry)
+        return entry
+
+
+    def __count(self, key: str) -> None:
+        with self._lock:
+            self.stats[key] += 1
+
+
+    def __path(self, url: str) -> Path:
+        return self.cache_dir / f"{hashlib.sha256(url.encode('utf-8')).hexdigest()[:32]}.json"
+
+
+    def __load(self, url: str) -> Optional[dict]:
+        entry = self._entries.get(url)
+        if entry is not None:
+            return entry
+        try:
+            entry = json.loads(self.__path(url).read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+        if entry.get("version") != CACHE_VERSION or entry.get("url") != url:
+            return None
+        self._entries[url] = entry
+        return entry
+
+
+    def __store(self, entry: dict) -> None:
+        self._entries[entry["url"]] = entry
+        path = self.__path(entry["url"])
+        tmp_path = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            tmp_path.write_text(json.dumps(entry), encoding="utf-8")
+            os.replace(tmp_path, path)
+        except OSError as e:
+            # The in memory copy is still valid, the next process will simply download it again
+            print(f"Unable to persist Fabric pattern cache entry {path}: {e}")
+
+
+    def __fetch(self, url: str, sanitize: Callable[[str], str], entry: Optional[dict] = None) -> dict:
+        headers = {}
+        if entry and entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry and entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+
+        response = get_http_client().get(url, headers=headers)
+        return self.__update(url, sanitize, entry, response)
+
+
+    def __update(self, url: str, sanitize: Callable[[str], str], entry: Optional[dict], response) -> dict:
+        if response.status_code == 304 and entry:
+            self.__count("not_modified")
+            entry = {**entry, "validated_at": time.time()}
+        elif response.status_code == 404:
+            # Most patterns have no user.md, remember it instead of asking GitHub every time
+            entry = self.__new_entry(url, "", response)
+        else:
+            response.raise_for_status()
+            entry = self.__new_entry(url, sanitize(response.text), response)
+
+        self.__store(entry)
+        return entry
+
+
+    def __new_entry(self, url: str, content: str, response) -> dict:
+        return {
+            "version": CACHE_VERSION,
+            "url": url,
+            "content": content,
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "validated_at": time.time(),
+        }
+
+
+    def __revalidate_in_background(self, url: str, sanitize: Callable[[str], str], entry: dict) -> None:
+        with self._lock:
+            if url in self._refreshing or time.time() < self._next_attempt.get(url, 0):
+                return
+            self._refreshing.add(url)
+        threading.Thread(target=self.__revalidate, args=(url, sanitize, entry), daemon=True).start()
+
+
+    def __revalidate(self, url: str, sanitize: Callable[[str], str], entry: dict) -> None:
+        try:
+            self.__count("revalidations")
+            self.__fetch(url, sanitize, entry)
+        except httpx.HTTPError as e:
+            # Keep serving the stale copy and try again later
+            self.__count("errors")
+            with self._lock:
+                self._next_attempt[url] = time.time() + self.retry_after
+            print(f"Unable to revalidate Fabric pattern {url}: {e}")
+        finally:
+            with self._lock:
+                self._refreshing.discard(url)
+
+
+_pattern_cache: Optional[PatternCache] = None
+
+
+def get_pattern_cache() -> PatternCache:
+    """
+    Returns the process wide pattern cache, created on first use so that the
+    environment loaded by the pipelines (.env) is taken into account.
+    """
+    global _pattern_cache
+    if _pattern_cache is None:
+        _pattern_cache = PatternCache()
+    return _pattern_cache
@@ -0,0 +1,285 @@
+"""
+Offline pack of the Fabric patterns.
+
+A build step snapshots the whole Fabric patterns catalog into one file holding
+the already sanitized system.md/user.md of every pattern and an index of the
+names. The pipelines open it memory-mapped and decode a pattern only when it
+is first used, so the patterns are served without network and without
+sanitizing them again, and every Fabric pattern can be asked for by name.
+
+Layout (little endian):
+    header  magic "FABRICPK", version, number of patterns, index offset and length
+    bodies  the UTF-8 contents, one after the other
+    index   JSON: {"meta": {...}, "patterns": {name: [system offset, length, user offset, length]}}
+
+Build it from a checkout of the Fabric repository or from its GitHub tarball:
+    python -m utils.pipelines.pattern_pack build [--source path/to/fabric] [--output patterns.pack]
+    python -m utils.pipelines.pattern_pack info [--output patterns.pack]
+
+The pack is looked up at FABRIC_PATTERN_PACK, by default patterns.pack in the
+fabric_patterns cache folder, and picked up (or reloaded) without restarting.
+Patterns missing from the pack are still downloaded through the pattern cache.
+"""
+import os
+import re
+import sys
+import json
+import mmap
+import time
+import struct
+import tarfile
+import argparse
+import tempfile
+import threading
+from pathlib import Path
+from datetime import datetime, timezone
+from typing import Dict, Iterator, Optional, Tuple
+
+from utils.pipelines.misc import get_cache_dir
+
+MAGIC = b"FABRICPK"
+VERSION = 1
+HEADER = struct.Struct("<8sIIQQ")
+FILES = ("system.md", "user.md")
+TARBALL_URL = "https://codeload.github.com/danielmiessler/fabric/tar.gz/refs/heads/main"
+PATTERN_URL = re.compile(r"/patterns/([^/]+)/(system\.md|user\.md)$")
+PATTERN_NAME = re.compile(r"^[\w\-]+$")
+
+# Bump when sanitize_pattern changes, the packs built with another version are then ignored
+SANITIZER_VERSION = 1
+# Everything but letters, digits, whitespace and . , ; : ! ? -
+DISALLOWED_CHARACTERS = re.compile(r"[^a-zA-Z0-9\s.,;:!?\-]+")
+
+
+def sanitize_pattern(content: str) -> str:
+    """
+    Remove the characters outside the allowlist from a pattern, prompt injection being the main threat
+    """
+    return DISALLOWED_CHARACTERS.sub("", content)
+
+
+def is_pattern_name(value: Optional[str]) -> bool:
+    """
+    True for a Fabric pattern name (i.e. "extract_wisdom"), False for an inline prompt
+    """
+    return bool(value) and PATTERN_NAME.match(value) is not None
+
+
+class PatternPack:
+    def __init__(self, path: Path) -> None:
+        """
+        Raises:
+            OSError: when the file can't be read
+            ValueError: when it isn't a pattern pack of this version
+        """
+        self.path = Path(path)
+        with open(self.path, "rb") as pack_file:
+            self.mtime = os.fstat(pack_file.fileno()).st_mtime
+            self._mmap = mmap.mmap(pack_file.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            magic, version, count, index_offset, index_length = HEADER.unpack_from(self._mmap, 0)
+            if magic != MAGIC or version != VERSION:
+                raise ValueError(f"{self.path} is not a version {VERSION} Fabric pattern pack")
+            index = json.loads(self._mmap[index_offset:index_offset + index_length])
+            if index["meta"].get("sanitizer") != SANITIZER_VERSION:
+                raise ValueError(f"{self.path} was built with another sanitizer, rebuild it")
+        except (struct.error, KeyError, UnicodeDecodeError, json.JSONDecodeError) as e:
+            self._mmap.close()
+            raise ValueError(f"{self.path} is not a valid Fabric pattern pack: {e}")
+        except ValueError:
+            self._mmap.close()
+            raise
+        self.meta = index["meta"]
+        self.index: Dict[str, list] = index["patterns"]
+        self._contents: Dict[Tuple[str, str], str] = {}
+
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.index
+
+
+    def names(self) -> list:
+        return sorted(self.index)
+
+
+    def keywords(self) -> Dict[str, str]:
+        """
+        The pattern names usable as router keywords: the compound ones (i.e. "create_quiz"),
+        single words like "ai" would match ordinary messages
+        """
+        return {name: name for name in self.index if "_" in name}
+
+
+    def get(self, name: str, file: str = "system.md") -> Optional[str]:
+        """
+        Returns:
+            str: the sanitized content, empty when the pattern has no such file; None when the pattern isn't in the pack
+        """
+        key = (name, file)
+        content = self._contents.get(key)
+        if content is not None:
+            return content
+        entry = self.index.get(name)
+        if entry is None or file not in FILES:
+            return None
+        offset, length = entry[2 * FILES.index(file):2 * FILES.index(file) + 2]
+        content = self._mmap[offset:offset + length].decode("utf-8")
+        self._contents[key] = content
+        return content
+
+
+    def lookup_url(self, url: str) -> Optional[str]:
+        """
+        The content of a pattern file from its GitHub URL, None when the pack doesn't hold it
+        """
+        match = PATTERN_URL.search(url)
+        return self.get(match.group(1), match.group(2)) if match else None
+
+
+    def close(self) -> None:
+        self._mmap.close()
+
+
+def build_pack(patterns: Iterator[Tuple[str, Dict[str, str]]], output: Path, source: str = "") -> dict:
+    """
+    Write a pack from (name, {"system.md": content, "user.md": content}) pairs, sanitizing the contents.
+    The file is replaced atomically, processes that have the previous one mapped keep reading it.
+
+    Returns:
+        dict: the metadata of the pack
+    """
+    output = Path(output)
+    output.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = output.with_suffix(f".{os.getpid()}.tmp")
+    index = {}
+    with open(tmp_path, "wb") as pack_file:
+        pack_file.write(b"\0" * HEADER.size)
+        offset = HEADER.size
+        for name, files in sorted(patterns):
+            if not is_pattern_name(name) or not files.get("system.md"):
+                continue
+            entry = []
+            for file in FILES:
+                body = sanitize_pattern(files.get(file) or "").encode("utf-8")
+                pack_file.write(body)
+                entry += [offset, len(body)]
+                offset += len(body)
+            index[name] = entry
+
+        meta = {
+            "source": source,
+            "built_at": datetime.now(timezone.utc).isoformat(),
+            "sanitizer": SANITIZER_VERSION,
+            "patterns": len(index),
+        }
+        encoded = json.dumps({"meta": meta, "patterns": index}, separators=(",", ":")).encode("utf-8")
+        pack_file.write(encoded)
+        pack_file.seek(0)
+        pack_file.write(HEADER.pack(MAGIC, VERSION, len(index), offset, len(encoded)))
+    os.replace(tmp_path, output)
+    return meta
+
+
+def iter_directory(root: Path) -> Iterator[Tuple[str, Dict[str, str]]]:
+    """
+    The patterns of a Fabric checkout (the folder holding the patterns, or any parent of it)
+    """
+    grouped: Dict[str, Dict[str, str]] = {}
+    for path in sorted(Path(root).rglob("*.md")):
+        if path.name in FILES and path.parent.parent.name == "patterns":
+            grouped.setdefault(path.parent.name, {})[path.name] = path.read_text(encoding="utf-8", errors="replace")
+    return iter(grouped.items())
+
+
+def iter_tarball(url: str = TARBALL_URL, max_bytes: int = 500 * 1024 * 1024) -> Iterator[Tuple[str, Dict[str, str]]]:
+    """
+    The patterns of the Fabric repository tarball, downloaded through the shared HTTP client
+    """
+    from utils.pipelines.http_client import get_http_client
+
+    http = get_http_client()
+    grouped: Dict[str, Dict[str, str]] = {}
+    with tempfile.TemporaryFile() as archive:
+        with http.stream("GET", url) as response:
+            response.raise_for_status()
+            for chunk in http.iter_bytes(response, max_bytes):
+                archive.write(chunk)
+        archive.seek(0)
+        with tarfile.open(fileobj=archive, mode="r:*") as tar:
+            for member in tar:
+                parts = member.name.split("/")
+                if member.isfile() and len(parts) >= 3 and parts[-1] in FILES and parts[-3] == "patterns":
+                    content = tar.extractfile(member).read().decode("utf-8", errors="replace")
+                    grouped.setdefault(parts[-2], {})[parts[-1]] = content
+    return iter(grouped.items())
+
+
+def default_pack_path() -> Path:
+    return Path(os.getenv("FABRIC_PATTERN_PACK") or get_cache_dir("fabric_patterns") / "patterns.pack")
+
+
+_pack: Optional[PatternPack] = None
+_checked_at: Optional[float] = None
+_lock = threading.Lock()
+CHECK_INTERVAL = 30.0
+
+
+def get_pattern_pack() -> Optional[PatternPack]:
+    """
+    Returns the process wide pattern pack, None when there is none. The file is checked
+    at most every 30 seconds, so a pack built (or rebuilt) later is picked up.
+    """
+    global _pack, _checked_at
+    now = time.monotonic()
+    if _checked_at is not None and now - _checked_at < CHECK_INTERVAL:
+        return _pack
+    with _lock:
+        if _checked_at is not None and now - _checked_at < CHECK_INTERVAL:
+            return _pack
+        _checked_at = now
+        path = default_pack_path()
+        try:
+            mtime = path.stat().st_mtime
+        except OSError:
+            _pack = None
+            return None
+        if _pack is None or _pack.path != path or _pack.mtime != mtime:
+            try:
+                # The previous pack stays mapped until garbage collected, requests may still be reading it
+                _pack = PatternPack(path)
+            except (OSError, ValueError) as e:
+                print(f"Fabric pattern pack ignored: {e}")
+                _pack = None
+        return _pack
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or inspect the offline Fabric pattern pack")
+    parser.add_argument("command", choices=["build", "info"])
+    parser.add_argument("--source", help="Fabric checkout (or its patterns folder), instead of downloading the GitHub tarball")
+    parser.add_argument("--url", default=TARBALL_URL, help="tarball of the Fabric repository")
+    parser.add_argument("--output", type=Path, default=None, help="pack file, FABRIC_PATTERN_PACK or the cache folder by default")
+    args = parser.parse_args()
+    output = args.output or default_pack_path()
+
+    if args.command == "build":
+        started = time.perf_counter()
+        patterns = iter_directory(Path(args.source)) if args.source else iter_tarball(args.url)
+        meta = build_pack(patterns, output, source=args.source or args.url)
+        print(f"{meta['patterns']} patterns written to {output} ({output.stat().st_size / 1024:.0f}KB) in {time.perf_counter() - started:.1f}s")
+        return
+
+    try:
+        pack = PatternPack(output)
+    except (OSError, ValueError) as e:
+        sys.exit(str(e))
+    print(json.dumps(pack.meta, indent=2))
+    print(", ".join(pack.names()))
+
+
+if __name__ == "__main__":
+    main()
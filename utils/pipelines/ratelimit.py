@@ -0,0 +1,250 @@
+"""
+Rate limiter shared by the worker processes of the pipelines server, for the
+APIs that throttle us (i.e. the unofficial YouTube transcript API).
+
+The state lives in a small JSON file of the cache folder, read and updated
+under an exclusive file lock, so every process draws from the same budget:
+    token bucket   `rate` requests per second with bursts of `burst` (GCRA). A
+                   request takes a slot only once one is free, until then it
+                   sleeps for the time computed under the lock without
+                   reserving anything, so a pause after a 429 wastes no slot.
+                   A request whose slot is past its deadline gives up at once
+                   instead of waiting in vain.
+    backoff        a 429 pauses every process for a jittered exponential backoff
+                   (or the Retry-After of the answer) and halves the rate; each
+                   success gives back a hundredth of the configured rate, so the
+                   limiter settles near the highest rate the API tolerates.
+"""
+import json
+import time
+import random
+import threading
+from pathlib import Path
+from typing import Callable, Dict, Optional, TypeVar
+
+from utils.pipelines.metrics import inc
+from utils.pipelines.misc import get_cache_dir
+
+try:
+    import fcntl
+except ImportError:  # Windows: the limiter is only shared by the threads of the process
+    fcntl = None
+
+try:
+    from youtube_transcript_api import _errors as transcript_errors
+except ImportError:
+    transcript_errors = None
+
+# The errors of youtube-transcript-api telling that YouTube throttles us (IpBlocked is a RequestBlocked)
+RATE_LIMIT_ERRORS = tuple(
+    getattr(transcript_errors, name) for name in ("RequestBlocked", "TooManyRequests") if hasattr(transcript_errors, name)
+)
+
+Result = TypeVar("Result")
+
+
+class RateLimitTimeout(TimeoutError):
+    """
+    No slot could be had before the deadline
+    """
+
+
+def is_rate_limited(error: BaseException) -> bool:
+    """
+    True for the errors telling that the API throttles us: an HTTP 429, or the
+    RequestBlocked / TooManyRequests errors of youtube-transcript-api
+    """
+    response = getattr(error, "response", None)
+    return getattr(response, "status_code", None) == 429 or isinstance(error, RATE_LIMIT_ERRORS)
+
+
+def get_retry_after(error: BaseException) -> Optional[float]:
+    # Seconds of the Retry-After header of a 429 answer, when it has one
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        return None
+
+
+class RateLimiter:
+    def __init__(
+        self,
+        path: Path,
+        rate: float,
+        burst: int = 1,
+        min_rate: Optional[float] = None,
+        base_backoff: float = 1.0,
+        max_backoff: float = 60.0,
+    ) -> None:
+        """
+        Args:
+            path (Path): the state file, shared by the processes using the same limit
+            rate (float): requests per second at most
+            burst (int): requests allowed at once after an idle period
+            min_rate (float): the rate isn't lowered below it after 429s, rate / 20 by default
+            base_backoff (float): pause after the first 429, in seconds, doubled at each consecutive one
+            max_backoff (float): longest pause
+        """
+        self.path = Path(path)
+        self.rate = rate
+        self.burst = max(int(burst), 1)
+        self.min_rate = min_rate or rate / 20
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.stats = {"acquired": 0, "waited": 0.0, "timeouts": 0, "rate_limited": 0}
+        self._lock = threading.Lock()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+
+    def __update(self, update: Callable[[dict, float], Result]) -> Result:
+        """
+        Run update(state, now) under the lock, writing the state back
+        """
+        with self._lock, open(self.path, "a+") as state_file:
+            if fcntl is not None:
+                fcntl.flock(state_file, fcntl.LOCK_EX)
+            try:
+                state_file.seek(0)
+                try:
+                    state = json.loads(state_file.read() or "{}")
+                except ValueError:
+                    state = {}
+                if state.get("max_rate") != self.rate:
+                    # New limit (or new file): start from the configured rate
+                    state = {"max_rate": self.rate, "rate": self.rate, "tat": 0.0, "blocked_until": 0.0, "strikes": 0}
+                result = update(state, time.time())
+                state_file.seek(0)
+                state_file.truncate()
+                state_file.write(json.dumps(state))
+                state_file.flush()
+                return result
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(state_file, fcntl.LOCK_UN)
+
+
+    def __try_take(self, deadline: float) -> Optional[float]:
+        """
+        Take the slot if it's free: 0. Otherwise the seconds until it is, nothing taken,
+        or None when it won't be free before the deadline.
+        """
+        def take(state: dict, now: float) -> Optional[float]:
+            interval = 1 / state["rate"]
+            # GCRA: the slot is free once the theoretical arrival time is less than a burst away
+            start = max(now, state["blocked_until"], state["tat"] - (self.burst - 1) * interval)
+            # A slot free now is taken whatever the deadline, a timeout of 0 means "only if free"
+            if start > max(deadline, now):
+                return None
+            if start > now:
+                return start - now
+            state["tat"] = max(state["tat"], now) + interval
+            return 0.0
+        return self.__update(take)
+
+
+    def acquire(self, timeout: float) -> float:
+        """
+        Wait for a slot, shared with every process
+
+        Args:
+            timeout (float): seconds the caller can wait
+
+        Returns:
+            float: the seconds waited
+
+        Raises:
+            RateLimitTimeout: when no slot is free within the timeout
+        """
+        started = time.time()
+        deadline = started + timeout
+        while True:
+            wait = self.__try_take(deadline)
+            if wait is None:
+                with self._lock:
+                    self.stats["timeouts"] += 1
+                inc("rate_limit_total", limiter=self.path.stem, result="timeout")
+                raise RateLimitTimeout(f"No {self.path.stem} slot free within {timeout:.0f}s")
+            if not wait:
+                break
+            # Computed again after the sleep: another request may have taken the slot, or a 429 paused every process
+            time.sleep(wait)
+        waited = time.time() - started
+        with self._lock:
+            self.stats["acquired"] += 1
+            self.stats["waited"] += waited
+        inc("rate_limit_total", limiter=self.path.stem, result="acquired")
+        return waited
+
+
+    def on_success(self) -> None:
+        def success(state: dict, now: float) -> None:
+            state["strikes"] = 0
+            state["rate"] = min(state["max_rate"], state["rate"] + state["max_rate"] / 100)
+        self.__update(success)
+
+
+    def on_rate_limited(self, retry_after: Optional[float] = None) -> float:
+        """
+        Pause every process and halve the rate after a 429
+
+        Args:
+            retry_after (float): the Retry-After of the answer, if any, used instead of the backoff
+
+        Returns:
+            float: the seconds of the pause
+        """
+        def rate_limited(state: dict, now: float) -> float:
+            if now < state["blocked_until"]:
+                # A request sent before the pause started, the 429s of the same burst count once
+                return state["blocked_until"] - now
+            backoff = retry_after
+            if backoff is None:
+                # Full jitter: the processes don't come back all at the same moment
+                backoff = min(self.max_backoff, self.base_backoff * 2 ** state["strikes"]) * random.uniform(0.5, 1.5)
+            state["strikes"] += 1
+            state["rate"] = max(self.min_rate, state["rate"] / 2)
+            state["blocked_until"] = max(state["blocked_until"], now + backoff)
+            return backoff
+        with self._lock:
+            self.stats["rate_limited"] += 1
+        inc("rate_limit_total", limiter=self.path.stem, result="rate_limited")
+        return self.__update(rate_limited)
+
+
+    def call(self, function: Callable[[], Result], timeout: float) -> Result:
+        """
+        Call function in a slot, again after a backoff while it's rate limited, within the timeout
+
+        Raises:
+            RateLimitTimeout: when the timeout expired before a call could succeed
+            the exceptions of function, but the rate limits
+        """
+        deadline = time.time() + timeout
+        while True:
+            self.acquire(max(0.0, deadline - time.time()))
+            try:
+                result = function()
+            except Exception as e:
+                if not is_rate_limited(e):
+                    raise
+                self.on_rate_limited(get_retry_after(e))
+                continue
+            self.on_success()
+            return result
+
+
+_limiters: Dict[str, RateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(name: str, rate: float, burst: int = 1) -> RateLimiter:
+    """
+    Returns the rate limiter name of the process, sharing its budget with the other processes.
+    A new rate or burst (i.e. the valves changed) replaces it.
+    """
+    with _limiters_lock:
+        limiter = _limiters.get(name)
+        if limiter is None or limiter.rate != rate or limiter.burst != burst:
+            limiter = _limiters[name] = RateLimiter(get_cache_dir("rate_limits") / f"{name}.json", rate=rate, burst=burst)
+        return limiter
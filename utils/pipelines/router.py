@@ -0,0 +1,84 @@
+"""
+Keyword router used by the Fabric integrations to find the pattern and the
+language requested in a user message.
+
+All the keywords are compiled once in a single alternation, longest first, so
+a message is scanned in one pass whatever the number of patterns.
+"""
+import re
+from typing import List, Optional, Tuple
+
+
+class PatternRouter:
+    LANGUAGE = "language"
+    PATTERN = "pattern"
+
+    def __init__(self, languages: dict, patterns: dict) -> None:
+        """
+        Args:
+            languages (dict): language tags (i.e. "en", "it") mapped to their value
+            patterns (dict): keywords (i.e. "extract wisdom") mapped to the pattern to apply
+        """
+        self.routes = {}
+        for kind, keywords in ((self.LANGUAGE, languages), (self.PATTERN, patterns)):
+            for keyword, value in keywords.items():
+                self.routes.setdefault(self.normalize(keyword), (kind, keyword, value))
+
+        alternation = "|".join(
+            r"\s+".join(re.escape(word) for word in keyword.split())
+            for keyword in sorted(self.routes, key=len, reverse=True)
+        )
+        self.regex = re.compile(rf"\b(?:{alternation})\b", re.IGNORECASE) if alternation else None
+
+
+    @staticmethod
+    def normalize(keyword: str) -> str:
+        return " ".join(keyword.lower().split())
+
+
+    def route(self, message: Optional[str]) -> Tuple[Optional[str], Optional[str]]:
+        """
+        Find the first language tag and the first pattern keyword in the message
+
+        Args:
+            message (str): user message
+
+        Returns:
+            Tuple: the language tag and the pattern value, None when not found
+        """
+        language = pattern = None
+        if not message or self.regex is None:
+            return language, pattern
+
+        for match in self.regex.finditer(message):
+            kind, keyword, value = self.routes[self.normalize(match.group(0))]
+            if kind == self.LANGUAGE and language is None:
+                language = keyword
+            elif kind == self.PATTERN and pattern is None:
+                pattern = value
+            if language is not None and pattern is not None:
+                break
+        return language, pattern
+
+
+    def find_all(self, message: Optional[str], kind: str = PATTERN) -> List[str]:
+        """
+        Find all the values of the given kind referenced in the message, in order and without duplicates
+
+        Args:
+            message (str): user message
+            kind (str): PatternRouter.PATTERN or PatternRouter.LANGUAGE
+
+        Returns:
+            List: the pattern values (or the language tags) found
+        """
+        found = []
+        if not message or self.regex is None:
+            return found
+
+        for match in self.regex.finditer(message):
+            route_kind, keyword, value = self.routes[self.normalize(match.group(0))]
+            value = keyword if route_kind == self.LANGUAGE else value
+            if route_kind == kind and value not in found:
+                found.append(value)
+        return found
@@ -0,0 +1,142 @@
+"""
+Streaming RSS parser.
+
+Items are built straight from the expat events while the bytes arrive, so
+neither the whole document nor an element tree is ever held in memory, and
+parsing stops as soon as enough items have been collected.
+
+The parser refuses any DTD (and therefore any entity declaration), which
+rules out entity expansion attacks (billion laughs, external entities) that
+the stdlib XML parsers are otherwise exposed to.
+"""
+import xml.parsers.expat
+from typing import Iterable, Iterator, List, Optional
+
+# RSS item elements kept in the records, and the key they are stored under
+ITEM_FIELDS = {
+    "title": "title",
+    "description": "description",
+    "link": "link",
+    "pubDate": "published",
+    "guid": "guid",
+}
+
+
+class FeedParseError(ValueError):
+    """The feed is not well formed or uses forbidden XML features"""
+
+
+class RSSParser:
+    def __init__(self) -> None:
+        self.parser = xml.parsers.expat.ParserCreate()
+        self.parser.buffer_text = True
+        self.parser.SetParamEntityParsing(xml.parsers.expat.XML_PARAM_ENTITY_PARSING_NEVER)
+        self.parser.StartDoctypeDeclHandler = self.__refuse_dtd
+        self.parser.EntityDeclHandler = self.__refuse_entity
+        self.parser.ExternalEntityRefHandler = self.__refuse_entity
+        self.parser.StartElementHandler = self.__start_element
+        self.parser.EndElementHandler = self.__end_element
+        self.parser.CharacterDataHandler = self.__character_data
+        self.items: List[dict] = []
+        self.item: Optional[dict] = None
+        self.field: Optional[str] = None
+        self.text: List[str] = []
+        self.depth = 0
+        self.item_depth = 0
+
+
+    def feed(self, data: bytes) -> List[dict]:
+        """
+        Parse the next chunk of the document.
+
+        Args:
+            data (bytes): the chunk
+
+        Returns:
+            List[dict]: the items completed by this chunk
+
+        Raises:
+            FeedParseError: if the feed is malformed or contains a DTD
+        """
+        try:
+            self.parser.Parse(data, False)
+        except xml.parsers.expat.ExpatError as e:
+            raise FeedParseError(f"Invalid feed: {e}") from e
+        return self.__pop_items()
+
+
+    def close(self) -> List[dict]:
+        try:
+            self.parser.Parse(b"", True)
+        except xml.parsers.expat.ExpatError as e:
+            raise FeedParseError(f"Invalid feed: {e}") from e
+        return self.__pop_items()
+
+
+    def __pop_items(self) -> List[dict]:
+        items, self.items = self.items, []
+        return items
+
+
+    def __refuse_dtd(self, *args) -> None:
+        raise FeedParseError("DTDs are not allowed in feeds")
+
+
+    def __refuse_entity(self, *args) -> None:
+        raise FeedParseError("Entity declarations are not allowed in feeds")
+
+
+    def __start_element(self, name: str, attrs: dict) -> None:
+        self.depth += 1
+        if self.item is None:
+            if name == "item":
+                self.item = dict.fromkeys(ITEM_FIELDS.values())
+                self.item_depth = self.depth
+        elif self.depth == self.item_depth + 1 and name in ITEM_FIELDS:
+            self.field = ITEM_FIELDS[name]
+            self.text = []
+
+
+    def __end_element(self, name: str) -> None:
+        if self.item is not None:
+            if self.field is not None and self.depth == self.item_depth + 1:
+                self.item[self.field] = "".join(self.text).strip()
+                self.field = None
+            elif self.depth == self.item_depth:
+                self.items.append(self.item)
+                self.item = None
+        self.depth -= 1
+
+
+    def __character_data(self, data: str) -> None:
+        if self.field is not None:
+            self.text.append(data)
+
+
+def iter_rss_items(chunks: Iterable[bytes], max_items: Optional[int] = None) -> Iterator[dict]:
+    """
+    Yield the items of an RSS feed as the chunks are consumed.
+
+    Args:
+        chunks (Iterable[bytes]): the raw document, i.e. a streamed HTTP response body
+        max_items (int): stop reading the document after this many items
+
+    Yields:
+        dict: the item with its title, description, link, published date and guid
+
+    Raises:
+        FeedParseError: if the feed is malformed or contains a DTD
+    """
+    parser = RSSParser()
+    count = 0
+    for chunk in chunks:
+        for item in parser.feed(chunk):
+            yield item
+            count += 1
+            if max_items and count >= max_items:
+                return
+    for item in parser.close():
+        yield item
+        count += 1
+        if max_items and count >= max_items:
+            return
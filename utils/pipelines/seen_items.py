@@ -0,0 +1,105 @@
+"""
+Items (i.e. RSS stories) already shown to a user or in a chat, for the "what's new" digests.
+
+Each owner has one entry in a SqliteStore: the 8 byte digests of the GUIDs and
+links of the items shown, most recent last and capped to max_items, so an
+owner costs a few KB whatever the feeds. An item is seen when its GUID or its
+link was, a story moved to another category or republished with a new GUID is
+not shown again. Owners not seen for the TTL of the store are forgotten.
+"""
+import os
+import sqlite3
+import hashlib
+from typing import Iterable, List, Optional, Set
+
+from utils.pipelines.store import SqliteStore, get_store
+
+DIGEST_SIZE = 8
+
+
+class SeenItems:
+    def __init__(self, store: SqliteStore, max_items: int = 4096) -> None:
+        """
+        Args:
+            store (SqliteStore): where the digests are persisted, one entry per owner
+            max_items (int): digests kept per owner, the oldest are dropped
+        """
+        self.store = store
+        self.max_items = max_items
+
+
+    @staticmethod
+    def item_digests(item: dict) -> List[bytes]:
+        return [
+            hashlib.blake2b(value.strip().encode("utf-8"), digest_size=DIGEST_SIZE).digest()
+            for value in (item.get("guid"), item.get("link")) if value and value.strip()
+        ]
+
+
+    def seen(self, owner: str) -> Set[bytes]:
+        """
+        The digests of the items already shown to owner
+        """
+        try:
+            value = self.store.get(owner)
+        except sqlite3.Error as e:
+            # A broken store must not break the request, everything is new then
+            print(f"Seen items store unavailable: {e}")
+            return set()
+        if not value:
+            return set()
+        return {value[index:index + DIGEST_SIZE] for index in range(0, len(value), DIGEST_SIZE)}
+
+
+    def unseen(self, owner: str, items: Iterable[dict]) -> List[dict]:
+        """
+        The items never shown to owner, in the same order
+        """
+        seen = self.seen(owner)
+        return [item for item in items if not any(digest in seen for digest in self.item_digests(item))]
+
+
+    def mark(self, owner: str, items: Iterable[dict]) -> None:
+        """
+        Remember that the items were shown to owner, merged with the marks of the other workers in one write transaction
+        """
+        digests = [digest for item in items for digest in self.item_digests(item)]
+
+        def merge(value: Optional[bytes]) -> Optional[bytes]:
+            value = value or b""
+            known = {value[index:index + DIGEST_SIZE] for index in range(0, len(value), DIGEST_SIZE)}
+            added = bytearray()
+            for digest in digests:
+                if digest not in known:
+                    known.add(digest)
+                    added += digest
+            if not added and value:
+                return None
+            return (value + bytes(added))[-self.max_items * DIGEST_SIZE:]
+
+        try:
+            self.store.update(owner, merge)
+        except sqlite3.Error as e:
+            print(f"Seen items store unavailable: {e}")
+
+
+_seen_items = {}
+
+
+def get_seen_items(name: str) -> Optional[SeenItems]:
+    """
+    Returns the process wide seen items of the store name, None when it can't be opened.
+    Owners expire after SEEN_ITEMS_TTL seconds (default 30 days) without a digest.
+    """
+    if name not in _seen_items:
+        try:
+            store = get_store(
+                name,
+                ttl=float(os.getenv("SEEN_ITEMS_TTL", 30 * 24 * 60 * 60)),
+                max_bytes=int(os.getenv("SEEN_ITEMS_MAX_BYTES", 100 * 1024 * 1024)),
+            )
+        except (sqlite3.Error, OSError) as e:
+            print(f"Seen items store unavailable: {e}")
+            return None
+        _seen_items[name] = SeenItems(store)
+    return _seen_items[name]
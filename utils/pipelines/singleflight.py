@@ -0,0 +1,172 @@
+"""
+Coalescing of identical requests in flight (single-flight).
+
+When several users ask for the same thing at the same moment (the morning
+digest, a link shared in a team), the first request computes the answer and
+the concurrent duplicates, identified by a key built from the normalized
+request, wait for it and share it. Nothing is kept once the computation is
+over: a later request computes again (the caches below still apply).
+
+Streamed answers are shared too: the chunks are buffered as they are produced
+and every request reads them from the start at its own pace. The source is
+pulled by whichever request needs the next chunk, so a client that stops
+reading doesn't stall the others, and it is closed when every request left.
+"""
+import threading
+from typing import Any, Callable, Dict, Hashable, Iterator, Optional
+
+from utils.pipelines.metrics import inc
+
+
+class _Flight:
+    def __init__(self) -> None:
+        self.condition = threading.Condition()
+        self.started = False
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+        self.source: Optional[Iterator] = None
+        self.chunks = []
+        self.done = False
+        self.pulling = False
+        self.subscribers = 1
+
+
+class SingleFlight:
+    def __init__(self, name: str) -> None:
+        """
+        Args:
+            name (str): label of the counters (pipeline_coalesced_total)
+        """
+        self.name = name
+        self.stats = {"leaders": 0, "followers": 0}
+        self._flights: Dict[Hashable, _Flight] = {}
+        self._lock = threading.Lock()
+
+
+    def run(self, key: Hashable, compute: Callable[[], Any], stream: bool = False) -> Any:
+        """
+        Returns the result of compute(), shared with the identical requests in flight
+
+        Args:
+            key (Hashable): the normalized request
+            compute (Callable): computes the answer, a string or an iterator of chunks
+            stream (bool): the caller accepts an iterator; otherwise a streamed answer is joined
+
+        Returns:
+            the answer: an iterator over the chunks when it is streamed, the shared value otherwise
+
+        Raises:
+            the exception raised by compute(), to every request sharing it
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+            else:
+                flight.subscribers += 1
+            self.stats["leaders" if leader else "followers"] += 1
+        inc("pipeline_coalesced_total", pipeline=self.name, role="leader" if leader else "follower")
+
+        if leader:
+            self.__compute(key, flight, compute)
+        else:
+            with flight.condition:
+                while not flight.started:
+                    flight.condition.wait()
+
+        if flight.source is None:
+            self.__leave(key, flight)
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+        chunks = self.__subscribe(key, flight)
+        return chunks if stream else "".join(chunks)
+
+
+    def __compute(self, key: Hashable, flight: _Flight, compute: Callable[[], Any]) -> None:
+        try:
+            result = compute()
+        except BaseException as e:
+            flight.error = e
+        else:
+            if hasattr(result, "__next__"):
+                flight.source = result
+            else:
+                flight.result = result
+        with flight.condition:
+            flight.started = True
+            if flight.source is None:
+                flight.done = True
+            flight.condition.notify_all()
+        if flight.source is None:
+            # Requests coming from now on compute again
+            self.__forget(key, flight)
+
+
+    def __subscribe(self, key: Hashable, flight: _Flight) -> Iterator:
+        index = 0
+        try:
+            while True:
+                with flight.condition:
+                    while index >= len(flight.chunks) and not flight.done and flight.pulling:
+                        flight.condition.wait()
+                    if index < len(flight.chunks):
+                        chunk = flight.chunks[index]
+                    elif flight.done:
+                        if flight.error is not None:
+                            raise flight.error
+                        return
+                    else:
+                        chunk = None
+                        flight.pulling = True
+
+                if chunk is None:
+                    self.__pull(key, flight)
+                    continue
+                index += 1
+                yield chunk
+        finally:
+            self.__leave(key, flight)
+
+
+    def __pull(self, key: Hashable, flight: _Flight) -> None:
+        chunk, done, error = None, False, None
+        try:
+            chunk = next(flight.source)
+        except StopIteration:
+            done = True
+        except Exception as e:
+            done, error = True, e
+        with flight.condition:
+            if done:
+                flight.done, flight.error = True, error
+            else:
+                flight.chunks.append(chunk)
+            flight.pulling = False
+            flight.condition.notify_all()
+        if done:
+            self.__forget(key, flight)
+
+
+    def __leave(self, key: Hashable, flight: _Flight) -> None:
+        with self._lock:
+            flight.subscribers -= 1
+            abandoned = flight.subscribers == 0 and not flight.done
+            if abandoned and self._flights.get(key) is flight:
+                del self._flights[key]
+        if abandoned and flight.source is not None and hasattr(flight.source, "close"):
+            # Every client went away mid stream, stop generating
+            with flight.condition:
+                flight.done = True
+                flight.condition.notify_all()
+            try:
+                flight.source.close()
+            except Exception:
+                pass
+
+
+    def __forget(self, key: Hashable, flight: _Flight) -> None:
+        with self._lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
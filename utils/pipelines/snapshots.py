@@ -0,0 +1,128 @@
+"""
+Precomputed answers refreshed in background (stale-while-revalidate).
+
+A scheduler started by on_startup computes a set of answers (i.e. the daily
+digest in every language) on an interval and keeps them in memory, so the
+requests asking for them are answered at once from the last snapshot. When a
+refresh fails the previous snapshot is kept and served, with its age, until a
+refresh succeeds again; before the first successful refresh the requests
+compute the answer themselves.
+"""
+import time
+import asyncio
+from typing import Callable, Dict, Hashable, Optional, Union
+
+from utils.pipelines.metrics import inc
+
+
+class Snapshot:
+    def __init__(self, content: str, items: Optional[list] = None) -> None:
+        """
+        Args:
+            content (str): the precomputed answer
+            items (list): what it was computed from, when the requests need it (i.e. the feed items of a digest)
+        """
+        self.content = content
+        self.items = items or []
+        self.refreshed_at = time.time()
+        # Last failed refresh since this snapshot was taken, if any
+        self.error: Optional[str] = None
+
+
+    def age(self) -> float:
+        return max(0.0, time.time() - self.refreshed_at)
+
+
+    def describe_age(self) -> str:
+        """
+        The age of the snapshot in words, i.e. "3 minutes" or "2 hours"
+        """
+        minutes = int(self.age() // 60)
+        if minutes < 1:
+            return "less than a minute"
+        if minutes < 120:
+            return f"{minutes} minute{'s' if minutes > 1 else ''}"
+        return f"{minutes // 60} hours"
+
+
+class SnapshotScheduler:
+    def __init__(self, name: str) -> None:
+        """
+        Args:
+            name (str): label of the counters (snapshot_refresh_total, snapshot_requests_total)
+        """
+        self.name = name
+        self.interval = 0.0
+        self.snapshots: Dict[Hashable, Snapshot] = {}
+        self.task: Optional[asyncio.Task] = None
+
+
+    def start(self, jobs: Dict[Hashable, Callable[[], Union[str, Snapshot]]], interval: float) -> asyncio.Task:
+        """
+        Refresh the snapshots now and then every interval seconds, in a background task replacing the running one.
+        The previous snapshots are dropped, the jobs (or what they depend on) may have changed.
+
+        Args:
+            jobs (dict): key of the snapshot -> blocking function computing it (the answer, or a Snapshot of it),
+                         run in a worker thread; it raises an exception when the answer can't be computed
+            interval (float): seconds between two refreshes
+        """
+        self.cancel()
+        self.snapshots = {}
+        self.interval = interval
+        self.task = asyncio.get_running_loop().create_task(self.__run(jobs))
+        return self.task
+
+
+    def cancel(self) -> None:
+        if self.task is not None and not self.task.done():
+            self.task.cancel()
+        self.task = None
+
+
+    def get(self, key: Hashable) -> Optional[Snapshot]:
+        """
+        The last good snapshot of key, None when there is none yet
+        """
+        snapshot = self.snapshots.get(key)
+        if snapshot is None:
+            result = "miss"
+        else:
+            result = "stale" if self.is_stale(snapshot) else "fresh"
+        inc("snapshot_requests_total", scheduler=self.name, result=result)
+        return snapshot
+
+
+    def is_stale(self, snapshot: Snapshot) -> bool:
+        """
+        True when the last refresh failed, or when the snapshot is older than two intervals (the refreshes are late)
+        """
+        return snapshot.error is not None or snapshot.age() > 2 * self.interval
+
+
+    async def refresh(self, jobs: Dict[Hashable, Callable[[], Union[str, Snapshot]]]) -> None:
+        """
+        Compute every snapshot once, one after the other so the refresh doesn't compete with the requests
+        """
+        for key, job in jobs.items():
+            started = time.perf_counter()
+            try:
+                content = await asyncio.to_thread(job)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                inc("snapshot_refresh_total", scheduler=self.name, result="error")
+                previous = self.snapshots.get(key)
+                if previous is not None:
+                    previous.error = str(e)
+                print(f"Refresh of the {self.name} snapshot {key} failed, {'serving the last one' if previous else 'no snapshot yet'}: {e}")
+                continue
+            inc("snapshot_refresh_total", scheduler=self.name, result="ok")
+            self.snapshots[key] = content if isinstance(content, Snapshot) else Snapshot(content)
+            print(f"Snapshot {key} of {self.name} refreshed in {time.perf_counter() - started:.1f}s")
+
+
+    async def __run(self, jobs: Dict[Hashable, Callable[[], Union[str, Snapshot]]]) -> None:
+        while True:
+            await self.refresh(jobs)
+            await asyncio.sleep(self.interval)
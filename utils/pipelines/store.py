@@ -0,0 +1,198 @@
+"""
+Small persistent key/value store on SQLite.
+
+The database runs in WAL mode with a busy timeout, so several worker processes
+of the pipelines server can read and write the same store safely. Values are
+zlib compressed, entries expire after a TTL, and the least recently used ones
+are evicted once the total (compressed) size exceeds max_bytes.
+
+Reads don't write: the access times of the entries read are kept in memory
+and written in one statement with the next write, or once ACCESS_BATCH reads
+or ACCESS_INTERVAL seconds have gone by, which is precise enough for the LRU.
+"""
+import time
+import zlib
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Callable, Optional
+
+from utils.pipelines.misc import get_cache_dir
+
+
+class SqliteStore:
+    ACCESS_BATCH = 256
+    ACCESS_INTERVAL = 60.0
+
+    def __init__(self, path: Path, ttl: float, max_bytes: int, compress_level: int = 6) -> None:
+        """
+        Args:
+            path (Path): the SQLite database file
+            ttl (float): seconds after which an entry expires, 0 to never expire
+            max_bytes (int): maximum size of the stored values before evicting the least recently used ones
+            compress_level (int): zlib compression level
+        """
+        self.path = Path(path)
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.compress_level = compress_level
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        # Access times of the entries read since the last write, by key
+        self._accesses = {}
+        self._accesses_written_at = time.time()
+        with self.__connection() as connection:
+            connection.execute("""
+                CREATE TABLE IF NOT EXISTS entries (
+                    key TEXT PRIMARY KEY,
+                    value BLOB NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )
+            """)
+            connection.execute("CREATE INDEX IF NOT EXISTS entries_accessed_at ON entries (accessed_at)")
+            # For the purge of the expired entries
+            connection.execute("CREATE INDEX IF NOT EXISTS entries_created_at ON entries (created_at)")
+
+
+    def __connection(self) -> sqlite3.Connection:
+        # sqlite3 connections can't be shared between threads, keep one per thread
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+
+    def __count(self, key: str, value: int = 1) -> None:
+        with self._lock:
+            self.stats[key] += value
+
+
+    def get(self, key: str) -> Optional[bytes]:
+        """
+        Returns the value stored under key, None if missing or expired
+        """
+        connection = self.__connection()
+        row = connection.execute("SELECT value, created_at FROM entries WHERE key = ?", (key,)).fetchone()
+        now = time.time()
+        if row is None or (self.ttl and now - row[1] > self.ttl):
+            if row is not None:
+                connection.execute("DELETE FROM entries WHERE key = ?", (key,))
+            self.__count("misses")
+            return None
+
+        with self._lock:
+            self._accesses[key] = now
+            due = len(self._accesses) >= self.ACCESS_BATCH or now - self._accesses_written_at >= self.ACCESS_INTERVAL
+        if due:
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                self.__write_accesses(connection)
+                connection.execute("COMMIT")
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+        self.__count("hits")
+        return zlib.decompress(row[0])
+
+
+    def set(self, key: str, value: bytes) -> None:
+        """
+        Store value under key, then evict the least recently used entries if the store is too big
+        """
+        self.update(key, lambda current: value)
+
+
+    def update(self, key: str, function: Callable[[Optional[bytes]], Optional[bytes]]) -> Optional[bytes]:
+        """
+        Replace the value of key by function(current value, None if missing or expired) in one write transaction,
+        so concurrent updates (i.e. from several worker processes) don't lose each other's changes
+
+        Returns:
+            the value written, None when function returned None and nothing was written
+        """
+        connection = self.__connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            now = time.time()
+            row = connection.execute("SELECT value, created_at FROM entries WHERE key = ?", (key,)).fetchone()
+            current = zlib.decompress(row[0]) if row is not None and not (self.ttl and now - row[1] > self.ttl) else None
+            value = function(current)
+            if value is not None:
+                compressed = zlib.compress(value, self.compress_level)
+                connection.execute(
+                    "INSERT OR REPLACE INTO entries (key, value, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                    (key, compressed, len(compressed), now, now),
+                )
+                if self.ttl:
+                    connection.execute("DELETE FROM entries WHERE created_at < ?", (now - self.ttl,))
+                self.__write_accesses(connection)
+                self.__evict(connection)
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        return value
+
+
+    def get_text(self, key: str) -> Optional[str]:
+        value = self.get(key)
+        return value.decode("utf-8") if value is not None else None
+
+
+    def set_text(self, key: str, value: str) -> None:
+        self.set(key, value.encode("utf-8"))
+
+
+    def delete(self, key: str) -> None:
+        self.__connection().execute("DELETE FROM entries WHERE key = ?", (key,))
+
+
+    def __write_accesses(self, connection: sqlite3.Connection) -> None:
+        # In the transaction of the caller
+        with self._lock:
+            accesses, self._accesses = self._accesses, {}
+            self._accesses_written_at = time.time()
+        connection.executemany(
+            "UPDATE entries SET accessed_at = MAX(accessed_at, ?) WHERE key = ?",
+            [(accessed_at, key) for key, accessed_at in accesses.items()],
+        )
+
+
+    def __evict(self, connection: sqlite3.Connection) -> None:
+        total = connection.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        evicted = []
+        for key, size in connection.execute("SELECT key, size FROM entries ORDER BY accessed_at").fetchall():
+            if total <= self.max_bytes:
+                break
+            evicted.append((key,))
+            total -= size
+        connection.executemany("DELETE FROM entries WHERE key = ?", evicted)
+        self.__count("evictions", len(evicted))
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_store(name: str, ttl: float, max_bytes: int) -> SqliteStore:
+    """
+    Returns the process wide store with the given name, persisted in the pipelines cache folder.
+
+    Args:
+        name (str): the name of the store, used for its folder and database file
+        ttl (float): seconds after which an entry expires, 0 to never expire
+        max_bytes (int): maximum size of the stored values
+    """
+    with _stores_lock:
+        if name not in _stores:
+            _stores[name] = SqliteStore(get_cache_dir(name) / f"{name}.sqlite3", ttl=ttl, max_bytes=max_bytes)
+        return _stores[name]
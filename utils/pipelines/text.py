@@ -0,0 +1,80 @@
+"""
+Token budgeting helpers to split long texts (i.e. video transcripts) in chunks
+that fit the context window of the model.
+
+Token counts are estimated from the number of characters (about 4 per token
+for English with the usual BPE tokenizers), which is enough to size chunks
+with some margin and doesn't need the model tokenizer.
+"""
+import re
+from typing import List
+
+CHARS_PER_TOKEN = 4
+
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Rough number of tokens of the text
+    """
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def split_text(text: str, max_tokens: int, overlap_tokens: int = 0) -> List[str]:
+    """
+    Split the text in chunks of at most max_tokens, cutting on line (caption) or
+    sentence boundaries when possible. Each chunk starts with the last
+    overlap_tokens of the previous one so nothing said across a cut is lost.
+
+    Args:
+        text (str): the text to split
+        max_tokens (int): token budget of a chunk
+        overlap_tokens (int): tokens repeated at the beginning of the next chunk
+
+    Returns:
+        List[str]: the chunks, a single one if the whole text fits
+    """
+    if estimate_tokens(text) <= max_tokens:
+        return [text] if text else []
+
+    overlap_tokens = min(overlap_tokens, max_tokens // 2)
+    units = _split_units(text, max_tokens)
+
+    chunks = []
+    current: List[str] = []
+    size = 0
+    for unit in units:
+        tokens = estimate_tokens(unit) + 1
+        if current and size + tokens > max_tokens:
+            chunks.append(" ".join(current))
+            # Carry the tail of the chunk over, within the overlap budget
+            carried: List[str] = []
+            size = 0
+            for previous in reversed(current):
+                previous_tokens = estimate_tokens(previous) + 1
+                if size + previous_tokens > overlap_tokens:
+                    break
+                carried.insert(0, previous)
+                size += previous_tokens
+            current = carried
+        current.append(unit)
+        size += tokens
+    if current:
+        chunks.append(" ".join(current))
+    return chunks
+
+
+def _split_units(text: str, max_tokens: int) -> List[str]:
+    # Captions (one per line) or sentences, and words for the ones that don't fit a chunk anyway
+    lines = [line.strip() for line in text.splitlines() if line.strip()]
+    if len(lines) <= 1:
+        lines = [sentence for sentence in SENTENCE_END.split(text.strip()) if sentence]
+
+    units = []
+    for line in lines:
+        if estimate_tokens(line) < max_tokens:
+            units.append(line)
+        else:
+            units.extend(line.split())
+    return units
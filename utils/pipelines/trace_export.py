@@ -0,0 +1,175 @@
+"""
+What the Langfuse filter traces, and for how long it keeps its generations.
+
+sampled() and apply_payload_policy() keep the volume down: only a share of
+the chats is traced, and the messages of a traced chat can be truncated,
+hashed or limited to the last ones before the Langfuse SDK serializes them
+(the SDK already sends them in batches from a background thread).
+
+TTLTable bounds the generations waiting for their outlet, so the chats whose
+outlet never comes (aborted, failed) don't accumulate.
+"""
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+
+PAYLOAD_POLICIES = ("full", "truncate", "hash", "last_n")
+
+
+def parse_rates(rates: str) -> Dict[str, float]:
+    """
+    Parse sampling rates written as "key=rate, key=rate" (i.e. "llama3:8b=0.5, mistral=1")
+    """
+    parsed = {}
+    for item in (rates or "").split(","):
+        key, separator, rate = item.rpartition("=")
+        if not separator or not key.strip():
+            continue
+        try:
+            parsed[key.strip()] = min(1.0, max(0.0, float(rate)))
+        except ValueError:
+            print(f"Invalid sampling rate ignored: {item.strip()}")
+    return parsed
+
+
+def sampled(key: str, rate: float) -> bool:
+    """
+    Head sampling decision, stable for a key: every turn of a chat is traced or none is.
+    """
+    if rate >= 1:
+        return True
+    if rate <= 0:
+        return False
+    digest = hashlib.blake2b(str(key).encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big") < rate * 2 ** 64
+
+
+def digest(text: str) -> str:
+    return "sha256:" + hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def apply_payload_policy(content: Any, policy: str, max_chars: int = 2000) -> Any:
+    """
+    Reduce the content of a message for the trace
+
+    Args:
+        content (str | list): the message content, a string or a list of parts (text, images)
+        policy (str): full, truncate (to max_chars), hash (digest and length); last_n keeps the content as is
+        max_chars (int): maximum characters kept by truncate
+    """
+    if policy in ("full", "last_n") or content is None:
+        return content
+    if isinstance(content, list):
+        parts = []
+        for part in content:
+            if isinstance(part, dict) and part.get("type") == "text":
+                parts.append({**part, "text": apply_payload_policy(part.get("text", ""), policy, max_chars)})
+            elif isinstance(part, dict):
+                # Images and other attachments are large base64 strings: only their type is kept
+                parts.append({"type": part.get("type")})
+        return parts
+    content = str(content)
+    if policy == "hash":
+        return {"hash": digest(content), "chars": len(content)}
+    if len(content) > max_chars:
+        return content[:max_chars] + f"... [{len(content) - max_chars} chars truncated]"
+    return content
+
+
+def apply_messages_policy(messages: List[dict], policy: str, max_chars: int = 2000, last_n: int = 4) -> List[dict]:
+    """
+    The messages of a request reduced for the trace, see apply_payload_policy
+    """
+    if policy == "full":
+        return messages
+    if policy == "last_n":
+        return messages[-last_n:] if last_n > 0 else []
+    return [{**message, "content": apply_payload_policy(message.get("content"), policy, max_chars)} for message in messages]
+
+
+class TTLTable:
+    """
+    Bounded mapping of the in-flight entries (i.e. the generations waiting for their outlet).
+    Entries expire after ttl seconds and the oldest ones are evicted beyond max_entries,
+    so entries that are never popped (aborted chats, errors) don't accumulate.
+    """
+    def __init__(self, max_entries: int, ttl: float, on_evict: Optional[Callable[[str, Any], None]] = None) -> None:
+        """
+        Args:
+            max_entries (int): maximum number of entries
+            ttl (float): seconds after which an entry expires, 0 to never expire
+            on_evict (Callable): called with the key and the value of the expired or evicted entries
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.on_evict = on_evict
+        self.stats = {"expired": 0, "evicted": 0}
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+    def __contains__(self, key: str) -> bool:
+        return self.get(key) is not None
+
+
+    def put(self, key: str, value: Any) -> None:
+        now = time.monotonic()
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (now, value)
+            removed = self.__purge(now)
+        self.__evicted(removed)
+
+
+    def get(self, key: str) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None or self.__expired(entry[0], time.monotonic()):
+            return None
+        return entry[1]
+
+
+    def pop(self, key: str) -> Any:
+        with self._lock:
+            entry = self._entries.pop(key, None)
+        if entry is None or self.__expired(entry[0], time.monotonic()):
+            return None
+        return entry[1]
+
+
+    def purge(self) -> None:
+        with self._lock:
+            removed = self.__purge(time.monotonic())
+        self.__evicted(removed)
+
+
+    def __expired(self, created: float, now: float) -> bool:
+        return bool(self.ttl) and now - created > self.ttl
+
+
+    def __purge(self, now: float) -> list:
+        # Insertion order is creation order, the expired entries are at the front
+        removed = []
+        while self._entries:
+            key, (created, value) = next(iter(self._entries.items()))
+            if self.__expired(created, now):
+                self.stats["expired"] += 1
+            elif len(self._entries) > self.max_entries:
+                self.stats["evicted"] += 1
+            else:
+                break
+            del self._entries[key]
+            removed.append((key, value))
+        return removed
+
+
+    def __evicted(self, removed: list) -> None:
+        if self.on_evict:
+            for key, value in removed:
+                self.on_evict(key, value)
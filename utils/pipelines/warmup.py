@@ -0,0 +1,103 @@
+"""
+Warm-up of the pipelines at startup, so the first request doesn't pay for the cold caches.
+
+The steps (i.e. prefetching the Fabric patterns and loading the Ollama model)
+run concurrently in a background task started by on_startup/on_valves_updated,
+so the pipelines server keeps starting meanwhile; `ready` tells when they are
+done and the outcome of every step is printed. A failed step is reported and
+doesn't prevent the pipeline from serving: the request then does the work itself.
+"""
+import time
+import asyncio
+from typing import Awaitable, Callable, Dict, Optional
+
+
+async def keep_alive(llm, blocking: bool = False) -> str:
+    """
+    Make Ollama load the model with a one token generation, with the context size
+    and keep_alive of the real requests so the model isn't reloaded for them.
+
+    Args:
+        llm (Ollama): the llama-index model
+        blocking (bool): go through the blocking client (and its connection pool), for the pipelines using it
+
+    Returns:
+        str: the model name
+    """
+    options = {
+        "temperature": llm.temperature,
+        "num_ctx": llm.context_window,
+        **(llm.additional_kwargs or {}),
+        "num_predict": 1,
+    }
+    request = {
+        "model": llm.model,
+        "messages": [{"role": "user", "content": "Hi"}],
+        "options": options,
+        "keep_alive": llm.keep_alive,
+    }
+    if blocking:
+        await asyncio.to_thread(llm.client.chat, **request)
+    else:
+        await llm.async_client.chat(**request)
+    return llm.model
+
+
+class WarmUp:
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.ready = False
+        self.results: Dict[str, str] = {}
+        self.task: Optional[asyncio.Task] = None
+
+
+    def start(self, steps: Dict[str, Callable[[], Awaitable]]) -> asyncio.Task:
+        """
+        Run the steps concurrently in a background task, replacing a warm-up still running
+
+        Args:
+            steps (dict): name of the step -> coroutine function, its result (a short description) is reported
+        """
+        self.cancel()
+        self.ready = False
+        self.results = {}
+        self.task = asyncio.get_running_loop().create_task(self.__run(steps))
+        return self.task
+
+
+    def cancel(self) -> None:
+        if self.task is not None and not self.task.done():
+            self.task.cancel()
+        self.task = None
+
+
+    async def wait(self, timeout: Optional[float] = None) -> bool:
+        """
+        Wait for the warm-up to finish
+
+        Returns:
+            bool: True when it completed within the timeout
+        """
+        if self.task is None:
+            return self.ready
+        try:
+            await asyncio.wait_for(asyncio.shield(self.task), timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            pass
+        return self.ready
+
+
+    async def __run(self, steps: Dict[str, Callable[[], Awaitable]]) -> None:
+        started = time.perf_counter()
+        outcomes = await asyncio.gather(*(self.__step(step) for step in steps.values()), return_exceptions=True)
+        for name, outcome in zip(steps, outcomes):
+            self.results[name] = f"failed: {outcome}" if isinstance(outcome, Exception) else str(outcome)
+        self.ready = True
+        report = ", ".join(f"{name} {outcome}" for name, outcome in self.results.items())
+        print(f"Warm-up of {self.name} done in {time.perf_counter() - started:.1f}s: {report}")
+
+
+    async def __step(self, step: Callable[[], Awaitable]):
+        started = time.perf_counter()
+        result = await step()
+        return f"{result} in {time.perf_counter() - started:.1f}s"